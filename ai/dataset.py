@@ -0,0 +1,358 @@
+"""
+Decodes the images of the data set once, and caches them for the next trainings.
+
+Every user directory becomes a shard in the cache directory: a uint8 .npy of its
+images, resized to img_size, the .npy of their labels, and an index.json naming the
+source file and class of every image. A shard is named after a hash of its directory,
+of the name, size and modification time of every image in it, and of img_size, so
+it is rebuilt when any of these change, and reused otherwise.
+
+Images are decoded in a pool of processes, and shards are loaded memory-mapped.
+Loading several directories, like the training users, memory-maps all their shards,
+read together as a single array by ShardedImages, never copied. They stay uint8, 1 byte per pixel, and are only scaled to [0, 1] floats a batch
+at a time, see normalize.
+
+    python dataset.py [--rebuild]
+
+builds the shards of every user of the data set, see INSTALLATION.md
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+CACHE_DIR = "cache"
+IMAGE_EXTENSIONS = (".png", ".jpg")
+# Images a worker decodes before sending them back
+DECODE_CHUNK_SIZE = 64
+
+
+def list_images(directory, classes):
+    """The (path, label) of every image of a directory, with one sub-directory per class"""
+    images = []
+    for shape_type in sorted(os.listdir(directory)):
+        if shape_type not in classes:
+            continue
+        for img in sorted(os.listdir(os.path.join(directory, shape_type))):
+            if img.endswith(IMAGE_EXTENSIONS):
+                images.append(
+                    (os.path.join(directory, shape_type, img), classes[shape_type])
+                )
+    return images
+
+
+def shard_key(directory, images, img_size):
+    """Changes with the directory, img_size, and the name, size and date of any image"""
+    digest = hashlib.sha256(f"{os.path.abspath(directory)}\n{img_size}\n".encode())
+    for path, label in images:
+        stat = os.stat(path)
+        digest.update(f"{path}\n{label}\n{stat.st_size}\n{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def decode_image(path, img_size):
+    """Loads the image, grayscale it, and resize it"""
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not decode image: {path}")
+    return cv2.resize(image, (img_size, img_size))
+
+
+def _decode(task):
+    return decode_image(*task)
+
+
+def _init_worker():
+    # The pool already uses every core
+    cv2.setNumThreads(1)
+
+
+def load_shard(shard_dir):
+    """The memory-mapped uint8 images of a shard, and their labels"""
+    images = np.load(os.path.join(shard_dir, "images.npy"), mmap_mode="r")
+    labels = np.load(os.path.join(shard_dir, "labels.npy"))
+    return images, labels
+
+
+def write_shard(shard_dir, directory, images, img_size, classes, pool):
+    """Decodes the images of a directory into a new shard"""
+    # Written next to the shard, then renamed, an interrupted build leaves no shard
+    partial_dir = shard_dir + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+
+    shard = np.lib.format.open_memmap(
+        os.path.join(partial_dir, "images.npy"),
+        mode="w+",
+        dtype=np.uint8,
+        shape=(len(images), img_size, img_size),
+    )
+    tasks = [(path, img_size) for path, _ in images]
+    for index, image in enumerate(
+        pool.imap(_decode, tasks, chunksize=DECODE_CHUNK_SIZE)
+    ):
+        shard[index] = image
+    shard.flush()
+    del shard
+
+    labels = np.array([label for _, label in images], dtype=np.uint8)
+    np.save(os.path.join(partial_dir, "labels.npy"), labels)
+    index = {
+        "directory": directory,
+        "img_size": img_size,
+        "classes": classes,
+        "files": [os.path.relpath(path, directory) for path, _ in images],
+    }
+    with open(os.path.join(partial_dir, "index.json"), "w") as file:
+        json.dump(index, file)
+
+    os.replace(partial_dir, shard_dir)
+
+
+def load_directories(
+    directories, img_size, classes, cache_dir=CACHE_DIR, workers=None, rebuild=False
+):
+    """
+    The uint8 images of shape (N, img_size, img_size) of every directory, and their
+    labels. Directories without an up to date shard are decoded in a pool of processes
+    """
+    shards = []
+    missing = []
+    for directory in directories:
+        images = list_images(directory, classes)
+        shard_dir = os.path.join(cache_dir, shard_key(directory, images, img_size))
+        shards.append(shard_dir)
+        if rebuild or not os.path.exists(os.path.join(shard_dir, "index.json")):
+            missing.append((shard_dir, directory, images))
+
+    if missing:
+        os.makedirs(cache_dir, exist_ok=True)
+        with Pool(workers, initializer=_init_worker) as pool:
+            for shard_dir, directory, images in missing:
+                print(f"Decoding {len(images)} images of {directory}")
+                shutil.rmtree(shard_dir, ignore_errors=True)
+                write_shard(shard_dir, directory, images, img_size, classes, pool)
+
+    if not shards:
+        return np.empty((0, img_size, img_size), np.uint8), np.empty(0, np.uint8)
+    return join_shards([load_shard(shard_dir) for shard_dir in shards])
+
+
+class ShardedImages:
+    """
+    The memory-mapped images of several shards, read as one array, one after the other.
+    Indexing it reads the images asked for from their shards, into a new array, the
+    rest is never loaded. Anything else, like np.asarray, loads them all
+    """
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self._ends = np.cumsum([len(part) for part in self.parts])
+        self._starts = self._ends - [len(part) for part in self.parts]
+
+    @property
+    def shape(self):
+        return (int(self._ends[-1]), *self.parts[0].shape[1:])
+
+    @property
+    def dtype(self):
+        return self.parts[0].dtype
+
+    @property
+    def ndim(self):
+        return self.parts[0].ndim
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            index = index + len(self) if index < 0 else index
+            part = int(np.searchsorted(self._ends, index, side="right"))
+            return self.parts[part][index - self._starts[part]]
+
+        if isinstance(index, slice):
+            index = np.arange(len(self))[index]
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        index = np.where(index < 0, index + len(self), index)
+        parts = np.searchsorted(self._ends, index, side="right")
+        images = np.empty((len(index), *self.shape[1:]), self.dtype)
+        for part in np.unique(parts):
+            selected = parts == part
+            images[selected] = self.parts[part][index[selected] - self._starts[part]]
+        return images
+
+    def reshape(self, *shape):
+        """Reshapes every image, the first axis stays the images"""
+        if len(shape) == 1 and isinstance(shape[0], tuple):
+            shape = shape[0]
+        if shape[0] not in (-1, len(self)):
+            raise ValueError(f"Cannot reshape {len(self)} images to {shape}")
+        return ShardedImages(part.reshape(-1, *shape[1:]) for part in self.parts)
+
+    def __array__(self, dtype=None, copy=None):
+        images = np.concatenate(self.parts)
+        return images if dtype is None else images.astype(dtype, copy=False)
+
+
+def join_shards(shards):
+    """
+    The images and labels of several loaded shards, one after the other: the images
+    as a ShardedImages, unless there is a single shard, and the labels concatenated
+    """
+    shards = list(shards)
+    # Empty shards may not even have the shape of the others
+    filled = [(images, labels) for images, labels in shards if len(labels)]
+    if len(filled) <= 1:
+        return (filled or shards)[0]
+    shards = filled
+    parts = []
+    for images, _ in shards:
+        parts.extend(images.parts if isinstance(images, ShardedImages) else [images])
+    return ShardedImages(parts), np.concatenate([labels for _, labels in shards])
+
+
+def load_captures(
+    capture_dir, img_size, classes, min_confidence=0.0, cache_dir=CACHE_DIR
+):
+    """
+    The memory-mapped uint8 images and labels of the strokes captured by the server,
+    see CaptureWriter in the backend, keeping the ones predicted with at least
+    min_confidence. The labels are the predictions of the model, not checked by anyone.
+
+    They are copied once into a shard of the cache, rebuilt when new strokes are
+    captured, which replaces the earlier one
+    """
+    index_path = os.path.join(capture_dir, "index.jsonl")
+    if os.path.exists(index_path):
+        with open(index_path) as file:
+            shards = [json.loads(line) for line in file if line.strip()]
+    else:
+        shards = []
+    shards = [shard for shard in shards if shard["img_size"] == img_size]
+
+    prefix, key = capture_key(capture_dir, shards, img_size, classes, min_confidence)
+    shard_dir = os.path.join(cache_dir, prefix + key)
+    if not os.path.exists(os.path.join(shard_dir, "index.json")):
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix):
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        write_capture_shard(shard_dir, capture_dir, shards, classes, min_confidence)
+
+    images, labels = load_shard(shard_dir)
+    if not len(labels):
+        return np.empty((0, img_size, img_size), np.uint8), labels
+    return images, labels
+
+
+def capture_key(capture_dir, shards, img_size, classes, min_confidence):
+    """
+    The prefix of the cached shards of a capture directory, and the key of its current
+    one, which changes with its shards, img_size, classes and min_confidence
+    """
+    prefix = hashlib.sha256(os.path.abspath(capture_dir).encode()).hexdigest()[:8]
+    digest = hashlib.sha256(
+        json.dumps(
+            [[shard["name"] for shard in shards], img_size, classes, min_confidence],
+            sort_keys=True,
+        ).encode()
+    )
+    return f"captures-{prefix}-", digest.hexdigest()[:16]
+
+
+def write_capture_shard(shard_dir, capture_dir, shards, classes, min_confidence):
+    """Copies the confident strokes of the capture shards into a new shard, in order"""
+    partial_dir = shard_dir + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+
+    selected = []
+    for shard in shards:
+        path = os.path.join(capture_dir, shard["name"])
+        confidences = np.load(os.path.join(path, "confidences.npy"))
+        selected.append((shard, path, confidences >= min_confidence))
+    count = sum(int(confident.sum()) for _, _, confident in selected)
+    img_size = shards[0]["img_size"] if shards else 0
+
+    labels = []
+    if count:
+        images = np.lib.format.open_memmap(
+            os.path.join(partial_dir, "images.npy"),
+            mode="w+",
+            dtype=np.uint8,
+            shape=(count, img_size, img_size),
+        )
+        start = 0
+        for shard, path, confident in selected:
+            shard_images, shard_labels = load_shard(path)
+            # The server and the training may not number the classes the same way
+            names = {label: name for name, label in shard["classes"].items()}
+            labels.extend(classes[names[label]] for label in shard_labels[confident])
+            images[start : start + confident.sum()] = shard_images[confident]
+            start += confident.sum()
+        images.flush()
+        del images
+    else:
+        np.save(
+            os.path.join(partial_dir, "images.npy"),
+            np.empty((0, img_size, img_size), np.uint8),
+        )
+
+    np.save(os.path.join(partial_dir, "labels.npy"), np.array(labels, np.uint8))
+    index = {
+        "captures": capture_dir,
+        "shards": [shard["name"] for shard in shards],
+        "min_confidence": min_confidence,
+    }
+    with open(os.path.join(partial_dir, "index.json"), "w") as file:
+        json.dump(index, file)
+    os.replace(partial_dir, shard_dir)
+
+
+def normalize(images):
+    """Scales a batch of uint8 images to float32 in [0, 1]"""
+    return np.asarray(images, dtype=np.float32) / np.float32(255.0)
+
+
+def main():
+    from final import main_dir, img_size, shape_classes
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Decode every image again"
+    )
+    args = parser.parse_args()
+
+    directories = [
+        os.path.join(main_dir, directory, "images")
+        for directory in sorted(os.listdir(main_dir))
+    ]
+    start = time.perf_counter()
+    images, _ = load_directories(
+        directories,
+        img_size,
+        shape_classes,
+        args.cache_dir,
+        args.workers,
+        args.rebuild,
+    )
+    print(
+        f"Loaded {len(images)} images of {len(directories)} users "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Distills the trained model into smaller student models, cheaper to serve on CPU.
+
+Every student is trained on the training users to match the class probabilities of
+the teacher, save/final.keras, softened by a temperature, and the true labels.
+Students take the same 70x70 images as the teacher, and may downscale them first
+with a Resizing layer, so the server loads them like the teacher, only with ReLU and
+built-in layers: ModelLoader("../ai/save/student_small.keras"), and export.py
+converts them for the other inference backends.
+
+    python distill.py [--students tiny small] [--epochs 10] [--temperature 4]
+
+then prints the accuracy on the test users, parameters, FLOPs and CPU latency of the
+teacher and of every student. The data set must be unpacked, see INSTALLATION.md
+"""
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import (
+    Activation,
+    BatchNormalization,
+    Conv2D,
+    Dense,
+    DepthwiseConv2D,
+    Dropout,
+    GlobalAveragePooling2D,
+    Input,
+    MaxPooling2D,
+    Resizing,
+    SeparableConv2D,
+)
+from tensorflow.keras.models import Model
+
+from pipeline import BATCH_SIZE, evaluation_dataset, training_dataset
+
+# Name -> input resolution, filters of every convolution block, separable convolutions
+STUDENTS = {
+    "tiny": (32, (8, 16, 32), False),
+    "small": (48, (16, 32, 64), False),
+    "separable": (48, (16, 32, 64, 96), True),
+    "full_size": (70, (16, 32, 64), False),
+}
+TEMPERATURE = 4.0
+# Weight of the true labels in the loss, the teacher's probabilities get the rest
+ALPHA = 0.1
+LATENCY_RUNS = 200
+
+
+def build_student(num_classes, input_size, filters, separable=False, img_size=70):
+    """
+    A small CNN: blocks of a convolution, batch normalization, ReLU and max pooling,
+    then global average pooling instead of a large dense layer. The images are first
+    downscaled to input_size. The softmax follows the "logits" layer, see Distiller
+    """
+    input_img = Input(shape=(img_size, img_size, 1))
+    x = input_img
+    if input_size != img_size:
+        x = Resizing(input_size, input_size, interpolation="bilinear")(x)
+
+    for index, f in enumerate(filters):
+        # The first block sees a single channel, a separable convolution gains nothing
+        if separable and index > 0:
+            x = SeparableConv2D(f, (3, 3), padding="same", use_bias=False)(x)
+        else:
+            x = Conv2D(f, (3, 3), padding="same", use_bias=False)(x)
+        x = BatchNormalization()(x)
+        x = Activation("relu")(x)
+        x = MaxPooling2D(pool_size=(2, 2))(x)
+
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.2)(x)
+    logits = Dense(num_classes, name="logits", dtype="float32")(x)
+    output = Activation("softmax", dtype="float32")(logits)
+    return Model(inputs=input_img, outputs=output)
+
+
+class Distiller(Model):
+    """
+    Trains the student on a mix of the cross-entropy with the true labels, and of the
+    KL divergence between the teacher's and the student's probabilities, both softened
+    by the temperature. Predicts with the student
+    """
+
+    def __init__(self, student, teacher, temperature=TEMPERATURE, alpha=ALPHA):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.student_logits = Model(student.input, student.get_layer("logits").output)
+        self.temperature = temperature
+        self.alpha = alpha
+        self.kl_divergence = tf.keras.losses.KLDivergence()
+        self.cross_entropy = tf.keras.losses.CategoricalCrossentropy(from_logits=True)
+
+    def call(self, images, training=False):
+        return self.student(images, training=training)
+
+    def compute_loss(self, x=None, y=None, y_pred=None, sample_weight=None, **kwargs):
+        # The teacher ends with its softmax, its log probabilities are logits as well
+        teacher_logits = tf.math.log(self.teacher(x, training=False) + 1e-7)
+        student_logits = self.student_logits(x, training=True)
+
+        soft_targets = tf.nn.softmax(teacher_logits / self.temperature)
+        soft_predictions = tf.nn.softmax(student_logits / self.temperature)
+        distillation = self.kl_divergence(soft_targets, soft_predictions)
+        # Keeps the gradients of the soft targets on the scale of the hard ones
+        distillation *= self.temperature**2
+        return (
+            self.alpha * self.cross_entropy(y, student_logits)
+            + (1 - self.alpha) * distillation
+        )
+
+
+def distill(
+    student,
+    teacher,
+    train_images,
+    train_labels,
+    validation_images,
+    validation_labels,
+    num_classes,
+    epochs=10,
+    temperature=TEMPERATURE,
+    alpha=ALPHA,
+):
+    """Trains the student on the augmented batches of pipeline.py, returns it"""
+    distiller = Distiller(student, teacher, temperature, alpha)
+    distiller.compile(optimizer=tf.keras.optimizers.Adam(2e-3), metrics=["accuracy"])
+    distiller.fit(
+        training_dataset(train_images, train_labels, num_classes),
+        epochs=epochs,
+        validation_data=evaluation_dataset(
+            validation_images, validation_labels, num_classes
+        ),
+        callbacks=[
+            tf.keras.callbacks.ReduceLROnPlateau(
+                monitor="val_loss", factor=0.2, patience=3, min_lr=1e-4
+            )
+        ],
+    )
+    return student
+
+
+def count_flops(model):
+    """
+    Floating point operations of a forward pass on one image, the multiply-adds of the
+    convolutions and dense layers counted twice. The other layers are negligible
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, (Conv2D, DepthwiseConv2D, SeparableConv2D, Dense)):
+            channels = layer.input.shape[-1]
+            outputs = math.prod(layer.output.shape[1:-1])
+        if isinstance(layer, SeparableConv2D):
+            kernel = math.prod(layer.kernel_size)
+            flops += 2 * outputs * channels * (kernel + layer.filters)
+        elif isinstance(layer, DepthwiseConv2D):
+            flops += 2 * outputs * channels * math.prod(layer.kernel_size)
+        elif isinstance(layer, Conv2D):
+            flops += (
+                2 * outputs * channels * math.prod(layer.kernel_size) * layer.filters
+            )
+        elif isinstance(layer, Dense):
+            flops += 2 * outputs * channels * layer.units
+    return flops
+
+
+def measure_latency(model, batch_size, runs=LATENCY_RUNS):
+    """
+    Median milliseconds to classify a batch, with the compiled function the keras
+    backend of the server runs
+    """
+    infer = tf.function(
+        lambda images: model(images, training=False),
+        input_signature=[tf.TensorSpec((None, *model.input_shape[1:]), tf.float32)],
+    )
+    images = tf.constant(
+        np.random.default_rng(0).random((batch_size, *model.input_shape[1:])),
+        tf.float32,
+    )
+    for _ in range(10):
+        infer(images).numpy()
+
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        infer(images).numpy()
+        durations.append(time.perf_counter() - start)
+    return 1000 * float(np.median(durations))
+
+
+def accuracy(model, images, labels, batch_size=BATCH_SIZE):
+    predictions = model.predict(
+        evaluation_dataset(images, labels, model.output_shape[-1], batch_size),
+        verbose=0,
+    )
+    return float(np.mean(predictions.argmax(axis=1) == labels))
+
+
+def report(models, test_images, test_labels, batch_size=BATCH_SIZE):
+    """Prints the accuracy, size, FLOPs and latency of every model, by name"""
+    print(
+        f"\n{'model':<12}{'accuracy':>10}{'params':>10}{'MFLOPs':>10}"
+        f"{'1 image':>12}{f'{batch_size} images':>14}{'per image':>12}"
+    )
+    for name, model in models.items():
+        single = measure_latency(model, 1)
+        batched = measure_latency(model, batch_size)
+        print(
+            f"{name:<12}{accuracy(model, test_images, test_labels):>10.4f}"
+            f"{model.count_params():>10,}{count_flops(model) / 1e6:>10.2f}"
+            f"{single:>10.2f}ms{batched:>12.2f}ms{batched / batch_size:>10.3f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--teacher", default="save/final.keras")
+    parser.add_argument(
+        "--students", nargs="+", choices=list(STUDENTS), default=list(STUDENTS)
+    )
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--output-dir", default="save")
+    parser.add_argument(
+        "--report-only",
+        action="store_true",
+        help="Only compare the students already saved in the output directory",
+    )
+    args = parser.parse_args()
+
+    import final
+
+    teacher = tf.keras.models.load_model(args.teacher)
+    final.walk_training_data()
+    final.prepare_validation_data()
+    final.prepare_test_data()
+
+    models = {"teacher": teacher}
+    for name in args.students:
+        path = os.path.join(args.output_dir, f"student_{name}.keras")
+        if args.report_only:
+            models[name] = tf.keras.models.load_model(path)
+            continue
+
+        input_size, filters, separable = STUDENTS[name]
+        print(f"Distilling {name}, {input_size}x{input_size} images...")
+        student = build_student(
+            final.num_classes, input_size, filters, separable, final.img_size
+        )
+        models[name] = distill(
+            student,
+            teacher,
+            final.train_images,
+            final.train_labels,
+            final.validation_images,
+            final.validation_labels,
+            final.num_classes,
+            args.epochs,
+            args.temperature,
+            args.alpha,
+        )
+        os.makedirs(args.output_dir, exist_ok=True)
+        models[name].save(path)
+        print(f"Student saved at: {path}")
+
+    report(models, final.test_images, final.test_labels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Exports the trained model for the lightweight inference backends of the server,
+which do not need TensorFlow to run it:
+
+- save/final.tflite, the same float model for TensorFlow Lite
+- save/final_int8.tflite, weights and activations quantized to int8,
+  calibrated on the images of the validation users
+- save/final.onnx, for ONNX Runtime
+
+Then checks that every exported model agrees with the Keras model on the test users.
+The backend picks one with INFERENCE_BACKEND, in backend/whiteboard_ai/util/consts.py
+
+    python export.py [--model save/final.keras] [--formats tflite int8 onnx]
+
+The data set must be unpacked, see INSTALLATION.md
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+FORMATS = ("tflite", "int8", "onnx")
+OUTPUT_NAMES = {
+    "tflite": "final.tflite",
+    "int8": "final_int8.tflite",
+    "onnx": "final.onnx",
+}
+CALIBRATION_IMAGES = 500
+
+
+def export_tflite(model, path, calibration_images=None):
+    """
+    Converts the model to TensorFlow Lite. With calibration images, the weights and
+    activations are quantized to int8, inputs and outputs stay float32
+    """
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        model.export(saved_model_dir, format="tf_saved_model")
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+
+        if calibration_images is not None:
+            rng = np.random.default_rng(0)
+            count = min(CALIBRATION_IMAGES, len(calibration_images))
+            samples = calibration_images[
+                rng.choice(len(calibration_images), count, replace=False)
+            ].astype(np.float32)
+
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: (
+                [sample[np.newaxis]] for sample in samples
+            )
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            converter.inference_input_type = tf.float32
+            converter.inference_output_type = tf.float32
+
+        tflite_model = converter.convert()
+
+    with open(path, "wb") as file:
+        file.write(tflite_model)
+    print(f"Model exported to TensorFlow Lite at: {path}")
+
+
+def export_onnx(model, path):
+    """Converts the model to ONNX, with a dynamic batch size"""
+    import tf2onnx
+
+    input_signature = [
+        tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="image")
+    ]
+    infer = tf.function(lambda images: model(images, training=False))
+    onnx_model, _ = tf2onnx.convert.from_function(
+        infer, input_signature=input_signature, opset=17
+    )
+
+    with open(path, "wb") as file:
+        file.write(onnx_model.SerializeToString())
+    print(f"Model exported to ONNX at: {path}")
+
+
+def export_all(model, calibration_images, output_dir="save", formats=FORMATS):
+    """Exports the model to every format, named after OUTPUT_NAMES"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, OUTPUT_NAMES[name]) for name in formats}
+    if "tflite" in formats:
+        export_tflite(model, paths["tflite"])
+    if "int8" in formats:
+        export_tflite(model, paths["int8"], calibration_images)
+    if "onnx" in formats:
+        export_onnx(model, paths["onnx"])
+    return paths
+
+
+def predict_tflite(path, images):
+    interpreter = tf.lite.Interpreter(model_path=path)
+    input_index = interpreter.get_input_details()[0]["index"]
+    interpreter.resize_tensor_input(input_index, images.shape)
+    interpreter.allocate_tensors()
+    interpreter.set_tensor(input_index, images)
+    interpreter.invoke()
+    return interpreter.get_tensor(interpreter.get_output_details()[0]["index"])
+
+
+def predict_onnx(path, images):
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    return session.run(None, {session.get_inputs()[0].name: images})[0]
+
+
+def check_parity(model, paths, images, labels):
+    """
+    Prints the accuracy of the Keras model and of every exported model, how often
+    an exported model predicts the same class, and how far its probabilities are
+    """
+    images = images.astype(np.float32)
+    reference = model.predict(images, verbose=0)
+    print(f"{'keras':<8} accuracy {np.mean(reference.argmax(1) == labels):.4f}")
+
+    for name, path in paths.items():
+        if name == "onnx":
+            predictions = predict_onnx(path, images)
+        else:
+            predictions = predict_tflite(path, images)
+
+        accuracy = np.mean(predictions.argmax(1) == labels)
+        agreement = np.mean(predictions.argmax(1) == reference.argmax(1))
+        difference = np.abs(predictions - reference).max()
+        print(
+            f"{name:<8} accuracy {accuracy:.4f}   same class as keras {agreement:.4f}"
+            f"   largest probability difference {difference:.4f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="save/final.keras")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--output-dir", default="save")
+    parser.add_argument(
+        "--calibration",
+        help="(N, 70, 70, 1) .npy of normalized images to calibrate the int8 model on, "
+        "instead of the validation users. The parity check is skipped",
+    )
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    if args.calibration:
+        export_all(model, np.load(args.calibration), args.output_dir, args.formats)
+        return
+
+    import final
+    from dataset import normalize
+
+    shape = (-1, final.img_size, final.img_size, 1)
+    final.prepare_validation_data()
+    validation_images = normalize(final.validation_images).reshape(shape)
+    paths = export_all(model, validation_images, args.output_dir, args.formats)
+
+    final.prepare_test_data()
+    test_images = normalize(final.test_images).reshape(shape)
+    check_parity(model, paths, test_images, final.test_labels)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
+import argparse
 import os
 from time import sleep
 
-import cv2
 import matplotlib.pyplot as plt
 import numpy as np
 import tensorflow as tf
@@ -18,9 +18,16 @@ from tensorflow.keras.layers import (
 )
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.utils import to_categorical
 
+from dataset import join_shards, load_captures, load_directories, normalize
+from pipeline import (
+    ThroughputCallback,
+    configure_cpu_training,
+    evaluation_dataset,
+    training_dataset,
+)
+
 main_dir = "data/"
 img_size = 70
 
@@ -48,77 +55,74 @@ validation_users = ["crt", "il1", "lts", "mrt", "nae"]
 test_users = ["u01", "u17", "u18", "u19"]
 
 
-def pre_process_image(image_path):
-    """Pre-process the image, load it, grayscale it, and resize it"""
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    image = cv2.resize(image, (img_size, img_size))
-    return image
-
-
-def process_directory(directory, images, labels):
-    """Process the directory and add images to the specified set"""
-    print(f"Processing directory: {directory}")
-    for shape_type in os.listdir(directory):
-        for img in os.listdir(directory + shape_type):
-            if not img.endswith(".png") and not img.endswith(".jpg"):
-                continue
-            full_path = os.path.join(directory, shape_type, img)
-            image = pre_process_image(full_path)
-            images.append(image)
-            labels.append(shape_classes[os.path.basename(shape_type)])
+def process_directories(directories):
+    """Load the images of the directories, decoded once then cached, see dataset.py"""
+    print(f"Processing directories: {', '.join(directories)}")
+    return load_directories(directories, img_size, shape_classes)
 
 
 def walk_training_data():
     """Walk on the data directory and process the images"""
     print("Walking on the data directory...")
     # input("Press enter to continue...")
-    for directory in os.listdir(main_dir):
-        if directory in validation_users or directory in test_users:
-            continue
-        process_directory(main_dir + directory + "/images/", train_images, train_labels)
+    global train_images, train_labels
+    # The user directories are named user.<id>, the held out users never train
+    held_out = {"user." + user for user in validation_users + test_users}
+    directories = [
+        main_dir + directory + "/images/"
+        for directory in os.listdir(main_dir)
+        if directory not in held_out
+    ]
+    train_images, train_labels = process_directories(directories)
+
+
+def add_captured_data(capture_dir, min_confidence):
+    """Add the strokes captured by the server to the training data"""
+    print(f"Adding the strokes captured in {capture_dir}...")
+    global train_images, train_labels
+    images, labels = load_captures(capture_dir, img_size, shape_classes, min_confidence)
+    print(f"{len(images)} captured strokes")
+    # Read from their shards with the training users, never copied
+    train_images, train_labels = join_shards(
+        [(train_images, train_labels), (images, labels)]
+    )
 
 
 def prepare_data_for_training():
     """Prepare the whole data for training"""
     print("Preparing data for training...")
     # input("Press enter to continue...")
-    global train_images, train_labels, validation_images, validation_labels, test_images, test_labels
-    train_images = np.array(train_images) / 255.0
-    train_labels = np.array(train_labels)
-
-    validation_images = np.array(validation_images) / 255.0
-    validation_labels = np.array(validation_labels)
-
-    test_images = np.array(test_images) / 255.0
-    test_labels = np.array(test_labels)
+    # The images stay uint8, they are only scaled to [0, 1] a batch at a time
+    global train_images, validation_images, test_images
+    train_images = train_images.reshape(-1, img_size, img_size, 1)
+    validation_images = validation_images.reshape(-1, img_size, img_size, 1)
+    test_images = test_images.reshape(-1, img_size, img_size, 1)
 
 
 def prepare_validation_data():
     """Prepare data for validation"""
     print("Preparing data for validation...")
     # input("Press enter to continue...")
-    for directory in validation_users:
-        process_directory(
-            main_dir + "user." + directory + "/images/",
-            validation_images,
-            validation_labels,
-        )
+    global validation_images, validation_labels
+    validation_images, validation_labels = process_directories(
+        [main_dir + "user." + directory + "/images/" for directory in validation_users]
+    )
 
 
 def prepare_test_data():
     """Prepare data for testing"""
     print("Preparing data for testing...")
     # input("Press enter to continue...")
-    for directory in test_users:
-        process_directory(
-            main_dir + "user." + directory + "/images/", test_images, test_labels
-        )
+    global test_images, test_labels
+    test_images, test_labels = process_directories(
+        [main_dir + "user." + directory + "/images/" for directory in test_users]
+    )
 
 
 def test_model(model):
     # Test the model and build confusion matrix
     print("Testing model...")
-    X_test = test_images.reshape(-1, img_size, img_size, 1)
+    X_test = normalize(test_images)
     Y_test = to_categorical(test_labels, num_classes=num_classes)
 
     test_loss, test_acc = model.evaluate(X_test, Y_test)
@@ -131,7 +135,7 @@ def visualize_tests(model):
     import seaborn as sns
     from sklearn.metrics import confusion_matrix  # type: ignore
 
-    X_test = test_images.reshape(-1, img_size, img_size, 1)
+    X_test = normalize(test_images)
     Y_test = to_categorical(test_labels, num_classes=num_classes)
 
     Y_pred = model.predict(X_test)
@@ -167,7 +171,7 @@ def mish(x):
     return x * tf.math.tanh(tf.math.softplus(x))
 
 
-def build_model():
+def build_model(jit_compile="auto"):
     # Define the input layer with the shape of the images
     # This is the first layer of the network, where we specify the dimensions of the input images (height, width, channels).
     # img_size should match the dimensions of the images in your dataset, and '1' indicates grayscale images. For RGB images, this would be 3.
@@ -229,7 +233,8 @@ def build_model():
 
     # Output Layer
     # The final layer is a Dense layer with a number of neurons equal to the number of classes in the dataset. Softmax activation is used for multi-class classification.
-    output = Dense(num_classes, activation="softmax")(x)
+    # Kept float32 when the other layers run in mixed precision, see pipeline.py
+    output = Dense(num_classes, activation="softmax", dtype="float32")(x)
 
     # Model Compilation
     # Adam optimizer is used with its default learning rate, which is found to be effective across a variety of tasks.
@@ -243,7 +248,10 @@ def build_model():
         amsgrad=False,
     )
     model.compile(
-        optimizer=optimizer, loss="categorical_crossentropy", metrics=["accuracy"]
+        optimizer=optimizer,
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+        jit_compile=jit_compile,
     )
 
     # Model Summary
@@ -256,13 +264,10 @@ def train_model(model):
     # Data Augmentation
     # Data augmentation is crucial for training deep learning models. It helps in making the model robust to slight variations and prevents overfitting.
     # The chosen parameters for rotation, zoom, and flips are standard practices to introduce variability in the training data without altering the semantics of the images.
-    datagen = ImageDataGenerator(
-        rotation_range=180,
-        zoom_range=[0.98, 1.02],
-        width_shift_range=0.1,
-        height_shift_range=0.1,
-        horizontal_flip=True,
-        vertical_flip=True,
+    # The batches are augmented with TensorFlow ops while the model trains on the previous ones, see pipeline.py
+    train_batches = training_dataset(train_images, train_labels, num_classes)
+    validation_batches = evaluation_dataset(
+        validation_images, validation_labels, num_classes
     )
 
     # Learning Rate Scheduler
@@ -272,26 +277,14 @@ def train_model(model):
         monitor="val_loss", factor=0.2, patience=5, min_lr=0.001
     )
 
-    train_X = train_images
-    train_y = train_labels
-
-    val_X = validation_images
-    val_y = validation_labels
-
-    X_train = train_X.reshape(-1, img_size, img_size, 1)
-    X_val = val_X.reshape(-1, img_size, img_size, 1)
-
-    Y_train = to_categorical(train_y, num_classes=num_classes)
-    Y_val = to_categorical(val_y, num_classes=num_classes)
-
     print("Training model...")
     epochs = 10
     # Add the reduce_lr callback to model.fit()
     model.fit(
-        datagen.flow(X_train, Y_train),
+        train_batches,
         epochs=epochs,
-        validation_data=(X_val, Y_val),
-        callbacks=[reduce_lr],
+        validation_data=validation_batches,
+        callbacks=[reduce_lr, ThroughputCallback(len(train_labels))],
     )
 
     print("Model trained successfully!")
@@ -299,20 +292,68 @@ def train_model(model):
     return model
 
 
+def float32_model(model):
+    """A float32 copy of a model trained in mixed precision, the inference backends don't run bfloat16"""
+    tf.keras.mixed_precision.set_global_policy("float32")
+    float32 = build_model()
+    float32.set_weights(model.get_weights())
+    return float32
+
+
 def save_model(model):
     model_save_path = "save/final.keras"
     model.save(model_save_path)
     print(f"Model saved in SavedModel format at: {model_save_path}")
 
 
+def export_model(model):
+    # Lighter models for the tflite and onnx inference backends of the server, see export.py
+    from export import export_all
+
+    export_all(model, normalize(validation_images))
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Trains the shape classifier")
+    parser.add_argument(
+        "--xla", action="store_true", help="Compile the training step with XLA"
+    )
+    parser.add_argument(
+        "--mixed-precision",
+        action="store_true",
+        help="Train in bfloat16, faster on CPUs supporting it natively",
+    )
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Also export the model for the tflite and onnx backends, see export.py",
+    )
+    parser.add_argument(
+        "--captures",
+        help="Also train on the strokes captured by the server, e.g. ../backend/captures",
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=0.9,
+        help="Only the captured strokes predicted with this confidence",
+    )
+    args = parser.parse_args()
+    jit_compile = configure_cpu_training(args.xla, args.mixed_precision)
+
     walk_training_data()
+    if args.captures:
+        add_captured_data(args.captures, args.min_confidence)
     prepare_validation_data()
     prepare_test_data()
     prepare_data_for_training()
-    model = build_model()
+    model = build_model(jit_compile)
     model = train_model(model)
+    if args.mixed_precision:
+        model = float32_model(model)
     save_model(model)
+    if args.export:
+        export_model(model)
     test_model(model)
 
 
@@ -0,0 +1,282 @@
+"""
+tf.data input pipelines feeding model.fit from the uint8 images of dataset.py.
+
+The training pipeline applies the augmentations of the former ImageDataGenerator
+(rotation, zoom, shift and flips) to a whole batch at once with TensorFlow ops,
+in parallel with the training step, instead of one image at a time in Python.
+
+    python pipeline.py [--images 2048] [--batch-size 32] [--xla] [--mixed-precision]
+
+compares the images per second and epoch time of both input pipelines, on the
+cached data set if present, otherwise on random images
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# Same ranges as the ImageDataGenerator of train_model
+ROTATION_RANGE = 180
+ZOOM_RANGE = (0.98, 1.02)
+SHIFT_RANGE = 0.1
+BATCH_SIZE = 32
+
+
+def random_transforms(batch_size, height, width):
+    """
+    (batch_size, 8) projective transforms mapping every output pixel to the input pixel it
+    samples: a random rotation and zoom around the center, then a random shift
+    """
+    angles = tf.random.uniform([batch_size], -1.0, 1.0) * (
+        ROTATION_RANGE * math.pi / 180
+    )
+    zoom_x = tf.random.uniform([batch_size], *ZOOM_RANGE)
+    zoom_y = tf.random.uniform([batch_size], *ZOOM_RANGE)
+    shift_x = tf.random.uniform([batch_size], -SHIFT_RANGE, SHIFT_RANGE) * width
+    shift_y = tf.random.uniform([batch_size], -SHIFT_RANGE, SHIFT_RANGE) * height
+
+    cos, sin = tf.cos(angles), tf.sin(angles)
+    a0, a1 = cos * zoom_x, -sin * zoom_y
+    b0, b1 = sin * zoom_x, cos * zoom_y
+    center_x = (width - 1) / 2
+    center_y = (height - 1) / 2
+    a2 = center_x - a0 * center_x - a1 * center_y + shift_x
+    b2 = center_y - b0 * center_x - b1 * center_y + shift_y
+    zeros = tf.zeros([batch_size])
+    return tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+
+def random_flips(images, axis):
+    """Flips every image of the batch along the axis with a probability of 0.5"""
+    flip = tf.random.uniform([tf.shape(images)[0], 1, 1, 1]) < 0.5
+    return tf.where(flip, tf.reverse(images, [axis]), images)
+
+
+def normalize_batch(images, labels, num_classes):
+    """Scales a batch of uint8 images to [0, 1], and one-hot encodes its labels"""
+    images = tf.cast(images, tf.float32) / 255.0
+    return images, tf.one_hot(tf.cast(labels, tf.int32), num_classes)
+
+
+def augment_batch(images, labels, num_classes):
+    """Normalizes then randomly rotates, zooms, shifts and flips a batch of images"""
+    images, labels = normalize_batch(images, labels, num_classes)
+    shape_before = images.shape
+    shape = tf.shape(images)
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=random_transforms(
+            shape[0], tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32)
+        ),
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation="BILINEAR",
+        # Like the default fill_mode of ImageDataGenerator
+        fill_mode="NEAREST",
+    )
+    # The transform loses the static shape of the images, XLA and the model want it
+    images.set_shape(shape_before)
+    images = random_flips(images, axis=2)
+    images = random_flips(images, axis=1)
+    return images, labels
+
+
+def _reshape(images):
+    # The uint8 images of dataset.py have no channel axis
+    return images.reshape(-1, *images.shape[1:3], 1)
+
+
+def _gather_batches(images, labels, indices):
+    """
+    The (images, labels) batches of a dataset of batches of indices. Every batch is read
+    from the images, memory-mapped by dataset.py, when it is needed: the images are never
+    copied into the graph, nor into memory all at once
+    """
+    images = _reshape(images)
+    labels = np.asarray(labels)
+
+    def gather(batch):
+        # In order, the memory map is read front to back
+        batch = np.sort(batch)
+        return images[batch], labels[batch]
+
+    def load(batch):
+        batch_images, batch_labels = tf.numpy_function(
+            gather,
+            [batch],
+            [tf.as_dtype(images.dtype), tf.as_dtype(labels.dtype)],
+            stateful=False,
+        )
+        batch_images.set_shape((None, *images.shape[1:]))
+        batch_labels.set_shape((None,))
+        return batch_images, batch_labels
+
+    return indices.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+
+
+def training_dataset(images, labels, num_classes, batch_size=BATCH_SIZE, seed=None):
+    """
+    Shuffled and augmented batches of the uint8 images, prepared while the model trains
+    on the previous ones. Only the indices are shuffled, every batch is read from the
+    images when needed, and stays uint8 until it is augmented
+    """
+    indices = (
+        tf.data.Dataset.range(len(labels))
+        .shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+        .batch(batch_size)
+    )
+    return (
+        _gather_batches(images, labels, indices)
+        .map(
+            lambda x, y: augment_batch(x, y, num_classes),
+            num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=False,
+        )
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def evaluation_dataset(images, labels, num_classes, batch_size=BATCH_SIZE):
+    """Normalized batches of the images, kept in memory after the first epoch"""
+    indices = tf.data.Dataset.range(len(labels)).batch(batch_size)
+    return (
+        _gather_batches(images, labels, indices)
+        .map(
+            lambda x, y: normalize_batch(x, y, num_classes),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+        .cache()
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def configure_cpu_training(xla=False, mixed_precision=False):
+    """
+    Optional settings for training on CPU, before the model is built: XLA compiles the
+    training step into fused kernels, mixed precision runs the layers in bfloat16,
+    which recent CPUs (AVX512-BF16, AMX) compute natively, and keeps the weights float32.
+    Returns the jit_compile argument of model.compile
+    """
+    if mixed_precision:
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    return True if xla else "auto"
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Prints the duration and images per second of every epoch"""
+
+    def __init__(self, images_per_epoch):
+        super().__init__()
+        self.images_per_epoch = images_per_epoch
+        self.epoch_times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        duration = time.perf_counter() - self._start
+        self.epoch_times.append(duration)
+        print(
+            f"Epoch {epoch + 1}: {duration:.1f}s, "
+            f"{self.images_per_epoch / duration:.0f} images/s"
+        )
+
+
+def _legacy_batches(images, labels, num_classes, batch_size):
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    from tensorflow.keras.utils import to_categorical
+
+    datagen = ImageDataGenerator(
+        rotation_range=ROTATION_RANGE,
+        zoom_range=list(ZOOM_RANGE),
+        width_shift_range=SHIFT_RANGE,
+        height_shift_range=SHIFT_RANGE,
+        horizontal_flip=True,
+        vertical_flip=True,
+        rescale=1 / 255.0,
+    )
+    return datagen.flow(
+        _reshape(images),
+        to_categorical(labels, num_classes=num_classes),
+        batch_size=batch_size,
+    )
+
+
+def _load_images(count, img_size):
+    import os
+
+    import final
+    from dataset import CACHE_DIR, load_directories
+
+    if os.path.isdir(final.main_dir):
+        directories = [
+            os.path.join(final.main_dir, directory, "images")
+            for directory in sorted(os.listdir(final.main_dir))
+        ]
+        images, labels = load_directories(
+            directories, img_size, final.shape_classes, CACHE_DIR
+        )
+        return images[:count], labels[:count]
+
+    print("No data set found, using random images")
+    rng = np.random.default_rng(0)
+    images = np.where(rng.random((count, img_size, img_size)) < 0.05, 0, 255)
+    return images.astype(np.uint8), rng.integers(0, final.num_classes, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--xla", action="store_true")
+    parser.add_argument("--mixed-precision", action="store_true")
+    args = parser.parse_args()
+
+    import final
+
+    jit_compile = configure_cpu_training(args.xla, args.mixed_precision)
+    images, labels = _load_images(args.images, final.img_size)
+    pipelines = {
+        "ImageDataGenerator": _legacy_batches(
+            images, labels, final.num_classes, args.batch_size
+        ),
+        "tf.data": training_dataset(images, labels, final.num_classes, args.batch_size),
+    }
+
+    results = []
+    for name, batches in pipelines.items():
+        start = time.perf_counter()
+        for _ in range(args.epochs):
+            for step, _ in enumerate(batches):
+                # The ImageDataGenerator iterator never ends
+                if step + 1 >= math.ceil(len(images) / args.batch_size):
+                    break
+        input_rate = args.epochs * len(images) / (time.perf_counter() - start)
+
+        model = final.build_model(jit_compile=jit_compile)
+        throughput = ThroughputCallback(len(images))
+        model.fit(
+            batches,
+            epochs=args.epochs + 1,
+            steps_per_epoch=math.ceil(len(images) / args.batch_size),
+            callbacks=[throughput],
+            verbose=0,
+        )
+        # The first epoch also traces and compiles the model
+        epoch_time = np.mean(throughput.epoch_times[1:])
+        results.append((name, input_rate, epoch_time, len(images) / epoch_time))
+
+    print(f"\n{'pipeline':<20}{'input only':>16}{'epoch time':>14}{'training':>16}")
+    for name, input_rate, epoch_time, train_rate in results:
+        print(
+            f"{name:<20}{input_rate:>10.0f} img/s{epoch_time:>13.2f}s"
+            f"{train_rate:>10.0f} img/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
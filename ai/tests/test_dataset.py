@@ -0,0 +1,191 @@
+import json
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from dataset import (
+    ShardedImages,
+    join_shards,
+    load_captures,
+    load_directories,
+    normalize,
+)
+
+CLASSES = {"other": 0, "ellipse": 1, "rectangle": 2, "triangle": 3}
+IMG_SIZE = 32
+
+
+def draw(shape_type, seed):
+    """A 100x100 drawing, black on white like the data set"""
+    rng = np.random.default_rng(seed)
+    image = np.full((100, 100), 255, np.uint8)
+    center = tuple(int(value) for value in rng.integers(35, 65, 2))
+    if shape_type == "ellipse":
+        cv2.ellipse(image, center, (30, 20), 0, 0, 360, 0, 2)
+    elif shape_type == "rectangle":
+        cv2.rectangle(
+            image,
+            (center[0] - 25, center[1] - 20),
+            (center[0] + 25, center[1] + 20),
+            0,
+            2,
+        )
+    else:
+        cv2.line(image, (10, int(rng.integers(10, 90))), (90, 50), 0, 2)
+    return image
+
+
+def make_user(main_dir, user, drawings):
+    """A user directory of the data set, with (shape type, seed) drawings"""
+    directory = os.path.join(main_dir, user, "images")
+    for index, (shape_type, seed) in enumerate(drawings):
+        os.makedirs(os.path.join(directory, shape_type), exist_ok=True)
+        path = os.path.join(directory, shape_type, f"{index:03d}.png")
+        cv2.imwrite(path, draw(shape_type, seed))
+    return directory
+
+
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.main_dir = os.path.join(temp.name, "data")
+        self.cache_dir = os.path.join(temp.name, "cache")
+        self.first = make_user(
+            self.main_dir, "user.a", [("ellipse", 0), ("rectangle", 1), ("other", 2)]
+        )
+        self.second = make_user(
+            self.main_dir, "user.b", [("rectangle", 3), ("ellipse", 4)]
+        )
+
+    def load(self, directories, **options):
+        return load_directories(
+            directories, IMG_SIZE, CLASSES, self.cache_dir, workers=1, **options
+        )
+
+    def test_shard_round_trip(self):
+        images, labels = self.load([self.first])
+
+        self.assertIsInstance(images, np.memmap)
+        self.assertEqual(images.shape, (3, IMG_SIZE, IMG_SIZE))
+        self.assertEqual(images.dtype, np.uint8)
+        # Sorted by class name, then file name
+        np.testing.assert_array_equal(labels, [1, 0, 2])
+        expected = cv2.resize(draw("ellipse", 0), (IMG_SIZE, IMG_SIZE))
+        np.testing.assert_array_equal(images[0], expected)
+
+    def test_shards_are_reused_until_an_image_changes(self):
+        self.load([self.first])
+        shards = sorted(os.listdir(self.cache_dir))
+        self.load([self.first])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), shards)
+
+        cv2.imwrite(os.path.join(self.first, "other", "002.png"), draw("other", 5))
+        os.utime(os.path.join(self.first, "other", "002.png"), ns=(0, 0))
+        images, _ = self.load([self.first])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        expected = cv2.resize(draw("other", 5), (IMG_SIZE, IMG_SIZE))
+        np.testing.assert_array_equal(images[1], expected)
+
+    def test_several_directories_are_not_copied(self):
+        images, labels = self.load([self.first, self.second])
+
+        self.assertIsInstance(images, ShardedImages)
+        self.assertTrue(all(isinstance(part, np.memmap) for part in images.parts))
+        # One shard per directory, nothing else written
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertEqual(images.shape, (5, IMG_SIZE, IMG_SIZE))
+        np.testing.assert_array_equal(labels, [1, 0, 2, 1, 2])
+
+        everything = np.concatenate(
+            [self.load([self.first])[0], self.load([self.second])[0]]
+        )
+        np.testing.assert_array_equal(np.asarray(images), everything)
+        np.testing.assert_array_equal(images[[4, 0, 3]], everything[[4, 0, 3]])
+        np.testing.assert_array_equal(images[1:4], everything[1:4])
+        np.testing.assert_array_equal(images[-1], everything[-1])
+        reshaped = images.reshape(-1, IMG_SIZE, IMG_SIZE, 1)
+        self.assertEqual(reshaped.shape, (5, IMG_SIZE, IMG_SIZE, 1))
+        np.testing.assert_allclose(normalize(reshaped)[3, ..., 0], everything[3] / 255)
+
+    def test_join_skips_empty_shards(self):
+        images, labels = self.load([self.first])
+        empty = (np.empty((0, IMG_SIZE, IMG_SIZE), np.uint8), np.empty(0, np.uint8))
+
+        joined_images, joined_labels = join_shards([empty, (images, labels)])
+        self.assertIs(joined_images, images)
+        joined_images, joined_labels = join_shards(
+            [(images, labels), join_shards([(images, labels), (images, labels)])]
+        )
+        self.assertEqual(len(joined_images.parts), 3)
+        self.assertEqual(len(joined_labels), 9)
+
+    def capture(self, capture_dir, name, labels, confidences):
+        """A shard of captured strokes, written like CaptureWriter in the backend"""
+        path = os.path.join(capture_dir, name)
+        os.makedirs(path)
+        images = np.stack(
+            [np.full((IMG_SIZE, IMG_SIZE), label, np.uint8) for label in labels]
+        )
+        np.save(os.path.join(path, "images.npy"), images)
+        np.save(os.path.join(path, "labels.npy"), np.array(labels, np.uint8))
+        np.save(
+            os.path.join(path, "confidences.npy"), np.array(confidences, np.float32)
+        )
+        # The server numbers the classes its own way
+        index = {
+            "name": name,
+            "count": len(labels),
+            "img_size": IMG_SIZE,
+            "classes": {"ellipse": 0, "other": 1, "rectangle": 2, "triangle": 3},
+        }
+        with open(os.path.join(path, "index.json"), "w") as file:
+            json.dump(index, file)
+        with open(os.path.join(capture_dir, "index.jsonl"), "a") as file:
+            file.write(json.dumps(index) + "\n")
+
+    def test_captures_are_cached_as_a_shard(self):
+        capture_dir = os.path.join(self.main_dir, "..", "captures")
+        self.capture(capture_dir, "first", [0, 1, 2], [0.95, 0.5, 0.99])
+
+        images, labels = load_captures(
+            capture_dir, IMG_SIZE, CLASSES, 0.9, self.cache_dir
+        )
+        self.assertIsInstance(images, np.memmap)
+        # Confident ones only, numbered like the training
+        np.testing.assert_array_equal(labels, [1, 2])
+        np.testing.assert_array_equal(images[:, 0, 0], [0, 2])
+
+        # New captures replace the cached shard
+        self.capture(capture_dir, "second", [3], [1.0])
+        images, labels = load_captures(
+            capture_dir, IMG_SIZE, CLASSES, 0.9, self.cache_dir
+        )
+        np.testing.assert_array_equal(labels, [1, 2, 3])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        train_images, train_labels = self.load([self.first, self.second])
+        joined, joined_labels = join_shards(
+            [(train_images, train_labels), (images, labels)]
+        )
+        self.assertEqual(len(joined.parts), 3)
+        np.testing.assert_array_equal(joined_labels[-3:], [1, 2, 3])
+        np.testing.assert_array_equal(joined[[5, 7]][:, 0, 0], [0, 3])
+
+    def test_no_captures(self):
+        images, labels = load_captures(
+            os.path.join(self.main_dir, "missing"),
+            IMG_SIZE,
+            CLASSES,
+            0.0,
+            self.cache_dir,
+        )
+        self.assertEqual(images.shape, (0, IMG_SIZE, IMG_SIZE))
+        self.assertEqual(len(labels), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
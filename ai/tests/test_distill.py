@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from dataset import load_directories
+from distill import accuracy, build_student, count_flops, distill, measure_latency
+from tests.test_dataset import CLASSES, IMG_SIZE, make_user
+
+
+class TestDistill(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        temp = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(temp.cleanup)
+        main_dir = os.path.join(temp.name, "data")
+        directories = [
+            make_user(main_dir, "user.a", [("ellipse", i) for i in range(4)]),
+            make_user(main_dir, "user.b", [("rectangle", i) for i in range(4)]),
+            make_user(main_dir, "user.c", [("other", i) for i in range(4)]),
+        ]
+        cls.images, cls.labels = load_directories(
+            directories, IMG_SIZE, CLASSES, os.path.join(temp.name, "cache"), workers=1
+        )
+        cls.images = cls.images.reshape(-1, IMG_SIZE, IMG_SIZE, 1)
+
+        tf.keras.utils.set_random_seed(0)
+        # Stands in for save/final.keras, ends with its softmax too
+        cls.teacher = tf.keras.Sequential(
+            [
+                tf.keras.Input((IMG_SIZE, IMG_SIZE, 1)),
+                tf.keras.layers.Flatten(),
+                tf.keras.layers.Dense(len(CLASSES), activation="softmax"),
+            ]
+        )
+
+    def test_distill_a_student(self):
+        student = build_student(len(CLASSES), 16, (4, 8), img_size=IMG_SIZE)
+        self.assertEqual(student.input_shape, (None, IMG_SIZE, IMG_SIZE, 1))
+        self.assertEqual(student.output_shape, (None, len(CLASSES)))
+        weights = [w.copy() for w in student.get_weights()]
+
+        trained = distill(
+            student,
+            self.teacher,
+            self.images,
+            self.labels,
+            self.images,
+            self.labels,
+            len(CLASSES),
+            epochs=1,
+        )
+
+        self.assertIs(trained, student)
+        self.assertTrue(
+            any(
+                not np.array_equal(before, after)
+                for before, after in zip(weights, student.get_weights())
+            )
+        )
+        probabilities = student.predict(self.images[:3] / 255.0, verbose=0)
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1.0, rtol=1e-5)
+        self.assertTrue(0.0 <= accuracy(student, self.images, self.labels) <= 1.0)
+
+    def test_separable_student_is_cheaper(self):
+        full = build_student(len(CLASSES), IMG_SIZE, (8, 16), img_size=IMG_SIZE)
+        separable = build_student(
+            len(CLASSES), IMG_SIZE, (8, 16), separable=True, img_size=IMG_SIZE
+        )
+        downscaled = build_student(len(CLASSES), 16, (8, 16), img_size=IMG_SIZE)
+
+        self.assertGreater(count_flops(full), 0)
+        self.assertLess(count_flops(separable), count_flops(full))
+        self.assertLess(count_flops(downscaled), count_flops(full))
+
+    def test_count_flops_of_a_dense_layer(self):
+        model = tf.keras.Sequential(
+            [tf.keras.Input((10,)), tf.keras.layers.Dense(3, name="logits")]
+        )
+        # One multiply-add per weight
+        self.assertEqual(count_flops(model), 2 * 10 * 3)
+
+    def test_measure_latency(self):
+        latency = measure_latency(self.teacher, batch_size=2, runs=3)
+        self.assertGreater(latency, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
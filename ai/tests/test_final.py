@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import final
+
+
+class TestWalkTrainingData(unittest.TestCase):
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        main_dir = temp.name + "/"
+        for user in ["a", "b", *final.validation_users, *final.test_users]:
+            os.makedirs(os.path.join(main_dir, f"user.{user}", "images"))
+        self.main_dir = main_dir
+
+    def test_held_out_users_never_train(self):
+        with mock.patch.object(final, "main_dir", self.main_dir), mock.patch.object(
+            final, "process_directories", return_value=([], [])
+        ) as process_directories:
+            final.walk_training_data()
+
+        (directories,), _ = process_directories.call_args
+        self.assertEqual(
+            sorted(directories),
+            [self.main_dir + "user.a/images/", self.main_dir + "user.b/images/"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from dataset import ShardedImages, load_directories
+from pipeline import augment_batch, evaluation_dataset, training_dataset
+from tests.test_dataset import CLASSES, IMG_SIZE, make_user
+
+
+class CountingImages(ShardedImages):
+    """Counts how often all the images are loaded at once"""
+
+    loads = 0
+
+    def __array__(self, dtype=None, copy=None):
+        CountingImages.loads += 1
+        return super().__array__(dtype, copy)
+
+
+class TestPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        temp = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(temp.cleanup)
+        main_dir = os.path.join(temp.name, "data")
+        directories = [
+            make_user(main_dir, "user.a", [("ellipse", i) for i in range(5)]),
+            make_user(main_dir, "user.b", [("rectangle", i) for i in range(4)]),
+            make_user(main_dir, "user.c", [("other", i) for i in range(3)]),
+        ]
+        images, cls.labels = load_directories(
+            directories, IMG_SIZE, CLASSES, os.path.join(temp.name, "cache"), workers=1
+        )
+        cls.images = CountingImages(images.parts)
+        cls.expected = np.concatenate(images.parts)
+
+    def setUp(self):
+        CountingImages.loads = 0
+
+    def test_evaluation_batches(self):
+        batches = list(evaluation_dataset(self.images, self.labels, 4, batch_size=5))
+
+        self.assertEqual([len(labels) for _, labels in batches], [5, 5, 2])
+        images = np.concatenate([images for images, _ in batches])
+        labels = np.concatenate([labels for _, labels in batches])
+        self.assertEqual(images.dtype, np.float32)
+        self.assertEqual(images.shape, (12, IMG_SIZE, IMG_SIZE, 1))
+        np.testing.assert_allclose(images[..., 0], self.expected / 255.0, atol=1e-6)
+        np.testing.assert_array_equal(labels, tf.one_hot(self.labels, 4))
+        # Read a batch at a time from the shards
+        self.assertEqual(CountingImages.loads, 0)
+
+    def test_training_batches(self):
+        dataset = training_dataset(self.images, self.labels, 4, batch_size=5, seed=0)
+        self.assertEqual(
+            dataset.element_spec[0].shape.as_list(), [None, IMG_SIZE, IMG_SIZE, 1]
+        )
+
+        for _ in range(2):
+            batches = list(dataset)
+            self.assertEqual([len(labels) for _, labels in batches], [5, 5, 2])
+            images = np.concatenate([images for images, _ in batches])
+            labels = np.concatenate([labels for _, labels in batches])
+            self.assertEqual(images.dtype, np.float32)
+            self.assertGreaterEqual(images.min(), 0.0)
+            self.assertLessEqual(images.max(), 1.0)
+            # Every image once per epoch
+            self.assertEqual(
+                sorted(labels.argmax(axis=1)), sorted(self.labels.tolist())
+            )
+        self.assertEqual(CountingImages.loads, 0)
+
+    def test_augmentation_keeps_blank_images_blank(self):
+        images = np.full((3, IMG_SIZE, IMG_SIZE, 1), 255, np.uint8)
+        augmented, labels = augment_batch(images, np.array([0, 2, 3]), 4)
+
+        self.assertEqual(augmented.shape, images.shape)
+        np.testing.assert_allclose(augmented, 1.0)
+        np.testing.assert_array_equal(labels.numpy().argmax(axis=1), [0, 2, 3])
+
+    def test_augmentation_moves_the_drawing(self):
+        images = self.expected[:4, ..., None]
+        tf.random.set_seed(0)
+        augmented, _ = augment_batch(images, self.labels[:4], 4)
+
+        self.assertFalse(np.allclose(augmented, images / 255.0))
+        # The ink is moved, neither lost nor created
+        ink = (images < 128).sum(axis=(1, 2, 3))
+        augmented_ink = (augmented.numpy() < 0.5).sum(axis=(1, 2, 3))
+        np.testing.assert_allclose(augmented_ink, ink, rtol=0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
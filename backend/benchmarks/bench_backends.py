@@ -0,0 +1,184 @@
+"""
+Compares the inference backends of ModelLoader: the Keras model run by TensorFlow,
+and the TensorFlow Lite (float and int8) and ONNX exports of ai/export.py.
+
+Every backend runs in its own process, so the memory it reports is its own: the peak
+resident memory once the model is loaded and warmed up, and whether TensorFlow was imported.
+Predictions on seeded synthetic strokes are compared to the Keras ones, how often they
+pick the same class and how far their probabilities are.
+
+The model is exported to a temporary directory first, the int8 one calibrated on other
+synthetic strokes, unless --exported points to the output of ai/export.py.
+
+Run from the backend directory:
+    python -m benchmarks.bench_backends [--model ../ai/save/final.keras] [--exported ../ai/save]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    stand_in_model_path,
+    summarize,
+    time_calls,
+)
+
+EXPORT_SCRIPT = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "ai", "export.py"
+)
+# Backend and file name of every exported model, see ai/export.py
+EXPORTS = {
+    "tflite": ("tflite", "final.tflite"),
+    "tflite int8": ("tflite", "final_int8.tflite"),
+    "onnx": ("onnx", "final.onnx"),
+}
+
+
+def synthetic_images(count: int, seed: int) -> np.ndarray:
+    from benchmarks.strokes import synthetic_strokes
+    from whiteboard_ai.core.ImageGenerator import ImageGenerator
+
+    image_generator = ImageGenerator(dimensions=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    return image_generator.render_batch(synthetic_strokes(count, 200, seed=seed))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process"""
+    try:
+        # Unlike ru_maxrss, reset when the process starts another program
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(
+    backend: str, model_path: str, images_path: str, iterations: int
+) -> None:
+    """Runs in the child process, prints its results as JSON"""
+    from whiteboard_ai.model.model import ModelLoader
+
+    images = np.load(images_path)
+
+    started = time.perf_counter()
+    model_loader = ModelLoader(model_path, backend=backend)
+    load_s = time.perf_counter() - started
+
+    result = {
+        "load_s": load_s,
+        "peak_rss_mb": peak_rss_mb(),
+        "tensorflow_imported": "tensorflow" in sys.modules,
+        "latency": {},
+    }
+    for batch_size in (1, 8, 32):
+        batch = images[:batch_size]
+        durations = time_calls(lambda: model_loader.predict(batch), iterations)
+        result["latency"][batch_size] = summarize(str(batch_size), durations)
+
+    predictions_path = os.path.join(
+        os.path.dirname(images_path), os.path.basename(model_path) + ".predictions.npy"
+    )
+    np.save(predictions_path, model_loader.predict(images))
+    result["predictions"] = predictions_path
+    print(json.dumps(result))
+
+
+def measure(backend: str, model_path: str, images_path: str, iterations: int) -> dict:
+    command = [sys.executable, "-m", "benchmarks.bench_backends", "--child", backend]
+    command += [model_path, images_path, "--iterations", str(iterations)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["predictions"] = np.load(result["predictions"])
+    return result
+
+
+def export(model_path: str, directory: str) -> None:
+    calibration_path = os.path.join(directory, "calibration.npy")
+    np.save(calibration_path, synthetic_images(500, seed=1))
+    subprocess.run(
+        [
+            sys.executable,
+            EXPORT_SCRIPT,
+            "--model",
+            model_path,
+            "--output-dir",
+            directory,
+            "--calibration",
+            calibration_path,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument(
+        "--exported", help="Directory of the models exported by ai/export.py"
+    )
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(*args.child, args.iterations)
+        return
+
+    model_path = args.model or stand_in_model_path()
+    directory = tempfile.mkdtemp()
+    exported = args.exported
+    if exported is None:
+        exported = directory
+        export(model_path, exported)
+
+    images_path = os.path.join(directory, "images.npy")
+    np.save(images_path, synthetic_images(args.images, seed=0))
+
+    models = {"keras": ("keras", model_path)}
+    for name, (backend, file_name) in EXPORTS.items():
+        models[name] = (backend, os.path.join(exported, file_name))
+
+    print(
+        f"{'backend':<12} {'load':>7} {'peak rss':>10} {'tf':>4}"
+        f" {'p50 x1':>9} {'p50 x8':>9} {'p50 x32':>9} {'same class':>11} {'max diff':>9}"
+    )
+    reference = None
+    for name, (backend, path) in models.items():
+        result = measure(backend, path, images_path, args.iterations)
+        if reference is None:
+            reference = result["predictions"]
+        same_class = np.mean(result["predictions"].argmax(1) == reference.argmax(1))
+        difference = np.abs(result["predictions"] - reference).max()
+        latency = result["latency"]
+        print(
+            f"{name:<12} {result['load_s']:>6.2f}s {result['peak_rss_mb']:>7.0f} MB"
+            f" {'yes' if result['tensorflow_imported'] else 'no':>4}"
+            f" {latency['1']['p50_ms']:>6.2f} ms {latency['8']['p50_ms']:>6.2f} ms"
+            f" {latency['32']['p50_ms']:>6.2f} ms {same_class:>11.4f} {difference:>9.4f}"
+        )
+    if args.model is None:
+        print(
+            "\nThe stand-in model is not trained, its probabilities are nearly uniform"
+            " and the same class column is meaningless, give a trained --model"
+        )
+
+
+if __name__ == "__main__":
+    main()
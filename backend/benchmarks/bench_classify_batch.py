@@ -0,0 +1,90 @@
+"""
+Compares classifying an imported board of many strokes with one classify event per stroke,
+sent one after the other or all at once, to a single classify_batch event.
+
+The result cache and the geometric fast path are disabled, every stroke goes through
+the model.
+
+Run from the backend directory:
+    python -m benchmarks.bench_classify_batch [--model ../ai/save/final.keras]
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from benchmarks.common import stand_in_model_path
+from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.server.protocol import encode_points
+from whiteboard_ai.server.WebsocketServer import WebSocketServer
+
+
+def board_payloads(num_strokes: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for _ in range(num_strokes):
+        num_points = rng.integers(20, 300)
+        angles = np.linspace(0, 2 * np.pi, num_points)
+        radius = rng.uniform(20, 300, 2)
+        points = rng.uniform(300, 1000, 2) + np.stack(
+            [radius[0] * np.cos(angles), radius[1] * np.sin(angles)], axis=1
+        )
+        payloads.append(encode_points(points + rng.normal(0, 2, points.shape)))
+    return payloads
+
+
+async def run(args) -> None:
+    model_loader = ModelLoader(args.model or stand_in_model_path())
+    server = WebSocketServer(
+        "localhost",
+        0,
+        model_loader,
+        executor_mode=args.executor,
+        cache_enabled=False,
+        fast_path=False,
+    )
+    payloads = board_payloads(args.strokes)
+    # Warm up every batch size before timing anything
+    model_loader.warmup()
+    await server.handle_classify_batch({"strokes": payloads[:10]})
+
+    async def one_by_one():
+        for payload in payloads:
+            await server.handle_classify(payload)
+
+    async def all_at_once():
+        await asyncio.gather(*(server.handle_classify(payload) for payload in payloads))
+
+    async def batch_event():
+        await server.handle_classify_batch({"strokes": payloads})
+
+    for name, fn in (
+        ("classify, one by one", one_by_one),
+        ("classify, all at once", all_at_once),
+        ("classify_batch", batch_event),
+    ):
+        start = time.perf_counter()
+        await fn()
+        duration = time.perf_counter() - start
+        print(
+            f"{name:<25} {duration * 1000:9.1f} ms"
+            f"   {len(payloads) / duration:8.1f} strokes/s"
+        )
+
+    server.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument("--strokes", type=int, default=500)
+    parser.add_argument("--executor", default="thread")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
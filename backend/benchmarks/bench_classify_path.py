@@ -0,0 +1,76 @@
+"""
+Compares the per-request latency of the old disk round-trip classify path
+(render -> PNG -> cv2.imread) with the in-memory render_array path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_classify_path [--model ../ai/save/final.keras]
+"""
+
+import argparse
+import os
+import tempfile
+
+import cv2
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    print_summary,
+    sample_stroke,
+    stand_in_model_path,
+    summarize,
+    time_calls,
+)
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.model.model import ModelLoader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--points", type=int, default=200)
+    args = parser.parse_args()
+
+    model_loader = ModelLoader(args.model or stand_in_model_path())
+
+    stroke = sample_stroke(args.points)
+    image_generator = ImageGenerator(dimensions=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, "gen_img.png")
+
+    def disk_path():
+        image = image_generator.generate_image(stroke)
+        image_generator.export_image(image, path)
+        model_loader.classify(path)
+
+    def in_memory_path():
+        model_loader.classify_array(image_generator.render_array(stroke))
+
+    def disk_preprocess():
+        image = image_generator.generate_image(stroke)
+        image_generator.export_image(image, path)
+        cv2.imread(path, cv2.IMREAD_GRAYSCALE) / 255.0
+
+    def in_memory_preprocess():
+        image_generator.render_array(stroke)
+
+    results = [
+        summarize(
+            "preprocess: PNG round-trip", time_calls(disk_preprocess, args.iterations)
+        ),
+        summarize(
+            "preprocess: render_array",
+            time_calls(in_memory_preprocess, args.iterations),
+        ),
+        summarize("end to end: PNG round-trip", time_calls(disk_path, args.iterations)),
+        summarize(
+            "end to end: render_array", time_calls(in_memory_path, args.iterations)
+        ),
+    ]
+    for result in results:
+        print_summary(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Sets and checks the thresholds of the GeometricPreClassifier, on seeded synthetic strokes:
+ellipses, rectangles and triangles the model must classify, and lines, underlines and
+scribbles that are "other". Every class is drawn at random sizes, lengths and pen noise.
+
+Prints the spread of every feature by class, how often the fast path answers each class,
+and how long it takes next to rendering and classifying the stroke. With a trained model,
+also prints the accuracy of the model alone and with the fast path in front of it.
+
+Run from the backend directory:
+    python -m benchmarks.bench_fast_path [--model ../ai/save/final.keras] [--count 500]
+"""
+
+import argparse
+
+import numpy as np
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    print_summary,
+    stand_in_model_path,
+    summarize,
+    time_calls,
+)
+from benchmarks.strokes import synthetic_line, synthetic_points
+from whiteboard_ai.core.GeometricPreClassifier import GeometricPreClassifier
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.model.model import ModelLoader
+
+# Class of every kind of synthetic stroke, as the model names it
+KINDS = {
+    "ellipse": "ellipse",
+    "rectangle": "rectangle",
+    "triangle": "triangle",
+    "scribble": "other",
+    "line": "other",
+    "underline": "other",
+}
+FEATURES = ("closure", "eccentricity", "winding", "corners")
+
+
+def labelled_strokes(count: int, seed: int = 0) -> dict[str, list[np.ndarray]]:
+    """count strokes of every kind, with 10 to 400 points and a pen noise of 0.5 to 4"""
+    rng = np.random.default_rng(seed)
+    strokes = {}
+    for kind in KINDS:
+        strokes[kind] = []
+        for _ in range(count):
+            num_points = int(rng.integers(10, 400))
+            noise = rng.uniform(0.5, 4)
+            if kind == "line":
+                points = synthetic_line(num_points, rng, noise)
+            elif kind == "underline":
+                points = synthetic_line(num_points, rng, noise, rng.uniform(0.05, 0.3))
+            else:
+                points = synthetic_points(kind, num_points, rng, noise)
+            strokes[kind].append(points)
+    return strokes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, accuracy is only printed with one"
+    )
+    parser.add_argument("--count", type=int, default=500, help="Strokes of every kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    pre_classifier = GeometricPreClassifier(enabled=True)
+    strokes = labelled_strokes(args.count, args.seed)
+
+    print(
+        f"{'kind':<10} {'feature':<13} {'min':>7} {'p5':>7} {'p50':>7} {'p95':>7} {'max':>7}"
+    )
+    reasons = {}
+    for kind, kind_strokes in strokes.items():
+        features = [pre_classifier.features(points) for points in kind_strokes]
+        reasons[kind] = [pre_classifier.reason(feature) for feature in features]
+        for name in FEATURES:
+            values = np.array([feature[name] for feature in features])
+            quantiles = np.quantile(values, [0, 0.05, 0.5, 0.95, 1])
+            print(
+                f"{kind:<10} {name:<13} "
+                + " ".join(f"{value:7.3f}" for value in quantiles)
+            )
+
+    print(f"\n{'kind':<10} {'answered without the model':>28}")
+    for kind, kind_reasons in reasons.items():
+        answered = sum(reason is not None for reason in kind_reasons)
+        print(f"{kind:<10} {answered / len(kind_reasons):>27.1%}")
+    wrong = sum(
+        reason is not None
+        for kind, kind_reasons in reasons.items()
+        if KINDS[kind] != "other"
+        for reason in kind_reasons
+    )
+    print(f'shapes answered "other" by the fast path: {wrong}\n')
+
+    model_loader = ModelLoader(args.model or stand_in_model_path())
+    model_loader.warmup()
+    image_generator = ImageGenerator(dimensions=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    # Closed shapes only pay for the first features, the others are answered
+    for name in ("ellipse", "line", "scribble"):
+        stroke = Stroke.from_array(strokes[name][0])
+        print_summary(
+            summarize(
+                f"{name}: fast path",
+                time_calls(lambda: pre_classifier.check(stroke.array), args.iterations),
+            )
+        )
+        print_summary(
+            summarize(
+                f"{name}: render and classify",
+                time_calls(
+                    lambda: model_loader.classify_array(
+                        image_generator.render_array(stroke)
+                    ),
+                    args.iterations,
+                ),
+            )
+        )
+
+    if not args.model:
+        print("\nAccuracy needs a trained model, see --model")
+        return
+
+    correct_model = correct_fast_path = total = 0
+    for kind, kind_strokes in strokes.items():
+        images = image_generator.render_batch(
+            [Stroke.from_array(points) for points in kind_strokes]
+        )
+        predictions = [name for name, _ in model_loader.classify_batch(images)]
+        for prediction, reason in zip(predictions, reasons[kind]):
+            total += 1
+            correct_model += prediction == KINDS[kind]
+            correct_fast_path += (
+                "other" if reason is not None else prediction
+            ) == KINDS[kind]
+    print(f"\naccuracy of the model alone      {correct_model / total:.4f}")
+    print(f"accuracy with the fast path      {correct_fast_path / total:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the latency of model.predict with the compiled inference function of ModelLoader,
+for single images and small batches.
+
+Run from the backend directory:
+    python -m benchmarks.bench_inference [--model ../ai/save/final.keras] [--jit]
+"""
+
+import argparse
+
+import numpy as np
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    print_summary,
+    stand_in_model_path,
+    summarize,
+    time_calls,
+)
+from whiteboard_ai.model.model import ModelLoader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--jit", action="store_true", help="Also benchmark XLA")
+    args = parser.parse_args()
+
+    model_path = args.model or stand_in_model_path()
+    loaders = {
+        "predict": ModelLoader(model_path, compiled=False),
+        "compiled": ModelLoader(model_path, compiled=True),
+    }
+    if args.jit:
+        loaders["compiled + xla"] = ModelLoader(
+            model_path, compiled=True, jit_compile=True
+        )
+
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_sizes:
+        images = rng.random(
+            (batch_size, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 1), dtype=np.float32
+        )
+        for name, model_loader in loaders.items():
+            durations = time_calls(
+                lambda: model_loader.predict(images), args.iterations
+            )
+            print_summary(summarize(f"{name}, batch of {batch_size}", durations))
+
+
+if __name__ == "__main__":
+    main()
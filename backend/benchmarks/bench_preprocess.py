@@ -0,0 +1,66 @@
+"""
+Compares rendering raw strokes to rendering them after the StrokePreprocessor,
+for increasingly long strokes, and reports how many points and pixels changed.
+
+Run from the backend directory:
+    python -m benchmarks.bench_preprocess
+"""
+
+import argparse
+
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    print_summary,
+    sample_stroke,
+    summarize,
+    time_calls,
+)
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.util.consts import PREPROCESS_SPACING, PREPROCESS_TOLERANCE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--points", type=int, nargs="+", default=[50, 200, 1000, 5000])
+    parser.add_argument("--spacing", type=float, default=PREPROCESS_SPACING)
+    parser.add_argument("--tolerance", type=float, default=PREPROCESS_TOLERANCE)
+    args = parser.parse_args()
+
+    dimensions = (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+    raw_generator = ImageGenerator(dimensions=dimensions, preprocess=False)
+    preprocessing_generator = ImageGenerator(dimensions=dimensions, preprocess=True)
+    preprocessing_generator.preprocessor.spacing = args.spacing
+    preprocessing_generator.preprocessor.tolerance = args.tolerance
+
+    for num_points in args.points:
+        stroke = sample_stroke(num_points)
+        kept = len(preprocessing_generator._scaled_polylines([stroke])[0])
+
+        raw_ink = raw_generator.render_array(stroke) < 0.5
+        preprocessed_ink = preprocessing_generator.render_array(stroke) < 0.5
+        changed = (raw_ink != preprocessed_ink).sum() / raw_ink.sum()
+
+        print(
+            f"{num_points} points, {kept} kept, "
+            f"{changed:.1%} of the inked pixels changed"
+        )
+        print_summary(
+            summarize(
+                "  Raw stroke",
+                time_calls(lambda: raw_generator.render_array(stroke), args.iterations),
+            )
+        )
+        print_summary(
+            summarize(
+                "  Preprocessed stroke",
+                time_calls(
+                    lambda: preprocessing_generator.render_array(stroke),
+                    args.iterations,
+                ),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares the size and the server side decoding time of the JSON (version 1)
+and packed binary (version 2) classify payloads.
+
+Run from the backend directory:
+    python -m benchmarks.bench_protocol
+"""
+
+import argparse
+import json
+
+from benchmarks.common import print_summary, sample_stroke, summarize, time_calls
+from whiteboard_ai.server.protocol import decode_stroke, encode_points
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--points", type=int, nargs="+", default=[200, 1000, 5000])
+    args = parser.parse_args()
+
+    for num_points in args.points:
+        points = sample_stroke(num_points).array
+        payloads = {
+            "v1 json": {"points": [{"x": int(x), "y": int(y)} for x, y in points]},
+            "v2 int16": encode_points(points, "int16"),
+            "v2 int16 delta": encode_points(points, "int16", delta=True),
+            "v2 float32": encode_points(points, "float32"),
+        }
+
+        print(f"{num_points} points")
+        for name, payload in payloads.items():
+            if "version" in payload:
+                # Sent as a JSON header and a binary attachment
+                header = {
+                    key: value for key, value in payload.items() if key != "points"
+                }
+                size = len(json.dumps(header)) + len(payload["points"])
+            else:
+                size = len(json.dumps(payload))
+
+            summary = summarize(
+                f"  {name} ({size} bytes)",
+                time_calls(lambda: decode_stroke(payload), args.iterations),
+            )
+            print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares rendering strokes with PIL's ImageDraw to the NumPy Rasterizer,
+one stroke at a time and a whole batch at once, for increasingly long strokes.
+
+Run from the backend directory:
+    python -m benchmarks.bench_rasterizer
+"""
+
+import argparse
+
+import numpy as np
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    print_summary,
+    sample_stroke,
+    summarize,
+    time_calls,
+)
+from PIL import Image, ImageDraw
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--points", type=int, nargs="+", default=[50, 200, 1000, 5000])
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    image_generator = ImageGenerator(dimensions=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+
+    for num_points in args.points:
+        stroke = sample_stroke(num_points)
+        polyline = image_generator._scaled_polylines([stroke])[0]
+        points = [tuple(point) for point in polyline]
+
+        def draw_with_pil():
+            image = Image.new("L", image_generator.dimensions, "white")
+            ImageDraw.Draw(image).line(points, fill="black", width=2)
+            return np.asarray(image, dtype=np.float32) / 255.0
+
+        batch = [polyline] * args.batch_size
+        out = np.empty(
+            (args.batch_size, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dtype=np.float32
+        )
+
+        print(f"{num_points} points")
+        print_summary(
+            summarize("  PIL ImageDraw", time_calls(draw_with_pil, args.iterations))
+        )
+        print_summary(
+            summarize(
+                "  Rasterizer",
+                time_calls(
+                    lambda: image_generator.rasterizer.rasterize([polyline]),
+                    args.iterations,
+                ),
+            )
+        )
+        batch_durations = time_calls(
+            lambda: image_generator.rasterizer.rasterize(batch, out),
+            max(args.iterations // args.batch_size, 10),
+        )
+        print_summary(
+            summarize(
+                "  Rasterizer, per stroke of a batch",
+                [duration / args.batch_size for duration in batch_durations],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Replays a drawing session through the render -> cache -> model path, with and without
+the ResultCache, and reports the hit ratio and the latency saved.
+
+The session is a JSON list of classify payloads, as sent by the frontend. Without one,
+a synthetic session is generated: new shapes, the same stroke sent again after an
+undo/redo, and shapes redrawn elsewhere on the board or at another size.
+
+Run from the backend directory:
+    python -m benchmarks.bench_result_cache [--session session.json]
+"""
+
+import argparse
+import json
+import time
+from typing import List
+
+import numpy as np
+from benchmarks.common import MODEL_INPUT_SIZE, stand_in_model_path
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.server.protocol import decode_stroke
+from whiteboard_ai.server.ResultCache import ResultCache
+
+
+def synthetic_session(length: int, seed: int = 0) -> List[Stroke]:
+    rng = np.random.default_rng(seed)
+    session: List[Stroke] = []
+    for _ in range(length):
+        action = rng.random()
+        if session and action < 0.25:
+            # Undo/redo sends the exact same stroke again
+            session.append(session[rng.integers(len(session))])
+        elif session and action < 0.4:
+            # The same shape, drawn elsewhere and bigger or smaller
+            points = session[rng.integers(len(session))].array
+            offset = rng.integers(-200, 200, 2)
+            session.append(Stroke.from_array(points * rng.choice([0.5, 2]) + offset))
+        else:
+            num_points = rng.integers(20, 300)
+            angles = np.linspace(0, 2 * np.pi, num_points)
+            radius = rng.uniform(50, 300, 2)
+            points = 600 + np.stack(
+                [radius[0] * np.cos(angles), radius[1] * np.sin(angles)], axis=1
+            )
+            points += rng.normal(0, 2, points.shape)
+            session.append(Stroke.from_array(points.astype(int)))
+    return session
+
+
+def replay(
+    session: List[Stroke],
+    image_generator: ImageGenerator,
+    model_loader: ModelLoader,
+    cache: ResultCache,
+) -> List[float]:
+    """Returns the latency of every request, in milliseconds"""
+    durations = []
+    for stroke in session:
+        start = time.perf_counter()
+        tensor = image_generator.render_array(stroke)
+        key = cache.key(tensor)
+        if cache.get(key) is None:
+            cache.put(key, model_loader.classify_array(tensor))
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument("--session", help="JSON list of classify payloads to replay")
+    parser.add_argument("--length", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.session:
+        with open(args.session) as session_file:
+            session = [decode_stroke(payload) for payload in json.load(session_file)]
+    else:
+        session = synthetic_session(args.length)
+
+    model_loader = ModelLoader(args.model or stand_in_model_path())
+    image_generator = ImageGenerator(dimensions=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    # Warm up the rendering and the model before timing anything
+    replay(session[:5], image_generator, model_loader, ResultCache(enabled=False))
+
+    uncached = replay(
+        session, image_generator, model_loader, ResultCache(enabled=False)
+    )
+    cache = ResultCache()
+    cached = replay(session, image_generator, model_loader, cache)
+
+    stats = cache.stats()
+    print(f"{len(session)} requests, hit ratio {stats['hit_ratio']:.1%}")
+    for name, durations in (("without cache", uncached), ("with cache", cached)):
+        print(
+            f"{name:<15} total {sum(durations):9.1f} ms"
+            f"   mean {np.mean(durations):7.3f} ms   p50 {np.percentile(durations, 50):7.3f} ms"
+        )
+    print(f"saved {sum(uncached) - sum(cached):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
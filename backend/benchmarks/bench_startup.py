@@ -0,0 +1,156 @@
+"""
+Measures how long a freshly started server takes to accept connections, to have its
+model ready, and to answer its first classification, with the model loaded in the
+background (the default) or before the server listens (--eager, like it used to).
+
+Needs the packages of requirements-bench.txt. Run from the backend directory:
+    python -m benchmarks.bench_startup [--model ../ai/save/final.keras]
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+
+def serve(port: int, model_path: str, eager: bool) -> None:
+    """Starts the server like main.py does"""
+    from whiteboard_ai.model.model import ModelLoader
+    from whiteboard_ai.server.WebsocketServer import WebSocketServer
+
+    model = ModelLoader(model_path, lazy=not eager)
+    WebSocketServer("127.0.0.1", port, model).run(log_level="warning")
+
+
+def ready_status(url: str):
+    """The status of the readiness route, None while the server does not listen"""
+    try:
+        return urllib.request.urlopen(f"{url}/ready", timeout=1).status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+async def first_classification(url: str, started: float, timeout: float) -> float:
+    """Connects as soon as possible and returns when the first answer arrived"""
+    import aiohttp
+    import socketio
+    from whiteboard_ai.server.protocol import encode_points
+
+    angles = np.linspace(0, 2 * np.pi, 100)
+    payload = encode_points(
+        np.stack([300 + 100 * np.cos(angles), 200 + 60 * np.sin(angles)], axis=1)
+    )
+
+    # Shared by the connection attempts, failed ones would leak their own
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() - started < timeout:
+            client = socketio.AsyncClient(reconnection=False, http_session=session)
+            responses: asyncio.Queue = asyncio.Queue()
+            client.on("classification", responses.put)
+            try:
+                await client.connect(url, transports=["websocket"])
+            except Exception:
+                await asyncio.sleep(0.05)
+                continue
+            try:
+                while time.perf_counter() - started < timeout:
+                    await client.emit("classify", payload)
+                    response = await responses.get()
+                    if "classification" in response:
+                        return time.perf_counter() - started
+                    # Not ready, the server refused the request
+                    await asyncio.sleep(0.05)
+            finally:
+                await client.disconnect()
+    raise TimeoutError("No classification before the timeout")
+
+
+def measure(port: int, model_path: str, eager: bool, timeout: float) -> dict:
+    url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "benchmarks.bench_startup"]
+    command += ["--serve", str(port), "--model", model_path]
+    if eager:
+        command.append("--eager")
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        listening = ready = None
+        while time.perf_counter() - started < timeout:
+            status = ready_status(url)
+            if status is not None and listening is None:
+                listening = time.perf_counter() - started
+            if status == 200:
+                ready = time.perf_counter() - started
+                break
+            time.sleep(0.02)
+
+        # A second server, the first classification includes the connection
+        process.terminate()
+        process.wait()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        first = asyncio.run(first_classification(url, started, timeout))
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"listening_s": listening, "ready_s": ready, "first_classification_s": first}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.model, args.eager)
+        return
+
+    from benchmarks.common import stand_in_model_path
+
+    model_path = args.model or stand_in_model_path()
+    import_time = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import time; start = time.perf_counter(); import main;"
+            " print(time.perf_counter() - start)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    print(f"import main: {float(import_time):.2f}s\n")
+
+    print(f"{'model':<12} {'listening':>10} {'ready':>10} {'first answer':>13}")
+    for eager in (True, False):
+        for _ in range(args.repeats):
+            result = measure(args.port, model_path, eager, args.timeout)
+            print(
+                f"{'eager' if eager else 'background':<12}"
+                f" {result['listening_s']:>9.2f}s {result['ready_s']:>9.2f}s"
+                f" {result['first_classification_s']:>12.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
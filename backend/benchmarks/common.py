@@ -0,0 +1,103 @@
+import math
+import os
+import tempfile
+import time
+from typing import Callable, List
+
+import numpy as np
+from whiteboard_ai.core.primitives.Stroke import Stroke
+
+MODEL_INPUT_SIZE = 70
+
+
+def build_stand_in_model(img_size: int = MODEL_INPUT_SIZE, num_classes: int = 4):
+    """
+    Builds a randomly initialized model with the same architecture as ai/final.py:build_model,
+    so benchmarks can run without the trained weights
+    """
+    import tensorflow as tf
+    from tensorflow.keras.layers import (
+        Activation,
+        BatchNormalization,
+        Conv2D,
+        Dense,
+        Dropout,
+        Flatten,
+        Input,
+        MaxPooling2D,
+    )
+
+    def mish(x):
+        return x * tf.math.tanh(tf.math.softplus(x))
+
+    input_img = Input(shape=(img_size, img_size, 1))
+    x = Conv2D(32, (3, 3), padding="same")(input_img)
+    x = BatchNormalization()(x)
+    x = Activation(mish)(x)
+    x = MaxPooling2D(pool_size=(2, 2))(x)
+    x = Dropout(0.25)(x)
+
+    for f in [32, 64, 64, 128, 128]:
+        x = Conv2D(f, (3, 3), padding="same")(x)
+        x = BatchNormalization()(x)
+        x = Activation(mish)(x)
+        if f in [64, 128]:
+            x = MaxPooling2D(pool_size=(2, 2))(x)
+            x = Dropout(0.25)(x)
+
+    x = Flatten()(x)
+    x = Dense(200)(x)
+    x = BatchNormalization()(x)
+    x = Activation(mish)(x)
+    x = Dropout(0.3)(x)
+    output = Dense(num_classes, activation="softmax")(x)
+
+    return tf.keras.models.Model(inputs=input_img, outputs=output)
+
+
+def stand_in_model_path(img_size: int = MODEL_INPUT_SIZE) -> str:
+    """Saves a stand-in model to a temporary .keras file, loadable by ModelLoader"""
+    path = os.path.join(tempfile.mkdtemp(), "stand_in.keras")
+    build_stand_in_model(img_size).save(path)
+    return path
+
+
+def sample_stroke(num_points: int = 200) -> Stroke:
+    """A hand-drawn looking ellipse, in browser coordinates"""
+    rng = np.random.default_rng(0)
+    angles = np.linspace(0, 2 * math.pi, num_points)
+    xs = 600 + 250 * np.cos(angles) + rng.normal(0, 2, num_points)
+    ys = 400 + 150 * np.sin(angles) + rng.normal(0, 2, num_points)
+    return Stroke.from_array(np.stack([xs, ys], axis=1).astype(int))
+
+
+def time_calls(
+    fn: Callable[[], object], iterations: int, warmup: int = 3
+) -> List[float]:
+    """Returns the duration of every call, in milliseconds"""
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summarize(name: str, durations: List[float]) -> dict:
+    return {
+        "name": name,
+        "iterations": len(durations),
+        "mean_ms": float(np.mean(durations)),
+        "p50_ms": float(np.percentile(durations, 50)),
+        "p99_ms": float(np.percentile(durations, 99)),
+    }
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        f"{summary['name']:<40} mean {summary['mean_ms']:8.3f} ms"
+        f"   p50 {summary['p50_ms']:8.3f} ms   p99 {summary['p99_ms']:8.3f} ms"
+    )
@@ -0,0 +1,406 @@
+"""
+Starts the WebSocketServer in a separate process and loads it with many concurrent
+socket.io clients, each sending classify requests at a target rate and waiting for their
+answer. For every concurrency level, reports the throughput, the p50/p95/p99 round-trip
+latency, the error rate, and the CPU and memory used by the server process and the
+processes it started.
+
+Sweeping concurrency levels gives the latency-vs-load curve, and shows where the server
+saturates. The result cache and the geometric fast path are disabled unless --cache
+and --fast-path are given, every request goes through the model.
+
+With --frontends, the server is a MultiProcessServer with that many front end processes
+and --inference-workers inference processes, run it with increasing numbers of front ends
+to see how the server scales across cores.
+
+Needs the packages of requirements-bench.txt. Run from the backend directory:
+    python -m benchmarks.load_test --clients 10 50 100 200 --duration 10 --rate 2
+    python -m benchmarks.load_test --clients 200 --frontends 4 --inference-workers 2
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+import urllib.request
+from typing import List, Optional
+
+import numpy as np
+import socketio
+from benchmarks.common import stand_in_model_path
+from benchmarks.strokes import synthetic_strokes
+from whiteboard_ai.server.protocol import encode_points
+
+
+def _serve(
+    port: int, model_path: str, executor_mode: str, cache: bool, fast_path: bool
+) -> None:
+    import logging
+
+    from whiteboard_ai.model.model import ModelLoader
+    from whiteboard_ai.server.WebsocketServer import WebSocketServer
+
+    logging.basicConfig(level="WARNING")
+    server = WebSocketServer(
+        "127.0.0.1",
+        port,
+        ModelLoader(model_path),
+        executor_mode=executor_mode,
+        cache_enabled=cache,
+        fast_path=fast_path,
+    )
+    server.run(log_level="warning")
+
+
+def _serve_multiprocess(
+    port: int,
+    model_path: str,
+    frontends: int,
+    inference_workers: int,
+    cache: bool,
+    fast_path: bool,
+) -> None:
+    import logging
+
+    from whiteboard_ai.server.MultiProcessServer import MultiProcessServer
+
+    logging.basicConfig(level="WARNING")
+    server = MultiProcessServer(
+        "127.0.0.1",
+        port,
+        model_path,
+        frontends=frontends,
+        inference_workers=inference_workers,
+        cache_enabled=cache,
+        fast_path=fast_path,
+    )
+    server.run(log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: multiprocessing.Process, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("The server exited while starting")
+        try:
+            # Answers 503, an OSError, until the model is loaded
+            urllib.request.urlopen(f"{url}/ready", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("The server did not start in time")
+
+
+class ProcessSampler:
+    """
+    Reads the CPU time and resident memory of a process and of the processes it started,
+    with psutil when installed and from /proc otherwise
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        try:
+            import psutil
+
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+        self._ticks = os.sysconf("SC_CLK_TCK") if self._process is None else 1
+
+    def pids(self) -> List[int]:
+        """The process and its descendants"""
+        if self._process is not None:
+            return [self.pid] + [child.pid for child in self._process.children(True)]
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children") as children:
+                    pids.extend(int(child) for child in children.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def cpu_seconds(self) -> float:
+        return sum(self._cpu_seconds(pid) for pid in self.pids())
+
+    def rss_bytes(self) -> int:
+        return sum(self._rss_bytes(pid) for pid in self.pids())
+
+    def _cpu_seconds(self, pid: int) -> float:
+        try:
+            if self._process is not None:
+                import psutil
+
+                times = psutil.Process(pid).cpu_times()
+                return times.user + times.system
+            with open(f"/proc/{pid}/stat") as stat:
+                # The command name may contain spaces, the fields start after it
+                fields = stat.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self._ticks
+        except (OSError, ImportError):
+            # Exited since it was listed
+            return 0.0
+
+    def _rss_bytes(self, pid: int) -> int:
+        try:
+            if self._process is not None:
+                import psutil
+
+                return psutil.Process(pid).memory_info().rss
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+
+class LoadLevel:
+    """
+    State shared by the clients of a concurrency level
+    """
+
+    def __init__(self, payloads: list, rate: float, timeout: float):
+        self.payloads = payloads
+        self.rate = rate
+        self.timeout = timeout
+        # Set once every client is connected, with the time the clients stop at
+        self.started = asyncio.Event()
+        self.stop_at = 0.0
+
+        # Clients connected, or that failed to
+        self.ready = 0
+
+        self.latencies: List[float] = []
+        self.errors: List[str] = []
+        self.sent = 0
+
+
+async def _client(url: str, level: LoadLevel, rng: np.random.Generator) -> None:
+    """
+    Sends classify requests one at a time, at most level.rate per second,
+    until the level ends
+    """
+    client = socketio.AsyncClient(reconnection=False)
+    responses: asyncio.Queue = asyncio.Queue()
+    client.on("classification", responses.put)
+
+    try:
+        await client.connect(url, transports=["websocket"])
+    except Exception as e:
+        level.errors.append(f"connect: {e}")
+        level.ready += 1
+        return
+
+    level.ready += 1
+    try:
+        await level.started.wait()
+        loop = asyncio.get_running_loop()
+        # Spread the clients over the first period, so they don't all send at once
+        next_send = loop.time() + rng.uniform(0, 1 / level.rate)
+        while next_send < level.stop_at:
+            await asyncio.sleep(max(0, next_send - loop.time()))
+            payload = level.payloads[rng.integers(len(level.payloads))]
+
+            sent_at = time.perf_counter()
+            await client.emit("classify", payload)
+            level.sent += 1
+            try:
+                response = await asyncio.wait_for(responses.get(), level.timeout)
+            except asyncio.TimeoutError:
+                # A late answer would be taken for the next one's, stop this client
+                level.errors.append("timeout")
+                return
+            level.latencies.append((time.perf_counter() - sent_at) * 1000)
+            if "error" in response:
+                level.errors.append(response["error"])
+
+            next_send = max(next_send + 1 / level.rate, loop.time())
+    finally:
+        await client.disconnect()
+
+
+async def run_level(
+    url: str,
+    sampler: ProcessSampler,
+    level: LoadLevel,
+    clients: int,
+    duration: float,
+    seed: int,
+) -> dict:
+    loop = asyncio.get_running_loop()
+    tasks = [
+        asyncio.create_task(_client(url, level, rng))
+        for rng in np.random.default_rng(seed).spawn(clients)
+    ]
+
+    # Wait for the clients to connect, connecting hundreds of them takes a while
+    while level.ready < clients:
+        await asyncio.sleep(0.05)
+
+    rss_samples = [sampler.rss_bytes()]
+    cpu_start = sampler.cpu_seconds()
+    wall_start = loop.time()
+    level.stop_at = wall_start + duration
+    level.started.set()
+
+    async def sample_memory():
+        while True:
+            await asyncio.sleep(0.5)
+            rss_samples.append(sampler.rss_bytes())
+
+    sampling = asyncio.create_task(sample_memory())
+    await asyncio.gather(*tasks)
+    sampling.cancel()
+    elapsed = loop.time() - wall_start
+    cpu = sampler.cpu_seconds() - cpu_start
+
+    latencies = np.array(level.latencies or [np.nan])
+    return {
+        "clients": clients,
+        "target_rate": clients * level.rate,
+        "sent": level.sent,
+        "completed": len(level.latencies),
+        "throughput": len(level.latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "errors": len(level.errors),
+        "error_rate": len(level.errors) / max(level.sent, 1),
+        "server_cpu": cpu / elapsed,
+        "server_rss_mb": max(rss_samples) / 2**20,
+    }
+
+
+def print_level(result: dict) -> None:
+    print(
+        f"{result['clients']:>7} {result['target_rate']:>9.1f} {result['throughput']:>9.1f}"
+        f" {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        f" {result['error_rate']:>7.1%} {result['server_cpu']:>6.0%}"
+        f" {result['server_rss_mb']:>8.0f}"
+    )
+
+
+async def sweep(args, url: str, sampler: ProcessSampler, payloads: list) -> list:
+    print(
+        f"{'clients':>7} {'target/s':>9} {'served/s':>9} {'p50 ms':>8} {'p95 ms':>8}"
+        f" {'p99 ms':>8} {'errors':>7} {'cpu':>6} {'rss MB':>8}"
+    )
+    results = []
+    for clients in args.clients:
+        level = LoadLevel(payloads, args.rate, args.timeout)
+        result = await run_level(url, sampler, level, clients, args.duration, args.seed)
+        print_level(result)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        nargs="+",
+        default=[10, 50, 100, 200],
+        help="Concurrency levels to sweep",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=2, help="Requests per second of every client"
+    )
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per level")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--session", help="JSON list of classify payloads to replay")
+    parser.add_argument("--points", type=int, default=200)
+    parser.add_argument("--executor", default="thread")
+    parser.add_argument(
+        "--frontends",
+        type=int,
+        help="Serve from a MultiProcessServer with this many front end processes",
+    )
+    parser.add_argument("--inference-workers", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="Enable the result cache")
+    parser.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Answer obvious lines and scribbles without the model",
+    )
+    parser.add_argument("--url", help="Load a running server instead of starting one")
+    parser.add_argument(
+        "--pid", type=int, help="Process id of the running server, needed with --url"
+    )
+    parser.add_argument("--output", help="Write the curve as JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.url and args.pid is None:
+        # Its CPU and memory could not be measured
+        parser.error("--pid is required with --url")
+
+    if args.session:
+        with open(args.session) as session_file:
+            payloads = json.load(session_file)
+    else:
+        payloads = [
+            encode_points(stroke.array)
+            for stroke in synthetic_strokes(200, args.points, args.seed)
+        ]
+
+    process: Optional[multiprocessing.Process] = None
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        model_path = args.model or stand_in_model_path()
+        # TensorFlow does not survive a fork
+        context = multiprocessing.get_context("spawn")
+        if args.frontends:
+            # Not a daemon, it starts its own processes
+            process = context.Process(
+                target=_serve_multiprocess,
+                args=(
+                    port,
+                    model_path,
+                    args.frontends,
+                    args.inference_workers,
+                    args.cache,
+                    args.fast_path,
+                ),
+            )
+        else:
+            process = context.Process(
+                target=_serve,
+                args=(port, model_path, args.executor, args.cache, args.fast_path),
+                daemon=True,
+            )
+        process.start()
+        pid = process.pid
+
+    try:
+        if process is not None:
+            _wait_until_up(url, process, timeout=120)
+        results = asyncio.run(sweep(args, url, ProcessSampler(pid), payloads))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"args": vars(args), "levels": results}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
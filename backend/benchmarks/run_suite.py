@@ -0,0 +1,155 @@
+"""
+Times the stages of the backend pipeline on synthetic strokes of every shape and size,
+and writes the results as JSON. Given a baseline written by an earlier run, reports
+how every benchmark changed and exits with an error if one got slower than the threshold.
+
+Run from the backend directory:
+    python -m benchmarks.run_suite --output results.json
+    python -m benchmarks.run_suite --output new.json --baseline results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+from benchmarks.common import (
+    MODEL_INPUT_SIZE,
+    print_summary,
+    stand_in_model_path,
+    summarize,
+    time_calls,
+)
+from benchmarks.strokes import SHAPES, synthetic_points
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.core.primitives.Point import Point
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.model.model import ModelLoader
+
+
+def run_benchmarks(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    image_generator = ImageGenerator(dimensions=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    model_loader = ModelLoader(args.model or stand_in_model_path())
+    model_loader.warmup()
+    image_path = os.path.join(tempfile.mkdtemp(), "gen_img.png")
+
+    results = {}
+
+    def record(name, fn, iterations=args.iterations):
+        summary = summarize(name, time_calls(fn, iterations))
+        print_summary(summary)
+        results[name] = summary
+
+    for shape in args.shapes:
+        for num_points in args.points:
+            points = synthetic_points(shape, num_points, rng)
+            point_list = [Point(int(x), int(y)) for x, y in points]
+            stroke = Stroke.from_array(points)
+            prefix = f"{shape}/{num_points}"
+
+            record(f"{prefix}/stroke_from_points", lambda: Stroke(point_list))
+            record(f"{prefix}/stroke_from_array", lambda: Stroke.from_array(points))
+            record(
+                f"{prefix}/scale_stroke", lambda: image_generator._scale_stroke(stroke)
+            )
+            record(
+                f"{prefix}/generate_image",
+                lambda: image_generator.generate_image(stroke),
+            )
+            record(
+                f"{prefix}/render_array", lambda: image_generator.render_array(stroke)
+            )
+
+        # Classifying does not depend on the number of points, once rendered
+        stroke = Stroke.from_array(synthetic_points(shape, args.points[0], rng))
+        image_generator.export_image(image_generator.generate_image(stroke), image_path)
+        tensor = image_generator.render_array(stroke)
+        record(
+            f"{shape}/classify",
+            lambda: model_loader.classify(image_path),
+            args.model_iterations,
+        )
+        record(
+            f"{shape}/classify_array",
+            lambda: model_loader.classify_array(tensor),
+            args.model_iterations,
+        )
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Prints the ratio of every p50 to the baseline's, returns the benchmarks slower than threshold
+    """
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p50_ms"], summary["p50_ms"]
+        ratio = after / before if before > 0 else float("inf")
+        flag = "  slower" if ratio > threshold else ""
+        print(f"{name:<40} {before:8.3f}ms {after:8.3f}ms {ratio:6.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--model", help="Trained .keras model, a stand-in is used if omitted"
+    )
+    parser.add_argument("--output", default="temp/benchmarks.json")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowest accepted ratio to the baseline's p50",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=SHAPES)
+    parser.add_argument("--points", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--model-iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    import tensorflow as tf
+
+    report = {
+        "metadata": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "tensorflow": tf.__version__,
+            "model": args.model or "stand-in",
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks slower than {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Seeded generator of hand-drawn looking strokes, in browser coordinates.
+
+Every shape is drawn at a random size, position and rotation, with a jittered pen:
+noisy ellipses, rectangles and triangles, and scribbles that random walk across the board.
+"""
+
+import math
+from typing import Iterable, List
+
+import numpy as np
+from whiteboard_ai.core.primitives.Stroke import Stroke
+
+SHAPES = ("ellipse", "rectangle", "triangle", "scribble")
+
+
+def _polygon(corners: np.ndarray, num_points: int) -> np.ndarray:
+    """Points evenly spaced along a closed polygon"""
+    closed = np.concatenate([corners, corners[:1]])
+    distances = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(closed, axis=0).T))])
+    targets = np.linspace(0, distances[-1], num_points)
+    return np.stack(
+        [
+            np.interp(targets, distances, closed[:, 0]),
+            np.interp(targets, distances, closed[:, 1]),
+        ],
+        axis=1,
+    )
+
+
+def synthetic_points(
+    shape: str, num_points: int, rng: np.random.Generator, noise: float = 2.0
+) -> np.ndarray:
+    """
+    Returns the (num_points, 2) integer coordinates of a stroke of the given shape
+    """
+    if num_points < 2:
+        raise ValueError("A stroke needs at least 2 points")
+
+    if shape == "scribble":
+        steps = rng.normal(0, 8, (num_points, 2))
+        # Smooth the random walk a little, pens don't change direction at every point
+        steps = np.cumsum(steps, axis=0) * 0.1 + steps
+        points = np.cumsum(steps, axis=0)
+    elif shape == "ellipse":
+        start = rng.uniform(0, 2 * math.pi)
+        angles = start + np.linspace(0, 2 * math.pi, num_points)
+        points = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    elif shape == "rectangle":
+        corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float64)
+        points = _polygon(corners, num_points)
+    elif shape == "triangle":
+        angles = math.pi / 2 + np.arange(3) * 2 * math.pi / 3
+        corners = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        points = _polygon(corners, num_points)
+    else:
+        raise ValueError(f"Unknown shape {shape}, expected one of {SHAPES}")
+
+    if shape != "scribble":
+        size = rng.uniform(40, 300, 2)
+        rotation = rng.uniform(0, 2 * math.pi)
+        rotate = np.array(
+            [
+                [math.cos(rotation), -math.sin(rotation)],
+                [math.sin(rotation), math.cos(rotation)],
+            ]
+        )
+        points = (points * size) @ rotate.T
+
+    points = points - points.min(axis=0) + rng.uniform(0, 800, 2)
+    points += rng.normal(0, noise, points.shape)
+    return np.round(points).astype(np.int64)
+
+
+def synthetic_line(
+    num_points: int, rng: np.random.Generator, noise: float = 2.0, bend: float = 0.0
+) -> np.ndarray:
+    """
+    Returns the (num_points, 2) integer coordinates of a straight line or an underline,
+    bowed by bend times its length
+    """
+    length = rng.uniform(40, 600)
+    t = np.linspace(0, 1, num_points)
+    points = np.stack([t * length, bend * length * np.sin(np.pi * t)], axis=1)
+    rotation = rng.uniform(0, 2 * math.pi)
+    rotate = np.array(
+        [
+            [math.cos(rotation), -math.sin(rotation)],
+            [math.sin(rotation), math.cos(rotation)],
+        ]
+    )
+    points = points @ rotate.T
+    points = points - points.min(axis=0) + rng.uniform(0, 800, 2)
+    points += rng.normal(0, noise, points.shape)
+    return np.round(points).astype(np.int64)
+
+
+def synthetic_strokes(
+    count: int,
+    num_points: int,
+    seed: int = 0,
+    shapes: Iterable[str] = SHAPES,
+) -> List[Stroke]:
+    """
+    Returns count strokes cycling through the shapes, the same ones for the same seed
+    """
+    rng = np.random.default_rng(seed)
+    shapes = list(shapes)
+    return [
+        Stroke.from_array(synthetic_points(shapes[i % len(shapes)], num_points, rng))
+        for i in range(count)
+    ]
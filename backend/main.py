@@ -1,11 +1,32 @@
+import logging
+
 from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.server.MultiProcessServer import MultiProcessServer
 from whiteboard_ai.server.WebsocketServer import WebSocketServer
+from whiteboard_ai.util.consts import (
+    INFERENCE_BACKEND,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    SERVE_MULTIPROCESS,
+)
 
-MODEL_PATH = "../ai/save/final.keras"
+# Saved by ai/final.py, and exported for the other inference backends by ai/export.py
+MODEL_PATHS = {
+    "keras": "../ai/save/final.keras",
+    "tflite": "../ai/save/final_int8.tflite",
+    "onnx": "../ai/save/final.onnx",
+}
 
 
 def main():
-    model = ModelLoader(MODEL_PATH)
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    model_path = MODEL_PATHS[INFERENCE_BACKEND]
+    if SERVE_MULTIPROCESS:
+        MultiProcessServer("localhost", 8765, model_path).run()
+        return
+
+    # Loaded in the background once the server listens
+    model = ModelLoader(model_path, lazy=True, backend=INFERENCE_BACKEND)
     server = WebSocketServer("localhost", 8765, model)
     server.run()
 
@@ -0,0 +1,185 @@
+from typing import Optional
+
+import numpy as np
+from whiteboard_ai.core.StrokePreprocessor import StrokePreprocessor
+from whiteboard_ai.util.consts import (
+    FAST_PATH_CORNER_ANGLE,
+    FAST_PATH_ENABLED,
+    FAST_PATH_LINE_ECCENTRICITY,
+    FAST_PATH_OPEN_DISTANCE,
+    FAST_PATH_SCRIBBLE_CORNERS,
+    FAST_PATH_SCRIBBLE_WINDING,
+    FAST_PATH_TOLERANCE,
+)
+
+
+class GeometricPreClassifier:
+    """
+    Recognizes the strokes that are obviously "other" from their geometry, before they
+    are rendered and classified by the model: straight lines, underlines and scribbles.
+
+    The shapes the model knows are closed, so only strokes whose ends are far apart
+    are considered, and of those only the ones that are nearly straight, or wind back
+    and forth. Every other stroke goes through the model, thresholds are set so that
+    none of the ellipses, rectangles and triangles of benchmarks/bench_fast_path.py
+    are answered here
+    """
+
+    RESULT = ("other", 1.0)
+
+    def __init__(
+        self,
+        enabled: bool = FAST_PATH_ENABLED,
+        open_distance: float = FAST_PATH_OPEN_DISTANCE,
+        line_eccentricity: float = FAST_PATH_LINE_ECCENTRICITY,
+        scribble_winding: float = FAST_PATH_SCRIBBLE_WINDING,
+        scribble_corners: int = FAST_PATH_SCRIBBLE_CORNERS,
+        tolerance: float = FAST_PATH_TOLERANCE,
+        corner_angle: float = FAST_PATH_CORNER_ANGLE,
+    ):
+        self.enabled = enabled
+        self.open_distance = open_distance
+        self.line_eccentricity = line_eccentricity
+        self.scribble_winding = scribble_winding
+        self.scribble_corners = scribble_corners
+        self.tolerance = tolerance
+        self.corner_angle = corner_angle
+
+        self.checked = 0
+        # Strokes answered without the model, by reason
+        self.hits = {"line": 0, "scribble": 0}
+
+    def features(self, points: np.ndarray) -> Optional[dict[str, float]]:
+        """
+        Describes an (N, 2) array of coordinates, independently of its size:
+
+        - closure, the distance between both ends, relative to the diagonal of the stroke
+        - eccentricity, of the ellipse fitted to the points by PCA,
+          0 for a circle and 1 for a line
+        - winding, the length of the stroke relative to the perimeter of its convex hull,
+          about 1 for a convex shape, 0.5 for a line, more for strokes going back and forth
+        - corners, the number of sharp turns
+
+        Returns None for strokes without an extent
+        """
+        points = np.asarray(points, dtype=np.float32)
+        diagonal = self._diagonal(points)
+        if diagonal == 0:
+            return None
+        winding, corners = self._outline(points, diagonal)
+        return {
+            "closure": self._closure(points, diagonal),
+            "eccentricity": self._eccentricity(points),
+            "winding": winding,
+            "corners": corners,
+        }
+
+    def reason(self, features: Optional[dict[str, float]]) -> Optional[str]:
+        """Why a stroke with these features is "other", None if the model must decide"""
+        if features is None or features["closure"] < self.open_distance:
+            return None
+        if features["eccentricity"] >= self.line_eccentricity:
+            return "line"
+        if (
+            features["winding"] >= self.scribble_winding
+            or features["corners"] >= self.scribble_corners
+        ):
+            return "scribble"
+        return None
+
+    def check(self, points: np.ndarray) -> Optional[str]:
+        """
+        Why an (N, 2) array of coordinates is obviously "other", "line" or "scribble",
+        and None for the strokes the model must classify.
+        Same as reason(features(points)), the features are only computed when needed
+        """
+        if not self.enabled:
+            return None
+
+        self.checked += 1
+        points = np.asarray(points, dtype=np.float32)
+        diagonal = self._diagonal(points)
+        # Most strokes are closed shapes, and stop here
+        if diagonal == 0 or self._closure(points, diagonal) < self.open_distance:
+            return None
+
+        if self._eccentricity(points) >= self.line_eccentricity:
+            reason = "line"
+        else:
+            winding, corners = self._outline(points, diagonal)
+            if winding < self.scribble_winding and corners < self.scribble_corners:
+                return None
+            reason = "scribble"
+        self.hits[reason] += 1
+        return reason
+
+    def classify(self, points: np.ndarray) -> Optional[tuple[str, float]]:
+        """The result of a stroke that is obviously "other", None for the others"""
+        return None if self.check(points) is None else self.RESULT
+
+    @staticmethod
+    def _diagonal(points: np.ndarray) -> float:
+        if len(points) < 2:
+            return 0.0
+        return float(np.hypot(*(points.max(axis=0) - points.min(axis=0))))
+
+    @staticmethod
+    def _closure(points: np.ndarray, diagonal: float) -> float:
+        return float(np.hypot(*(points[-1] - points[0]))) / diagonal
+
+    @staticmethod
+    def _eccentricity(points: np.ndarray) -> float:
+        centered = points - points.mean(axis=0)
+        minor, major = np.linalg.eigvalsh(centered.T @ centered)
+        return float(np.sqrt(max(0.0, 1 - minor / major))) if major > 0 else 0.0
+
+    def _outline(self, points: np.ndarray, diagonal: float) -> tuple[float, int]:
+        """
+        The winding and corners, measured on the stroke simplified to a fraction
+        of its diagonal, the jitter of the pen is not a corner
+        """
+        simplified = StrokePreprocessor.simplify(points, self.tolerance * diagonal)
+        steps = np.diff(simplified, axis=0)
+        length = np.hypot(*steps.T).sum()
+        perimeter = self._hull_perimeter(simplified)
+        winding = float(length / perimeter) if perimeter > 0 else 0.0
+
+        directions = np.arctan2(steps[:, 1], steps[:, 0])
+        turns = np.abs((np.diff(directions) + np.pi) % (2 * np.pi) - np.pi)
+        corners = int(np.count_nonzero(turns > np.radians(self.corner_angle)))
+        return winding, corners
+
+    @staticmethod
+    def _hull_perimeter(points: np.ndarray) -> float:
+        """
+        Perimeter of the convex hull, by Andrew's monotone chain. Only called on
+        simplified strokes, a few dozen points at most
+        """
+        points = np.unique(points, axis=0)
+        if len(points) < 2:
+            return 0.0
+
+        def half(ordered):
+            hull = []
+            for point in ordered:
+                while len(hull) >= 2:
+                    (ax, ay), (bx, by) = hull[-2], hull[-1]
+                    if (bx - ax) * (point[1] - ay) - (by - ay) * (point[0] - ax) > 0:
+                        break
+                    hull.pop()
+                hull.append(point)
+            return hull
+
+        # np.unique sorts by x, then y
+        ordered = points.tolist()
+        hull = np.array(half(ordered)[:-1] + half(ordered[::-1])[:-1])
+        return float(np.hypot(*(np.roll(hull, -1, axis=0) - hull).T).sum())
+
+    def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        return {
+            "enabled": self.enabled,
+            "checked": self.checked,
+            "hits": dict(self.hits),
+            "hit_ratio": hits / self.checked if self.checked else 0.0,
+        }
@@ -1,8 +1,10 @@
 import os
-from typing import Tuple
+from typing import List, Optional, Tuple
 
-from PIL import Image, ImageDraw
-from whiteboard_ai.core.primitives.Point import Point
+import numpy as np
+from PIL import Image, ImageColor
+from whiteboard_ai.core.Rasterizer import Rasterizer
+from whiteboard_ai.core.StrokePreprocessor import StrokePreprocessor
 from whiteboard_ai.core.primitives.Stroke import Stroke
 from whiteboard_ai.util.consts import (
     GEN_IMG_BG_COLOR,
@@ -11,7 +13,9 @@ from whiteboard_ai.util.consts import (
     GEN_IMG_STROKE_COLOR,
     GEN_IMG_STROKE_WIDTH,
     GEN_IMG_WIDTH,
+    PREPROCESS_STROKES,
 )
+from whiteboard_ai.util.metrics import metrics
 
 
 class ImageGenerator:
@@ -21,56 +25,111 @@ class ImageGenerator:
         background_color: str = GEN_IMG_BG_COLOR,
         stroke_color: str = GEN_IMG_STROKE_COLOR,
         stroke_width: int = GEN_IMG_STROKE_WIDTH,
+        preprocess: bool = PREPROCESS_STROKES,
     ):
 
         self.dimensions = dimensions
         self.background_color = background_color
         self.stroke_color = stroke_color
         self.stroke_width = stroke_width
+        self.rasterizer = Rasterizer(dimensions, stroke_width)
+        self.preprocessor = StrokePreprocessor() if preprocess else None
+
+    def _scale_transform(
+        self, points: np.ndarray
+    ) -> Tuple[np.ndarray, float, np.ndarray]:
+        """
+        Returns the origin, scale factor and translation adapting the points
+        to the model's input dimensions
+        """
+        min_point = points.min(axis=0)
+        size = points.max(axis=0) - min_point
+        dimensions = np.array(self.dimensions, dtype=np.float64)
+
+        target_size = dimensions - GEN_IMG_PADDING
+        scale_factor = (target_size / (size + 1)).min()  # Avoid division by zero
+        translate = (dimensions - size * scale_factor) / 2
+
+        return min_point, scale_factor, translate
+
+    def _scale_array(self, points: np.ndarray) -> np.ndarray:
+        """
+        Scales an (N, 2) array of coordinates to adapt it to the model's input dimensions
+        """
+        # Computed in double precision, the rasterizer truncates the coordinates
+        points = np.asarray(points, dtype=np.float64)
+        min_point, scale_factor, translate = self._scale_transform(points)
+        return (points - min_point) * scale_factor + translate
 
     def _scale_stroke(self, stroke) -> Stroke:
         """
         Scales the stroke to adapt it to the model's input dimensions
         """
-        points = list(stroke)
-        max_x = max(point.x for point in points)
-        max_y = max(point.y for point in points)
-        min_x = min(point.x for point in points)
-        min_y = min(point.y for point in points)
-
-        target_width = self.dimensions[0] - GEN_IMG_PADDING
-        target_height = self.dimensions[1] - GEN_IMG_PADDING
-
-        scale_x = target_width / (max_x - min_x + 1)  # Avoid division by zero
-        scale_y = target_height / (max_y - min_y + 1)
-        scale_factor = min(scale_x, scale_y)
-
-        translate_x = (self.dimensions[0] - (max_x - min_x) * scale_factor) / 2
-        translate_y = (self.dimensions[1] - (max_y - min_y) * scale_factor) / 2
-
-        scaled_points = [
-            Point(
-                (point.x - min_x) * scale_factor + translate_x,
-                (point.y - min_y) * scale_factor + translate_y,
-            )
-            for point in points
-        ]
+        return Stroke.from_array(self._scale_array(stroke.array))
+
+    def _scaled_polylines(self, strokes: List[Stroke]) -> List[np.ndarray]:
+        polylines = []
+        for stroke in strokes:
+            if len(stroke) < 2:
+                # Nothing to draw
+                polylines.append(np.empty((0, 2)))
+                continue
+
+            points = stroke.array.astype(np.float64)
+            # The transform is computed on the raw stroke, so preprocessing can't change it
+            min_point, scale_factor, translate = self._scale_transform(points)
+            if self.preprocessor is not None:
+                points = self.preprocessor.process(points, pixel_size=1 / scale_factor)
 
-        return Stroke(scaled_points)
+            polylines.append((points - min_point) * scale_factor + translate)
+        return polylines
 
     def generate_image(self, stroke):
-        image = Image.new("RGB", self.dimensions, self.background_color)
-        draw = ImageDraw.Draw(image)
+        mask = self.rasterizer.rasterize(
+            self._scaled_polylines([stroke]), background=0, ink=1
+        )[0].astype(bool)
 
-        if len(stroke) > 1:
-            scaled_stroke = self._scale_stroke(stroke)
-            scaled_points = [(point.x, point.y) for point in scaled_stroke]
-            draw.line(scaled_points, fill=self.stroke_color, width=self.stroke_width)
+        background = ImageColor.getrgb(self.background_color)[:3]
+        stroke_color = ImageColor.getrgb(self.stroke_color)[:3]
+        pixels = np.where(mask[:, :, None], stroke_color, background).astype(np.uint8)
+        return Image.fromarray(pixels)
 
-        return image
+    def render_array(self, stroke) -> np.ndarray:
+        """
+        Renders the stroke straight to the model's input tensor, without going through the disk.
+        The result is a normalized float32 array of shape (1, height, width, 1)
+        """
+        return self.render_batch([stroke])
+
+    def render_batch(
+        self, strokes: List[Stroke], out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Renders every stroke to a normalized float32 array of shape (len(strokes), height, width, 1),
+        in a single call. A preallocated (len(strokes), height, width) buffer can be given with out
+        """
+        # Draw in grayscale directly, this is what the model expects anyway
+        background = ImageColor.getcolor(self.background_color, "L") / 255.0
+        ink = ImageColor.getcolor(self.stroke_color, "L") / 255.0
+
+        with metrics.time("scale"):
+            polylines = self._scaled_polylines(strokes)
+        with metrics.time("rasterize"):
+            images = self.rasterizer.rasterize(
+                polylines, out, background=background, ink=ink
+            )
+        return images.reshape(len(strokes), self.dimensions[1], self.dimensions[0], 1)
 
     def export_image(self, image: Image.Image, path: str = "temp/gen_img.png"):
         # Ensure the directory exists
         os.makedirs(os.path.dirname(path), exist_ok=True)
         image.save(path)
         return path
+
+    def export_array(self, array: np.ndarray, path: str = "temp/loaded_img.png"):
+        """
+        Exports a tensor produced by render_array, for debugging purposes
+        """
+        pixels = np.rint(array.reshape(array.shape[-3], array.shape[-2]) * 255.0)
+        image = Image.fromarray(pixels.astype(np.uint8))
+        return self.export_image(image, path)
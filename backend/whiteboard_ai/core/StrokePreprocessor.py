@@ -0,0 +1,132 @@
+import numpy as np
+from whiteboard_ai.util.consts import PREPROCESS_SPACING, PREPROCESS_TOLERANCE
+
+
+class StrokePreprocessor:
+    """
+    Reduces the number of points of a stroke before it is rendered, without visibly changing it.
+
+    Fast mice and tablets send many nearly identical points, that cost time to draw
+    but add nothing once the stroke is scaled down to the generated image size.
+    Distances are given in pixels of the generated image, the caller provides the size
+    of such a pixel in the stroke's own coordinates
+    """
+
+    def __init__(
+        self,
+        spacing: float = PREPROCESS_SPACING,
+        tolerance: float = PREPROCESS_TOLERANCE,
+    ):
+        self.spacing = spacing
+        self.tolerance = tolerance
+
+    def process(self, points: np.ndarray, pixel_size: float = 1.0) -> np.ndarray:
+        """
+        Deduplicates, resamples and simplifies an (N, 2) array of coordinates
+        """
+        points = np.asarray(points, dtype=np.float64)
+        points = self.deduplicate(points)
+        points = self.resample(points, self.spacing * pixel_size)
+        return self.simplify(points, self.tolerance * pixel_size)
+
+    @staticmethod
+    def deduplicate(points: np.ndarray) -> np.ndarray:
+        """
+        Removes the points identical to the one before them
+        """
+        if len(points) < 2:
+            return points
+        moved = np.any(points[1:] != points[:-1], axis=1)
+        return points[np.concatenate([[True], moved])]
+
+    @staticmethod
+    def resample(points: np.ndarray, spacing: float) -> np.ndarray:
+        """
+        Replaces the points by points evenly spaced along the stroke, keeping both ends.
+        Points are never added, the stroke is left as is when it would get more points
+        """
+        if len(points) < 3 or spacing <= 0:
+            return points
+
+        steps = np.hypot(*np.diff(points, axis=0).T)
+        distances = np.concatenate([[0], np.cumsum(steps)])
+        length = distances[-1]
+
+        # Number of points before the end
+        count = int(np.ceil(length / spacing))
+        if count + 1 >= len(points):
+            return points
+
+        targets = np.append(np.arange(count) * spacing, length)
+        return np.stack(
+            [
+                np.interp(targets, distances, points[:, 0]),
+                np.interp(targets, distances, points[:, 1]),
+            ],
+            axis=1,
+        )
+
+    @staticmethod
+    def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+        """
+        Ramer-Douglas-Peucker simplification, every removed point is within
+        tolerance of the simplified stroke.
+        All the ranges of a level of the recursion are split together
+        """
+        if len(points) < 3 or tolerance <= 0:
+            return points
+
+        xs = np.ascontiguousarray(points[:, 0])
+        ys = np.ascontiguousarray(points[:, 1])
+        keep = np.zeros(len(points), dtype=bool)
+        keep[0] = keep[-1] = True
+
+        starts = np.array([0])
+        ends = np.array([len(points) - 1])
+        while len(starts):
+            # Every inner point of every range, the ranges are never empty
+            sizes = ends - starts - 1
+            range_starts = np.cumsum(sizes) - sizes
+            owners = np.repeat(np.arange(len(starts)), sizes)
+            inner = np.arange(sizes.sum()) + np.repeat(starts + 1 - range_starts, sizes)
+
+            chord_x = xs[ends] - xs[starts]
+            chord_y = ys[ends] - ys[starts]
+            chord_length = np.hypot(chord_x, chord_y)
+            offset_x = xs[inner] - np.repeat(xs[starts], sizes)
+            offset_y = ys[inner] - np.repeat(ys[starts], sizes)
+
+            closed = chord_length == 0
+            chord_length[closed] = 1
+            distances = np.abs(
+                np.repeat(chord_x / chord_length, sizes) * offset_y
+                - np.repeat(chord_y / chord_length, sizes) * offset_x
+            )
+            if closed.any():
+                # Closed strokes measure the distance to the point itself
+                around_point = np.repeat(closed, sizes)
+                distances[around_point] = np.hypot(
+                    offset_x[around_point], offset_y[around_point]
+                )
+
+            # Farthest point of every range, the first one on ties
+            farthest = np.maximum.reduceat(distances, range_starts)
+            candidates = np.flatnonzero(distances == np.repeat(farthest, sizes))
+            first = candidates[
+                np.concatenate(
+                    [[True], owners[candidates[1:]] != owners[candidates[:-1]]]
+                )
+            ]
+            split, split_owner = inner[first], owners[first]
+
+            kept = farthest[split_owner] > tolerance
+            split, split_owner = split[kept], split_owner[kept]
+            keep[split] = True
+
+            # Both halves of every split range are simplified on the next level
+            starts = np.concatenate([starts[split_owner], split])
+            ends = np.concatenate([split, ends[split_owner]])
+            long_enough = ends - starts > 1
+            starts, ends = starts[long_enough], ends[long_enough]
+
+        return points[keep]
@@ -1,4 +1,6 @@
 class Point:
+    __slots__ = ("x", "y")
+
     def __init__(self, x: int, y: int) -> None:
         self.x = x
         self.y = y
@@ -1,11 +1,41 @@
-from typing import Iterator, List
+from typing import Iterator, List, Union
 
+import numpy as np
 from whiteboard_ai.core.primitives.Point import Point
 
 
 class Stroke:
+    """
+    A stroke is backed by a contiguous (N, 2) float32 array of x, y coordinates.
+    Points are only created when the stroke is indexed or iterated over
+    """
+
     def __init__(self, points: List[Point]) -> None:
-        self.points = points
+        self.array = np.array(
+            [(point.x, point.y) for point in points], dtype=np.float32
+        ).reshape(-1, 2)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "Stroke":
+        """
+        Builds a stroke from an (N, 2) array of x, y coordinates, without copying it
+        if it already is a contiguous float32 array
+        """
+        stroke = cls.__new__(cls)
+        stroke.array = np.ascontiguousarray(array, dtype=np.float32).reshape(-1, 2)
+        return stroke
+
+    @classmethod
+    def from_buffer(cls, buffer, dtype=np.float32) -> "Stroke":
+        """
+        Builds a stroke from a buffer of interleaved x, y coordinates of the given dtype.
+        Float32 buffers are used as is, without copying them, and stay read-only if they were
+        """
+        return cls.from_array(np.frombuffer(buffer, dtype=dtype))
+
+    @property
+    def points(self) -> List[Point]:
+        return list(self)
 
     def __str__(self) -> str:
         return f"Stroke({self.points})"
@@ -14,13 +44,16 @@ class Stroke:
         return f"Stroke({self.points})"
 
     def __len__(self) -> int:
-        return len(self.points)
+        return len(self.array)
 
-    def __getitem__(self, item: int) -> Point:
-        return self.points[item]
+    def __getitem__(self, item: Union[int, slice]) -> Union[Point, "Stroke"]:
+        if isinstance(item, slice):
+            return Stroke.from_array(self.array[item])
+        x, y = self.array[item].tolist()
+        return Point(x, y)
 
     def __setitem__(self, key: int, value: Point) -> None:
-        self.points[key] = value
+        self.array[key] = (value.x, value.y)
 
     def __iter__(self) -> Iterator[Point]:
-        return iter(self.points)
+        return (Point(x, y) for x, y in self.array.tolist())
@@ -0,0 +1,223 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+import numpy as np
+from whiteboard_ai.util.consts import (
+    INFERENCE_COMPILED,
+    INFERENCE_JIT_COMPILE,
+    INFERENCE_NUM_THREADS,
+)
+
+INFERENCE_BACKENDS = ("keras", "tflite", "onnx")
+
+
+class InferenceBackend(ABC):
+    """
+    Runs the forward pass of the model, on batches of normalized images
+    of shape (N, height, width, 1).
+
+    The runtime is only imported by load(), so the server never imports a runtime it does
+    not use. Batches are already padded to one of a few sizes by ModelLoader.
+    A backend missing any of the methods below can not be built
+    """
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    @property
+    @abstractmethod
+    def loaded(self) -> bool:
+        """Whether load() made the model usable"""
+
+    @property
+    @abstractmethod
+    def input_shape(self) -> Tuple[int, ...]:
+        """Shape of a single image, without the batch dimension"""
+
+    @abstractmethod
+    def load(self) -> None:
+        """Imports the runtime and loads the model"""
+
+    @abstractmethod
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        """Returns the class probabilities of every image"""
+
+
+class KerasBackend(InferenceBackend):
+    """
+    The .keras model saved by ai/final.py, run by TensorFlow.
+    Compiled, it is called through a tf.function instead of model.predict
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        compiled: bool = INFERENCE_COMPILED,
+        jit_compile: bool = INFERENCE_JIT_COMPILE,
+    ):
+        super().__init__(model_path)
+        self.compiled = compiled
+        self.jit_compile = jit_compile
+        self.model = None
+        self._infer = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    @property
+    def input_shape(self) -> Tuple[int, ...]:
+        return tuple(self.model.input_shape[1:])
+
+    def load(self) -> None:
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(self.model_path)
+        if self.compiled:
+            input_shape = model.input_shape[1:]
+            self._infer = tf.function(
+                lambda images: model(images, training=False),
+                input_signature=[tf.TensorSpec((None, *input_shape), tf.float32)],
+                jit_compile=self.jit_compile,
+            )
+        # Only marked as loaded once usable
+        self.model = model
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        if self._infer is None:
+            return self.model.predict(images, verbose=0)
+        return self._infer(images).numpy()
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    A .tflite model exported by ai/export.py, float or int8 quantized.
+
+    Runs with the standalone LiteRT interpreter when it is installed, which does not need
+    TensorFlow at all. Interpreters have a fixed batch size and are not thread safe,
+    every batch size gets its own interpreter, used by one thread at a time
+    """
+
+    def __init__(
+        self, model_path: str, num_threads: Optional[int] = INFERENCE_NUM_THREADS
+    ):
+        super().__init__(model_path)
+        self.num_threads = num_threads
+        self._interpreter_class = None
+        self._input_shape: Optional[Tuple[int, ...]] = None
+        self._interpreters: dict = {}
+        self._interpreters_lock = threading.Lock()
+
+    @staticmethod
+    def _import_interpreter():
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+
+                Interpreter = tf.lite.Interpreter
+        return Interpreter
+
+    @property
+    def loaded(self) -> bool:
+        return self._input_shape is not None
+
+    @property
+    def input_shape(self) -> Tuple[int, ...]:
+        return self._input_shape
+
+    def load(self) -> None:
+        self._interpreter_class = self._import_interpreter()
+        interpreter = self._interpreter_class(
+            model_path=self.model_path, num_threads=self.num_threads
+        )
+        input_details = interpreter.get_input_details()[0]
+        self._input_shape = tuple(int(size) for size in input_details["shape"][1:])
+
+    def _interpreter(self, batch_size: int) -> Tuple[object, threading.Lock]:
+        with self._interpreters_lock:
+            if batch_size not in self._interpreters:
+                interpreter = self._interpreter_class(
+                    model_path=self.model_path, num_threads=self.num_threads
+                )
+                input_index = interpreter.get_input_details()[0]["index"]
+                interpreter.resize_tensor_input(
+                    input_index, [batch_size, *self._input_shape]
+                )
+                interpreter.allocate_tensors()
+                self._interpreters[batch_size] = (interpreter, threading.Lock())
+            return self._interpreters[batch_size]
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        interpreter, lock = self._interpreter(len(images))
+        with lock:
+            interpreter.set_tensor(interpreter.get_input_details()[0]["index"], images)
+            interpreter.invoke()
+            # Copied, the interpreter reuses its output buffer on the next call
+            return interpreter.get_tensor(
+                interpreter.get_output_details()[0]["index"]
+            ).copy()
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    A .onnx model exported by ai/export.py, run by ONNX Runtime on the CPU.
+    Sessions accept any batch size and can be called from several threads
+    """
+
+    def __init__(
+        self, model_path: str, num_threads: Optional[int] = INFERENCE_NUM_THREADS
+    ):
+        super().__init__(model_path)
+        self.num_threads = num_threads
+        self._session = None
+        self._input_name: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._session is not None
+
+    @property
+    def input_shape(self) -> Tuple[int, ...]:
+        return tuple(self._session.get_inputs()[0].shape[1:])
+
+    def load(self) -> None:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if self.num_threads is not None:
+            options.intra_op_num_threads = self.num_threads
+        session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self._input_name = session.get_inputs()[0].name
+        self._session = session
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: images})[0]
+
+
+def create_backend(
+    backend: str,
+    model_path: str,
+    compiled: bool = INFERENCE_COMPILED,
+    jit_compile: bool = INFERENCE_JIT_COMPILE,
+    num_threads: Optional[int] = INFERENCE_NUM_THREADS,
+) -> InferenceBackend:
+    """
+    Returns the backend of the given name. compiled and jit_compile only apply to keras,
+    num_threads to the others
+    """
+    if backend == "keras":
+        return KerasBackend(model_path, compiled, jit_compile)
+    if backend == "tflite":
+        return TFLiteBackend(model_path, num_threads)
+    if backend == "onnx":
+        return OnnxBackend(model_path, num_threads)
+    raise ValueError(
+        f"Unknown inference backend {backend}, expected one of {INFERENCE_BACKENDS}"
+    )
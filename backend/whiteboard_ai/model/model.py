@@ -1,30 +1,139 @@
-import cv2
+import logging
+import threading
+
 import numpy as np
-import tensorflow as tf
+from whiteboard_ai.model.backends import create_backend
+from whiteboard_ai.util.consts import (
+    BATCH_MAX_SIZE,
+    INFERENCE_BACKEND,
+    INFERENCE_COMPILED,
+    INFERENCE_JIT_COMPILE,
+)
+
+logger = logging.getLogger(__name__)
 
 CLASSES = {0: "other", 1: "ellipse", 2: "rectangle", 3: "triangle"}
 
 
 class ModelLoader:
-    def __init__(self, model_path: str):
-        self.model = tf.keras.models.load_model(model_path)
+    """
+    Loads the model with one of the inference backends, and classifies images with it.
+
+    The backend's runtime is only imported when the model is loaded. With lazy set, nothing
+    is loaded until load() is called, or until the first prediction, so the server can start
+    listening before the model is ready
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        compiled: bool = INFERENCE_COMPILED,
+        jit_compile: bool = INFERENCE_JIT_COMPILE,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        lazy: bool = False,
+        backend: str = INFERENCE_BACKEND,
+    ):
+        self.model_path = model_path
+        self.backend_name = backend
+        self.backend = create_backend(backend, model_path, compiled, jit_compile)
+        self.max_batch_size = max_batch_size
+
+        # Batches are padded to the next power of two, so only a few shapes ever get compiled
+        self.batch_sizes = sorted(
+            {min(2**i, max_batch_size) for i in range(max_batch_size.bit_length() + 1)}
+        )
+
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    @property
+    def loaded(self) -> bool:
+        return self.backend.loaded
+
+    def load(self) -> None:
+        """
+        Loads the model, and warms up the backend.
+        Does nothing if it is already loaded, can be called from any thread
+        """
+        with self._load_lock:
+            if self.backend.loaded:
+                return
+            self.backend.load()
+            # Pay the tracing and allocation cost now, not on the first request
+            self.warmup()
+
+    def warmup(self) -> None:
+        """
+        Runs the backend once for every batch size it can be called with
+        """
+        input_shape = self.backend.input_shape
+        for batch_size in self.batch_sizes:
+            self.backend.predict(np.zeros((batch_size, *input_shape), np.float32))
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        """
+        Returns the class probabilities of a batch of normalized images
+        """
+        if not self.backend.loaded:
+            self.load()
+
+        images = np.asarray(images, dtype=np.float32)
+        count = len(images)
+        if count > self.max_batch_size:
+            return np.concatenate(
+                [
+                    self.predict(images[start : start + self.max_batch_size])
+                    for start in range(0, count, self.max_batch_size)
+                ]
+            )
+
+        # Pad the batch with blank images up to the closest compiled batch size
+        batch_size = next(size for size in self.batch_sizes if size >= count)
+        if batch_size > count:
+            padding = np.zeros((batch_size - count, *images.shape[1:]), np.float32)
+            images = np.concatenate([images, padding])
+
+        return self.backend.predict(images)[:count]
 
     def classify(self, image_path: str) -> tuple[str, float]:
+        # Only needed to read images from the disk, which the server never does
+        import cv2
+
         image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        # Export image to check
-        cv2.imwrite("temp/loaded_img.png", image)
 
         # Normalize image and expand dimensions
         image = image / 255.0
-        image_expanded = np.expand_dims(image, axis=[0, -1])
+        image_expanded = np.expand_dims(image, axis=[0, -1]).astype(np.float32)
+
+        return self.classify_array(image_expanded)
 
-        predictions = self.model.predict(image_expanded)
+    def classify_array(self, image: np.ndarray) -> tuple[str, float]:
+        """
+        Classifies an already normalized image tensor of shape (1, height, width, 1),
+        as produced by ImageGenerator.render_array
+        """
+        return self.classify_batch(image)[0]
 
-        class_id = np.argmax(predictions, axis=1)[0]
-        likelihood = predictions[0][class_id]
+    def classify_batch(self, images: np.ndarray) -> list[tuple[str, float]]:
+        """
+        Classifies a batch of normalized image tensors of shape (N, height, width, 1)
+        in a single forward pass. Results are returned in the same order as the images
+        """
+        return to_classifications(self.predict(images))
 
+
+def to_classifications(predictions: np.ndarray) -> list[tuple[str, float]]:
+    """
+    Returns the most likely class of every row of class probabilities, and its likelihood
+    """
+    results = []
+    for class_id, prediction in zip(np.argmax(predictions, axis=1), predictions):
+        likelihood = prediction[class_id]
         class_name = CLASSES[class_id]
 
-        print(f"Predicted class: {class_name}, Likelihood: {likelihood}")
+        logger.debug("Predicted class: %s, Likelihood: %s", class_name, likelihood)
+
+        results.append((class_name, float(likelihood)))
 
-        return class_name, float(likelihood)
+    return results
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+from whiteboard_ai.server.PipelineExecutor import PipelineExecutor
+from whiteboard_ai.util.consts import BATCH_MAX_SIZE, BATCH_WINDOW_MS
+from whiteboard_ai.util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Collects the images submitted by every client for a short window,
+    and classifies them together in a single forward pass of the model
+    """
+
+    def __init__(
+        self,
+        executor: PipelineExecutor,
+        window_ms: float = BATCH_WINDOW_MS,
+        max_batch_size: int = BATCH_MAX_SIZE,
+    ):
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        # Number of batches that were run, for every batch size
+        self.batch_size_histogram: Counter[int] = Counter()
+
+        self._queue: asyncio.Queue[Tuple[np.ndarray, asyncio.Future]] = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running_batches: Set[asyncio.Task] = set()
+
+    async def classify(self, tensor: np.ndarray) -> tuple[str, float]:
+        """
+        Queues a (1, height, width, 1) tensor for the next batch and waits for its result
+        """
+        # The worker is started lazily, on the event loop serving the requests
+        if self._worker is None or self._worker.done():
+            self._slots = asyncio.Semaphore(self.executor.max_workers)
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        # From the submission to the result, waiting for the batch included
+        with metrics.time("batch_wait"):
+            await self._queue.put((tensor, future))
+            return await future
+
+    async def close(self) -> None:
+        """
+        Stops the worker and the batches running, the images still waiting for their
+        results are cancelled. The worker starts again on the next classify
+        """
+        tasks = [task for task in [self._worker, *self._running_batches] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker = None
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "pending": self._queue.qsize(),
+            "running_batches": len(self._running_batches),
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+        }
+
+    async def _collect_batch(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+
+        # Wait as long as needed for the first request, then give the others a short window
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            except asyncio.CancelledError:
+                # Closed while collecting, the batch will never run
+                for _, future in batch:
+                    future.cancel()
+                raise
+
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Only start collecting once a worker is free to run the batch,
+            # requests arriving meanwhile pile up and end up in a bigger batch
+            await self._slots.acquire()
+            batch = await self._collect_batch()
+
+            # Clients may have gone away while waiting
+            batch = [(tensor, future) for tensor, future in batch if not future.done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            self.batch_size_histogram[len(batch)] += 1
+            task = asyncio.create_task(self._classify_batch(batch))
+            self._running_batches.add(task)
+            task.add_done_callback(self._on_batch_done)
+
+    def _on_batch_done(self, task: asyncio.Task) -> None:
+        self._running_batches.discard(task)
+        self._slots.release()
+
+    async def _classify_batch(
+        self, batch: List[Tuple[np.ndarray, asyncio.Future]]
+    ) -> None:
+        try:
+            images = np.concatenate([tensor for tensor, _ in batch])
+            with metrics.time("inference"):
+                results = await self.executor.classify_batch(images)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.exception("Failed to classify a batch of %d images", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
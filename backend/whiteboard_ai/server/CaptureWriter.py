@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from whiteboard_ai.model.model import CLASSES
+from whiteboard_ai.util.consts import (
+    CAPTURE_DIR,
+    CAPTURE_ENABLED,
+    CAPTURE_FLUSH_INTERVAL_S,
+    CAPTURE_MAX_QUEUE,
+    CAPTURE_SAMPLE_RATE,
+    CAPTURE_SHARD_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Class name -> label, like the shape_classes of ai/final.py
+LABELS = {class_name: class_id for class_id, class_name in CLASSES.items()}
+
+
+class CaptureWriter:
+    """
+    Records a sample of the classified strokes for the next trainings, without slowing
+    the requests down: capture only copies the stroke and its image to a bounded queue,
+    and a background thread writes them to the archive, a batch at a time.
+
+    The archive is a directory of shards, in the layout of the shards of ai/dataset.py,
+    so ai/final.py can train on them (see load_captures in ai/dataset.py):
+
+    - images.npy, the uint8 (N, height, width) images the model classified
+    - labels.npy, the uint8 labels it predicted, and confidences.npy, their float32 likelihood
+    - points.npy, the float32 (M, 2) points of every stroke, one after the other,
+      and offsets.npy, the (N + 1) indices where every stroke starts in points.npy
+    - index.json, describing the shard
+
+    A shard is written once it holds shard_size strokes, or flush_interval_s after its
+    first one, into a temporary directory then renamed, and appended to index.jsonl.
+    Shards are never modified afterwards. Strokes arriving while the queue is full are
+    not captured
+    """
+
+    def __init__(
+        self,
+        enabled: bool = CAPTURE_ENABLED,
+        directory: str = CAPTURE_DIR,
+        sample_rate: float = CAPTURE_SAMPLE_RATE,
+        max_queue: int = CAPTURE_MAX_QUEUE,
+        shard_size: int = CAPTURE_SHARD_SIZE,
+        flush_interval_s: float = CAPTURE_FLUSH_INTERVAL_S,
+        seed: Optional[int] = None,
+    ):
+        self.enabled = enabled
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.shard_size = shard_size
+        self.flush_interval_s = flush_interval_s
+        self._random = random.Random(seed)
+
+        self.captured = 0
+        # Sampled, but not captured because the queue was full
+        self.dropped = 0
+        self.written = 0
+        self.shards = 0
+        self.errors = 0
+        # Numbers every shard written, or attempted: a failed one may have left its
+        # directory behind, its name is never reused
+        self._sequence = 0
+
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        # Several processes may write to the same archive
+        self._prefix = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+    def capture(
+        self, points: np.ndarray, tensor: np.ndarray, result: tuple[str, float]
+    ) -> bool:
+        """
+        Queues a sample of the strokes for the archive: its (N, 2) points, its image
+        rendered by render_array and the model's (class_name, likelihood).
+        Returns whether it was queued, never waits
+        """
+        if not self.enabled or self._random.random() >= self.sample_rate:
+            return False
+
+        # The tensor may be reused once classified, and the image is smaller as uint8
+        image = np.rint(tensor.reshape(tensor.shape[-3], tensor.shape[-2]) * 255.0)
+        record = (
+            np.array(points, dtype=np.float32),
+            image.astype(np.uint8),
+            LABELS[result[0]],
+            result[1],
+        )
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="capture-writer", daemon=True
+            )
+            self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.captured += 1
+        return True
+
+    def close(self) -> None:
+        """Writes the strokes still queued, and stops the background thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "shards": self.shards,
+            "errors": self.errors,
+        }
+
+    def _run(self) -> None:
+        records = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # The first stroke of the shard waited long enough
+                record = ()
+            if record:
+                records.append(record)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval_s
+            if records and (len(records) >= self.shard_size or not record):
+                self._write(records)
+                records = []
+                deadline = None
+            if record is None:
+                return
+
+    def _write(self, records: list) -> None:
+        name = f"{self._prefix}-{self._sequence:05d}"
+        self._sequence += 1
+        try:
+            self._write_shard(records, name)
+        except Exception:
+            self.errors += 1
+            logger.exception("Failed to write %d captured strokes", len(records))
+            return
+        self.written += len(records)
+        self.shards += 1
+
+    def _write_shard(self, records: list, name: str) -> None:
+        shard_dir = os.path.join(self.directory, name)
+        partial_dir = shard_dir + ".partial"
+        os.makedirs(partial_dir, exist_ok=True)
+
+        points, images, labels, confidences = zip(*records)
+        offsets = np.cumsum([0] + [len(stroke) for stroke in points])
+        np.save(os.path.join(partial_dir, "images.npy"), np.stack(images))
+        np.save(os.path.join(partial_dir, "labels.npy"), np.array(labels, np.uint8))
+        np.save(
+            os.path.join(partial_dir, "confidences.npy"),
+            np.array(confidences, np.float32),
+        )
+        np.save(
+            os.path.join(partial_dir, "points.npy"),
+            np.concatenate(points).reshape(-1, 2),
+        )
+        np.save(os.path.join(partial_dir, "offsets.npy"), offsets.astype(np.int64))
+        index = {
+            "name": name,
+            "count": len(records),
+            "img_size": images[0].shape[0],
+            "classes": LABELS,
+            "created": time.time(),
+        }
+        with open(os.path.join(partial_dir, "index.json"), "w") as file:
+            json.dump(index, file)
+        os.replace(partial_dir, shard_dir)
+
+        # Only complete shards are listed, one line each
+        with open(os.path.join(self.directory, "index.jsonl"), "a") as file:
+            file.write(json.dumps(index) + "\n")
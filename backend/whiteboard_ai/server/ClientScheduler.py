@@ -0,0 +1,221 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from whiteboard_ai.util.consts import (
+    SCHEDULER_MAX_CONCURRENT,
+    SCHEDULER_MAX_PENDING,
+    SCHEDULER_MAX_PER_CLIENT,
+    SCHEDULER_SUPERSEDE,
+)
+
+T = TypeVar("T")
+
+SUPERSEDE_MODES = ("off", "drop", "cancel")
+
+
+class RequestRejectedError(Exception):
+    """A request that was not, or not fully, handled: status is busy, dropped or cancelled"""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+    __slots__ = ("sid", "group", "started", "task", "superseded")
+
+    def __init__(self, sid: str, group=None):
+        self.sid = sid
+        self.group = group
+        # Resolved once the request may run, a slot is then reserved for it
+        self.started: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        self.superseded = False
+
+
+class ClientScheduler:
+    """
+    Decides when the requests of every client run, before they are rendered and batched.
+
+    At most max_concurrent requests run at once, the others wait in a bounded queue per
+    sid, and the queues are served in turn, so a client sending many requests does not
+    delay the others. A client whose queue is full loses its oldest waiting request.
+    Past max_pending requests running or waiting, new ones are refused right away.
+
+    A request may supersede the earlier requests of its sid: with supersede "drop",
+    the ones still waiting are dropped, with "cancel" the running ones are cancelled too.
+    Requests of the same group, like the classifications of one stroke, never supersede
+    each other
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = SCHEDULER_MAX_CONCURRENT,
+        max_pending: int = SCHEDULER_MAX_PENDING,
+        max_per_client: int = SCHEDULER_MAX_PER_CLIENT,
+        supersede: str = SCHEDULER_SUPERSEDE,
+    ):
+        if supersede not in SUPERSEDE_MODES:
+            raise ValueError(f"Unknown supersede mode {supersede}")
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+        self.supersede = supersede
+
+        # Waiting requests by sid, and the sids with waiting requests, in turn
+        self._queues: dict[str, deque[_Request]] = {}
+        self._turns: deque[str] = deque()
+        self._running: dict[str, set[_Request]] = {}
+        self.active = 0
+        self.queued = 0
+
+        self.admitted = 0
+        # Refused because the server was busy
+        self.shed = 0
+        # Removed from their queue before running: full queue, superseded or disconnected
+        self.dropped = 0
+        # Cancelled while running, superseded or disconnected
+        self.cancelled = 0
+
+    async def run(
+        self,
+        sid: str,
+        job: Callable[[], Awaitable[T]],
+        supersedes: bool = False,
+        group=None,
+    ) -> T:
+        """
+        Runs job once it is the turn of the sid, and returns its result.
+        Raises RequestRejectedError if it was refused, dropped or cancelled meanwhile
+        """
+        if self.active + self.queued >= self.max_pending:
+            self.shed += 1
+            raise RequestRejectedError("busy", "The server is busy, try again later")
+        if supersedes and self.supersede != "off":
+            self.drop(sid, cancel_running=self.supersede == "cancel", keep=group)
+        self.admitted += 1
+
+        request = _Request(sid, group)
+        if self.active < self.max_concurrent and not self._turns:
+            self.active += 1
+            request.started.set_result(None)
+        else:
+            self._enqueue(request)
+        try:
+            await request.started
+        except asyncio.CancelledError:
+            if request.superseded:
+                raise RequestRejectedError(
+                    "dropped",
+                    "Dropped before it was handled, newer requests replaced it",
+                ) from None
+            # The task handling the request went away while it waited
+            if request.started.cancelled():
+                self._remove(request)
+            else:
+                # It was started meanwhile, and holds a slot
+                self._release()
+            raise
+
+        running = self._running.setdefault(sid, set())
+        running.add(request)
+        request.task = asyncio.ensure_future(job())
+        try:
+            return await request.task
+        except asyncio.CancelledError:
+            if not request.superseded:
+                raise
+            raise RequestRejectedError(
+                "cancelled", "Cancelled, a newer request replaced it"
+            ) from None
+        finally:
+            running.discard(request)
+            if not running and self._running.get(sid) is running:
+                del self._running[sid]
+            self._release()
+
+    def drop(self, sid: str, cancel_running: bool = False, keep=None) -> None:
+        """
+        Drops the requests of a sid still waiting, and cancels the running ones if asked,
+        they are answered with RequestRejectedError. The requests of the group keep
+        are left alone
+        """
+        queue = self._queues.pop(sid, deque())
+        kept = deque()
+        for request in queue:
+            if keep is not None and request.group is keep:
+                kept.append(request)
+                continue
+            self.queued -= 1
+            self.dropped += 1
+            request.superseded = True
+            request.started.cancel()
+        if kept:
+            self._queues[sid] = kept
+        elif sid in self._turns:
+            self._turns.remove(sid)
+
+        if cancel_running:
+            for request in self._running.get(sid, ()):
+                if keep is not None and request.group is keep:
+                    continue
+                if request.task is not None and not request.task.done():
+                    self.cancelled += 1
+                    request.superseded = True
+                    request.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "supersede": self.supersede,
+            "max_concurrent": self.max_concurrent,
+            "max_pending": self.max_pending,
+            "max_per_client": self.max_per_client,
+            "active": self.active,
+            "queued": self.queued,
+            "clients_waiting": len(self._turns),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+        }
+
+    def _enqueue(self, request: _Request) -> None:
+        queue = self._queues.setdefault(request.sid, deque())
+        if len(queue) >= self.max_per_client:
+            # The oldest waiting request is the most likely to be stale already
+            oldest = queue.popleft()
+            self.queued -= 1
+            self.dropped += 1
+            oldest.superseded = True
+            oldest.started.cancel()
+        queue.append(request)
+        self.queued += 1
+        if request.sid not in self._turns:
+            self._turns.append(request.sid)
+
+    def _remove(self, request: _Request) -> None:
+        queue = self._queues.get(request.sid)
+        if queue is None or request not in queue:
+            return
+        queue.remove(request)
+        self.queued -= 1
+        if not queue:
+            del self._queues[request.sid]
+            self._turns.remove(request.sid)
+
+    def _release(self) -> None:
+        """Frees the slot of a request, and starts the next waiting one, in turn"""
+        self.active -= 1
+        while self._turns and self.active < self.max_concurrent:
+            sid = self._turns.popleft()
+            queue = self._queues[sid]
+            request = queue.popleft()
+            self.queued -= 1
+            if queue:
+                # Its next request waits for the other clients
+                self._turns.append(sid)
+            else:
+                del self._queues[sid]
+            self.active += 1
+            request.started.set_result(None)
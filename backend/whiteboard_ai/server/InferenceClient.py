@@ -0,0 +1,171 @@
+import asyncio
+import queue
+import threading
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from whiteboard_ai.model.model import to_classifications
+from whiteboard_ai.server.SharedMemoryRing import SharedMemoryRing
+from whiteboard_ai.util.consts import SERVE_INFERENCE_TIMEOUT_S, SERVE_WATCH_INTERVAL_S
+
+
+class InferenceError(Exception):
+    """An inference process failed to classify a batch"""
+
+
+class InferenceClient:
+    """
+    Classifies batches of images in the inference processes of a MultiProcessServer,
+    from a front end process that never loads the model.
+
+    Batches are written into a free slot of the front end's SharedMemoryRing, and the
+    slot's index is sent on the queue shared by every inference process. The process
+    that picked it answers on the front end's own queue once the predictions are
+    written into the slot, a thread waits for these answers.
+
+    A batch not answered within timeout_s fails with InferenceError. The same thread
+    watches alive_workers, the number of inference processes still running, kept by
+    the MultiProcessServer: once none is left, the batches waiting fail right away
+    """
+
+    def __init__(
+        self,
+        frontend_id: int,
+        ring: SharedMemoryRing,
+        requests,
+        responses,
+        ready,
+        alive_workers=None,
+        timeout_s: float = SERVE_INFERENCE_TIMEOUT_S,
+        watch_interval_s: float = SERVE_WATCH_INTERVAL_S,
+    ):
+        self.frontend_id = frontend_id
+        self.ring = ring
+        self.max_batch_size = ring.max_batch_size
+        # Queues and event of the multiprocessing context of the server
+        self.requests = requests
+        self.responses = responses
+        self.ready = ready
+        # multiprocessing Value, None when the inference processes are not watched
+        self.alive_workers = alive_workers
+        self.timeout_s = timeout_s
+        self.watch_interval_s = watch_interval_s
+
+        self._free_slots = deque(range(ring.slots))
+        self._slot_available: Optional[asyncio.Semaphore] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        # Slots whose request was cancelled, before their answer arrived
+        self._abandoned: set[int] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._receiver: Optional[threading.Thread] = None
+
+    def wait_ready(self, timeout: Optional[float] = None) -> None:
+        """Blocks until an inference process has loaded the model"""
+        if not self.ready.wait(timeout):
+            raise TimeoutError("No inference process is ready")
+
+    async def classify_batch(self, images: np.ndarray) -> list[tuple[str, float]]:
+        """
+        Classifies a batch of normalized images of shape (N, height, width, 1),
+        batches larger than a slot are split over several slots
+        """
+        if len(images) > self.max_batch_size:
+            chunks = await asyncio.gather(
+                *(
+                    self.classify_batch(images[start : start + self.max_batch_size])
+                    for start in range(0, len(images), self.max_batch_size)
+                )
+            )
+            return [result for chunk in chunks for result in chunk]
+        return to_classifications(await self.predict(images))
+
+    def workers_gone(self) -> bool:
+        """Whether every inference process exited, no batch will be answered anymore"""
+        return self.alive_workers is not None and self.alive_workers.value <= 0
+
+    async def predict(self, images: np.ndarray) -> np.ndarray:
+        if self.workers_gone():
+            raise InferenceError("No inference process is running")
+        # Started lazily, on the event loop serving the requests
+        if self._receiver is None:
+            self._loop = asyncio.get_running_loop()
+            self._slot_available = asyncio.Semaphore(self.ring.slots)
+            self._receiver = threading.Thread(
+                target=self._receive, name="inference-responses", daemon=True
+            )
+            self._receiver.start()
+
+        count = len(images)
+        await self._slot_available.acquire()
+        slot = self._free_slots.popleft()
+        future = self._loop.create_future()
+        self._pending[slot] = future
+        try:
+            self.ring.images(slot)[:count] = images
+            self.requests.put((self.frontend_id, slot, count))
+            await asyncio.wait_for(future, self.timeout_s)
+            return self.ring.predictions(slot)[:count].copy()
+        except asyncio.TimeoutError:
+            # The inference process may have died with the batch, or still answer it
+            if not self.workers_gone():
+                self._abandoned.add(slot)
+            raise InferenceError(
+                f"No answer from the inference processes in {self.timeout_s:g}s"
+            ) from None
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # An inference process may still write into the slot, it is only
+                # freed once the answer arrives
+                self._abandoned.add(slot)
+            raise
+        finally:
+            if slot not in self._abandoned:
+                self._release(slot)
+
+    def close(self) -> None:
+        """Stops the thread waiting for the answers"""
+        if self._receiver is not None:
+            self.responses.put(None)
+            self._receiver.join()
+            self._receiver = None
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                response = self.responses.get(timeout=self.watch_interval_s)
+            except queue.Empty:
+                if self.workers_gone():
+                    self._loop.call_soon_threadsafe(self._fail_pending)
+                continue
+            if response is None:
+                return
+            self._loop.call_soon_threadsafe(self._resolve, *response)
+
+    def _fail_pending(self) -> None:
+        """Fails the batches waiting for an answer, once no inference process is left"""
+        for slot in list(self._abandoned):
+            # Nothing will write into them anymore
+            self._abandoned.discard(slot)
+            self._release(slot)
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(InferenceError("The inference processes exited"))
+
+    def _release(self, slot: int) -> None:
+        self._pending.pop(slot, None)
+        self._free_slots.append(slot)
+        self._slot_available.release()
+
+    def _resolve(self, slot: int, error: Optional[str]) -> None:
+        if slot in self._abandoned:
+            self._abandoned.discard(slot)
+            self._release(slot)
+            return
+        future = self._pending.get(slot)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(InferenceError(error))
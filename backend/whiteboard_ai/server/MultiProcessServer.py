@@ -0,0 +1,294 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import queue
+import signal
+import socket
+import sys
+
+import numpy as np
+from whiteboard_ai.model.model import CLASSES, ModelLoader
+from whiteboard_ai.server.InferenceClient import InferenceClient
+from whiteboard_ai.server.SharedMemoryRing import SharedMemoryRing
+from whiteboard_ai.server.WebsocketServer import WebSocketServer
+from whiteboard_ai.util.consts import (
+    BATCH_MAX_SIZE,
+    INFERENCE_BACKEND,
+    LOG_FORMAT,
+    SERVE_FRONTENDS,
+    SERVE_INFERENCE_WORKERS,
+    SERVE_RING_SLOTS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shape of the images the front ends render, see WebSocketServer
+IMAGE_SHAPE = (70, 70, 1)
+
+
+def _run_inference_worker(
+    model_path: str,
+    backend: str,
+    max_batch_size: int,
+    ring_specs: list[dict],
+    requests,
+    responses: list,
+    ready,
+    log_level: int,
+) -> None:
+    """
+    Loads the model, and classifies the batches the front ends write into their rings.
+    Batches already waiting from other front ends join the same forward pass
+    """
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    model_loader = ModelLoader(
+        model_path, backend=backend, max_batch_size=max_batch_size
+    )
+    rings = [SharedMemoryRing(**spec) for spec in ring_specs]
+    ready.set()
+
+    stopping = False
+    try:
+        while not stopping:
+            batch = []
+            count = 0
+            message = requests.get()
+            while message is not None:
+                batch.append(message)
+                count += message[2]
+                if count >= max_batch_size:
+                    break
+                try:
+                    message = requests.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = message is None
+            if batch:
+                _classify(model_loader, rings, batch, responses)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for ring in rings:
+            ring.close()
+
+
+def _classify(
+    model_loader: ModelLoader,
+    rings: list[SharedMemoryRing],
+    batch: list[tuple[int, int, int]],
+    responses: list,
+) -> None:
+    error = None
+    try:
+        images = np.concatenate(
+            [rings[frontend].images(slot)[:count] for frontend, slot, count in batch]
+        )
+        predictions = model_loader.predict(images)
+        start = 0
+        for frontend, slot, count in batch:
+            rings[frontend].predictions(slot)[:count] = predictions[
+                start : start + count
+            ]
+            start += count
+    except Exception as e:
+        logger.exception("Failed to classify a batch of %d requests", len(batch))
+        error = str(e)
+
+    for frontend, slot, _ in batch:
+        responses[frontend].put((slot, error))
+
+
+def _run_frontend(
+    sock: socket.socket,
+    frontend_id: int,
+    host: str,
+    port: int,
+    model_path: str,
+    backend: str,
+    ring_spec: dict,
+    requests,
+    responses,
+    ready,
+    alive_workers,
+    server_options: dict,
+    uvicorn_options: dict,
+    log_level: int,
+) -> None:
+    """Serves socket.io connections, on the socket shared by every front end"""
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    ring = SharedMemoryRing(**ring_spec)
+    inference_client = InferenceClient(
+        frontend_id, ring, requests, responses, ready, alive_workers
+    )
+    # Only names the model, it is never loaded in the front ends
+    model_loader = ModelLoader(model_path, lazy=True, backend=backend)
+    server = WebSocketServer(
+        host,
+        port,
+        model_loader,
+        executor_mode="shared",
+        executor_max_workers=ring.slots,
+        inference_client=inference_client,
+        **server_options,
+    )
+    try:
+        server.run(sockets=[sock], **uvicorn_options)
+    finally:
+        inference_client.close()
+        ring.close()
+
+
+class MultiProcessServer:
+    """
+    Serves the WebSocketServer from several front end processes sharing the same socket,
+    and runs the model in separate inference processes, so the front ends use more than
+    one core without each loading their own copy of the model.
+
+    Front ends render the strokes and batch them like a single server would, then pass
+    the batches to the inference processes through shared memory, see InferenceClient.
+    Every process has its own metrics, /metrics shows the ones of the front end that
+    answered
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        model_path: str,
+        backend: str = INFERENCE_BACKEND,
+        frontends: int = SERVE_FRONTENDS,
+        inference_workers: int = SERVE_INFERENCE_WORKERS,
+        ring_slots: int = SERVE_RING_SLOTS,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        **server_options,
+    ):
+        self.host = host
+        self.port = port
+        self.model_path = model_path
+        self.backend = backend
+        self.frontends = frontends
+        self.inference_workers = inference_workers
+        self.ring_slots = ring_slots
+        self.max_batch_size = max_batch_size
+        # Passed to every WebSocketServer
+        self.server_options = server_options
+
+    def run(self, **uvicorn_options) -> None:
+        # TensorFlow does not survive a fork, and neither would the event loops
+        context = multiprocessing.get_context("spawn")
+        # Spawned processes start without the logging configuration of this one
+        log_level = logging.getLogger().getEffectiveLevel()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.set_inheritable(True)
+
+        rings = [
+            SharedMemoryRing(
+                self.ring_slots, self.max_batch_size, IMAGE_SHAPE, len(CLASSES)
+            )
+            for _ in range(self.frontends)
+        ]
+        requests = context.Queue()
+        responses = [context.Queue() for _ in range(self.frontends)]
+        ready = context.Event()
+        # Inference processes still running, the front ends stop waiting once it is 0
+        alive_workers = context.Value("i", self.inference_workers)
+
+        inference_processes = [
+            context.Process(
+                target=_run_inference_worker,
+                args=(
+                    self.model_path,
+                    self.backend,
+                    self.max_batch_size,
+                    [ring.spec() for ring in rings],
+                    requests,
+                    responses,
+                    ready,
+                    log_level,
+                ),
+                name=f"inference-{index}",
+            )
+            for index in range(self.inference_workers)
+        ]
+        frontend_processes = [
+            context.Process(
+                target=_run_frontend,
+                args=(
+                    sock,
+                    index,
+                    self.host,
+                    self.port,
+                    self.model_path,
+                    self.backend,
+                    rings[index].spec(),
+                    requests,
+                    responses[index],
+                    ready,
+                    alive_workers,
+                    self.server_options,
+                    uvicorn_options,
+                    log_level,
+                ),
+                name=f"frontend-{index}",
+            )
+            for index in range(self.frontends)
+        ]
+
+        # Terminating the server also stops the processes it started
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            for process in inference_processes + frontend_processes:
+                process.start()
+            logger.info(
+                "Serving on %s:%d with %d front ends and %d inference processes",
+                self.host,
+                self.port,
+                self.frontends,
+                self.inference_workers,
+            )
+            self._watch(inference_processes, frontend_processes, alive_workers)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            started_frontends = [p for p in frontend_processes if p.pid is not None]
+            started_workers = [p for p in inference_processes if p.pid is not None]
+            for process in started_frontends:
+                process.terminate()
+            for process in started_frontends:
+                process.join()
+            for _ in started_workers:
+                requests.put(None)
+            for process in started_workers:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            for ring in rings:
+                ring.close()
+            sock.close()
+
+    @staticmethod
+    def _watch(inference_processes, frontend_processes, alive_workers) -> None:
+        """
+        Waits for the front ends to exit, and counts the inference processes still
+        running meanwhile, so the front ends fail their requests instead of waiting
+        for a process that exited
+        """
+        workers = {process.sentinel: process for process in inference_processes}
+        frontends = {process.sentinel for process in frontend_processes}
+        while frontends:
+            for sentinel in multiprocessing.connection.wait([*workers, *frontends]):
+                if sentinel in frontends:
+                    frontends.discard(sentinel)
+                    continue
+                process = workers.pop(sentinel)
+                process.join()
+                logger.error(
+                    "Inference process %s exited with code %s, %d left",
+                    process.name,
+                    process.exitcode,
+                    len(workers),
+                )
+                alive_workers.value = len(workers)
@@ -0,0 +1,153 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+import numpy as np
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.server.InferenceClient import InferenceClient
+from whiteboard_ai.util.consts import EXECUTOR_MAX_WORKERS, EXECUTOR_MODE
+
+T = TypeVar("T")
+
+EXECUTOR_MODES = ("inline", "thread", "process", "shared")
+
+# Model loaded by every worker of the process pool
+_worker_model_loader: Optional[ModelLoader] = None
+
+
+def _init_worker(model_path: str, backend: str) -> None:
+    global _worker_model_loader
+    _worker_model_loader = ModelLoader(model_path, backend=backend)
+
+
+def _worker_ready() -> bool:
+    return _worker_model_loader is not None
+
+
+def _classify_batch_in_worker(images: np.ndarray) -> list[tuple[str, float]]:
+    return _worker_model_loader.classify_batch(images)
+
+
+class PipelineExecutor:
+    """
+    Runs the blocking stages of the classification pipeline (rendering and inference)
+    outside of the event loop, so the server keeps handling connections meanwhile.
+
+    - "inline" runs the stages on the event loop, like before
+    - "thread" runs them in a thread pool, the model is shared
+    - "process" runs them in a process pool, every worker loads its own copy of the model
+    - "shared" renders on the event loop, and classifies in the inference processes
+      of a MultiProcessServer, the model is never loaded in this process
+    """
+
+    def __init__(
+        self,
+        model_loader: ModelLoader,
+        mode: str = EXECUTOR_MODE,
+        max_workers: int = EXECUTOR_MAX_WORKERS,
+        inference_client: Optional[InferenceClient] = None,
+    ):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(
+                f"Unknown executor mode {mode}, expected one of {EXECUTOR_MODES}"
+            )
+        if (mode == "shared") != (inference_client is not None):
+            raise ValueError("The shared mode needs an inference client, and only it")
+
+        self.model_loader = model_loader
+        self.mode = mode
+        self.max_workers = max_workers
+        self.inference_client = inference_client
+
+        # Stages waiting for a free worker
+        self.queue_depth = 0
+        # Stages currently running
+        self.in_flight = 0
+
+        self._pool: Optional[Executor] = None
+        if mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="pipeline")
+        elif mode == "process":
+            # TensorFlow does not survive a fork, start the workers from scratch
+            self._pool = ProcessPoolExecutor(
+                max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_loader.model_path, model_loader.backend_name),
+            )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def load_model(self) -> None:
+        """
+        Loads the model where the inference runs, in this process or in the workers
+        of the process pool, and blocks until it is ready
+        """
+        if self.mode == "shared":
+            self.inference_client.wait_ready()
+        elif self.mode == "process":
+            # Starts the workers, which load the model before running anything
+            futures = [
+                self._pool.submit(_worker_ready) for _ in range(self.max_workers)
+            ]
+            for future in futures:
+                future.result()
+        else:
+            self.model_loader.load()
+
+    async def render(
+        self, image_generator: ImageGenerator, stroke: Stroke
+    ) -> np.ndarray:
+        return await self._run(image_generator.render_array, stroke)
+
+    async def render_batch(
+        self, image_generator: ImageGenerator, strokes: list[Stroke]
+    ) -> np.ndarray:
+        return await self._run(image_generator.render_batch, strokes)
+
+    async def classify_batch(self, images: np.ndarray) -> list[tuple[str, float]]:
+        if self.mode == "shared":
+            self.in_flight += 1
+            try:
+                return await self.inference_client.classify_batch(images)
+            finally:
+                self.in_flight -= 1
+        if self.mode == "process":
+            return await self._run(_classify_batch_in_worker, images)
+        return await self._run(self.model_loader.classify_batch, images)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        # Created lazily, on the event loop serving the requests
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        self.queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        self.in_flight += 1
+        try:
+            if self._pool is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, fn, *args
+            )
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
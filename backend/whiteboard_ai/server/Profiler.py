@@ -0,0 +1,246 @@
+import asyncio
+import cProfile
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from whiteboard_ai.util.consts import (
+    PROFILE_DIR,
+    PROFILE_MAX_REQUESTS,
+    PROFILE_MAX_S,
+    PROFILE_SAMPLE_INTERVAL_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sampler", "cprofile")
+
+
+class ProfilerBusyError(Exception):
+    """A profile is already being recorded"""
+
+
+class Profiler:
+    """
+    Profiles the running server on demand, for its next requests or a few seconds,
+    whichever ends first.
+
+    - sampler mode samples the stacks of every thread, the event loop and the executor
+      threads rendering and classifying, and writes them as collapsed stacks, one
+      "thread;outer;...;inner count" line per stack, which flamegraph.pl or speedscope
+      turn into a flame graph
+    - cprofile mode runs cProfile on the event loop thread, and writes a pstats file.
+      It slows the requests down a lot more, and does not see the executor threads
+
+    Either way, when TensorFlow runs the model in this process, its profiler records the
+    timings of every op meanwhile, in a TensorBoard log directory.
+    While no profile is recorded, the only cost on the hot path is reading active.
+    The profile is written from the default executor once it stops, not on the event loop
+    """
+
+    def __init__(
+        self,
+        output_dir: str = PROFILE_DIR,
+        sample_interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS,
+    ):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval_ms / 1000
+        self.active = False
+        # The session being recorded, or the last one
+        self.session: Optional[dict] = None
+
+        self._remaining = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop_sampling = threading.Event()
+        # Writing the last profile, from the default executor
+        self._writing: Optional[asyncio.Future] = None
+        self._stacks: Counter[str] = Counter()
+        self._tensorflow = False
+
+    def start(
+        self,
+        requests: int = PROFILE_MAX_REQUESTS,
+        seconds: float = PROFILE_MAX_S,
+        mode: str = "sampler",
+    ) -> dict:
+        """
+        Starts recording, on the event loop, until requests were handled or for seconds.
+        Returns the session, raises ProfilerBusyError if one is being recorded already
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}")
+        if requests < 1 or seconds <= 0:
+            raise ValueError("A profile needs at least one request and some time")
+        if self.active:
+            raise ProfilerBusyError("A profile is already being recorded")
+        if self._writing is not None and not self._writing.done():
+            raise ProfilerBusyError("The last profile is still being written")
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        path = os.path.join(self.output_dir, name)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.session = {
+            "state": "recording",
+            "mode": mode,
+            "max_requests": requests,
+            "max_seconds": seconds,
+            "requests": 0,
+            "started": time.time(),
+            "files": {},
+        }
+        self._path = path
+        self._started = time.perf_counter()
+        self._remaining = requests
+
+        self._tensorflow = self._start_tensorflow(path + "-tensorflow")
+        if mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._stacks = Counter()
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(
+                target=self._sample, name="profiler", daemon=True
+            )
+            self._sampler.start()
+
+        self._timer = asyncio.get_running_loop().call_later(
+            seconds, self._stop_in_background
+        )
+        self.active = True
+        logger.info("Profiling %d requests or %.0fs, %s", requests, seconds, mode)
+        return self.session
+
+    def request_done(self) -> None:
+        """Counts a request handled while recording, the last one stops the profile"""
+        if not self.active:
+            return
+        self.session["requests"] += 1
+        self._remaining -= 1
+        if self._remaining <= 0:
+            self._stop_in_background()
+
+    def stop(self) -> Optional[dict]:
+        """
+        Stops recording and writes the profile, returns the session.
+        Blocks until the files are written, use stop_async on the event loop
+        """
+        if self.active:
+            self._halt()
+            self.session.update(self._write())
+        return self.session
+
+    async def stop_async(self) -> Optional[dict]:
+        """
+        Stops recording if it still is, and waits for the profile to be written by the
+        default executor, so the event loop keeps serving meanwhile
+        """
+        if self.active:
+            self._stop_in_background()
+        if self._writing is not None:
+            # Failures are logged by _written
+            await asyncio.wait([self._writing])
+        return self.session
+
+    def _stop_in_background(self) -> None:
+        """Stops recording, on the event loop, and writes the profile from the executor"""
+        self._halt()
+        session = self.session
+        self._writing = asyncio.get_running_loop().run_in_executor(None, self._write)
+        self._writing.add_done_callback(functools.partial(self._written, session))
+
+    @staticmethod
+    def _written(session: dict, writing: asyncio.Future) -> None:
+        """Updates the session, on the event loop, once the profile is written"""
+        if writing.cancelled():
+            return
+        if writing.exception() is not None:
+            logger.error("Failed to write the profile", exc_info=writing.exception())
+            session["state"] = "failed"
+            return
+        session.update(writing.result())
+
+    def _halt(self) -> None:
+        """Stops recording, the profile is written by _write"""
+        self.active = False
+        self._timer.cancel()
+        if self._profile is not None:
+            # Only stops profiling the thread it runs on
+            self._profile.disable()
+        self._stop_sampling.set()
+        self.session["state"] = "writing"
+        self.session["duration_s"] = time.perf_counter() - self._started
+
+    def _write(self) -> dict:
+        """
+        Writes the profile and returns the updates of the session, blocks on the sampler
+        thread, the disk and the TensorFlow profiler
+        """
+        files = dict(self.session["files"])
+        update = {"state": "done", "files": files}
+        if self._profile is not None:
+            files["pstats"] = self._path + ".pstats"
+            self._profile.dump_stats(files["pstats"])
+            self._profile = None
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+            files["collapsed"] = self._path + ".folded"
+            with open(files["collapsed"], "w") as file:
+                for stack, count in self._stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+            update["samples"] = sum(self._stacks.values())
+        if self._tensorflow:
+            self._stop_tensorflow()
+            files["tensorflow"] = self._path + "-tensorflow"
+
+        logger.info("Profile written to %s", ", ".join(files.values()))
+        return update
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop_sampling.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        f":{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+
+    @staticmethod
+    def _start_tensorflow(logdir: str) -> bool:
+        # Only when the model already runs with TensorFlow, never imported for this
+        if "tensorflow" not in sys.modules:
+            return False
+        import tensorflow as tf
+
+        try:
+            tf.profiler.experimental.start(logdir)
+        except Exception:
+            logger.exception("Failed to start the TensorFlow profiler")
+            return False
+        return True
+
+    @staticmethod
+    def _stop_tensorflow() -> None:
+        import tensorflow as tf
+
+        try:
+            tf.profiler.experimental.stop()
+        except Exception:
+            logger.exception("Failed to stop the TensorFlow profiler")
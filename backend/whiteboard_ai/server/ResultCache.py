@@ -0,0 +1,101 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from whiteboard_ai.util.consts import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_SIZE,
+    RESULT_CACHE_TTL_S,
+)
+
+
+class ResultCache:
+    """
+    Remembers the classification of the last rendered images, so redrawing the same shape
+    or sending the same stroke again after an undo/redo skips the forward pass.
+
+    Images are keyed by a hash of their ink, the generated images only have two colors
+    so two images with the same key are the same model input. Entries are evicted
+    once the cache is full, least recently used first, or once they are older than ttl_s
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESULT_CACHE_ENABLED,
+        max_size: int = RESULT_CACHE_MAX_SIZE,
+        ttl_s: float = RESULT_CACHE_TTL_S,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        # Entries removed because the cache was full or because they expired
+        self.evictions = 0
+        self.expirations = 0
+
+        # Key -> (time it was stored, (class_name, likelihood)), least recently used first
+        self._entries: OrderedDict[bytes, Tuple[float, tuple[str, float]]] = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def key(tensor: np.ndarray) -> bytes:
+        """
+        Returns the key of a rendered image, a hash of its inked pixels
+        """
+        ink = np.packbits(np.asarray(tensor) < 0.5)
+        return hashlib.blake2b(ink.tobytes(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[tuple[str, float]]:
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() - entry[0] > self.ttl_s:
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: bytes, result: tuple[str, float]) -> None:
+        if not self.enabled or self.max_size <= 0:
+            return
+
+        self._entries[key] = (self.clock(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
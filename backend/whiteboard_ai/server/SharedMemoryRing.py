@@ -0,0 +1,77 @@
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class SharedMemoryRing:
+    """
+    A fixed number of slots in shared memory, every slot holding a batch of images
+    and the class probabilities predicted for them.
+
+    A front end process owns the slots of its ring, it writes a batch of images into
+    a free slot and sends the slot's index to an inference process, which writes the
+    predictions next to the images. Only the indices go through a queue, the images
+    are never pickled or copied between processes.
+
+    The ring is created once by the parent process, and attached to by name in the others
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        max_batch_size: int,
+        image_shape: Tuple[int, ...],
+        num_classes: int,
+        name: Optional[str] = None,
+    ):
+        self.slots = slots
+        self.max_batch_size = max_batch_size
+        self.image_shape = tuple(image_shape)
+        self.num_classes = num_classes
+
+        images_size = slots * max_batch_size * int(np.prod(image_shape))
+        predictions_size = slots * max_batch_size * num_classes
+        size = (images_size + predictions_size) * np.dtype(np.float32).itemsize
+
+        self.owner = name is None
+        if self.owner:
+            self._memory = SharedMemory(create=True, size=size)
+        else:
+            # Processes started by the owner share its resource tracker, which only unlinks
+            # the memory if the owner never did
+            self._memory = SharedMemory(name=name)
+        self.name = self._memory.name
+
+        buffer = np.ndarray((size // 4,), dtype=np.float32, buffer=self._memory.buf)
+        self._images = buffer[:images_size].reshape(
+            slots, max_batch_size, *self.image_shape
+        )
+        self._predictions = buffer[images_size:].reshape(
+            slots, max_batch_size, num_classes
+        )
+
+    def spec(self) -> dict:
+        """The arguments attaching to this ring from another process"""
+        return {
+            "slots": self.slots,
+            "max_batch_size": self.max_batch_size,
+            "image_shape": self.image_shape,
+            "num_classes": self.num_classes,
+            "name": self.name,
+        }
+
+    def images(self, slot: int) -> np.ndarray:
+        """The (max_batch_size, *image_shape) images of a slot, a view into the shared memory"""
+        return self._images[slot]
+
+    def predictions(self, slot: int) -> np.ndarray:
+        """The (max_batch_size, num_classes) predictions of a slot"""
+        return self._predictions[slot]
+
+    def close(self) -> None:
+        # The views must go before the memory they point to
+        self._images = self._predictions = None
+        self._memory.close()
+        if self.owner:
+            self._memory.unlink()
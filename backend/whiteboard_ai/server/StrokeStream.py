@@ -0,0 +1,71 @@
+import asyncio
+from typing import Optional
+
+import numpy as np
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.util.consts import STREAM_CLOSED_DISTANCE, STREAM_MIN_POINTS
+
+
+class StrokeStream:
+    """
+    A stroke still being drawn by a client, extended as its points arrive in chunks.
+
+    Points are appended to a buffer that doubles its capacity when full, so receiving
+    a stroke costs the same whatever the size of the chunks it is sent in
+    """
+
+    def __init__(self, capacity: int = 256):
+        self._buffer = np.empty((capacity, 2), dtype=np.float32)
+        self._length = 0
+
+        # Classification started before the end of the stroke, and how many points it saw
+        self.speculation: Optional[asyncio.Task] = None
+        self.speculation_length = 0
+        # Whether it got its turn to run, and is classifying the stroke already
+        self.speculation_started = False
+        # A chunk that could not be decoded, reported once the stroke ends
+        self.error: Optional[str] = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def extend(self, points: np.ndarray) -> None:
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        needed = self._length + len(points)
+        if needed > len(self._buffer):
+            buffer = np.empty((max(needed, 2 * len(self._buffer)), 2), np.float32)
+            buffer[: self._length] = self._buffer[: self._length]
+            self._buffer = buffer
+
+        self._buffer[self._length : needed] = points
+        self._length = needed
+
+    @property
+    def stroke(self) -> Stroke:
+        """
+        The points received so far. The stroke is a view of the buffer, points added later
+        are never written to the part it covers
+        """
+        return Stroke.from_array(self._buffer[: self._length])
+
+    def looks_closed(
+        self,
+        min_points: int = STREAM_MIN_POINTS,
+        closed_distance: float = STREAM_CLOSED_DISTANCE,
+    ) -> bool:
+        """
+        Whether the stroke came back close to where it started, relative to its size,
+        which is when the shapes the model knows are usually complete
+        """
+        if self._length < min_points:
+            return False
+
+        points = self._buffer[: self._length]
+        diagonal = np.hypot(*(points.max(axis=0) - points.min(axis=0)))
+        gap = np.hypot(*(points[-1] - points[0]))
+        return diagonal > 0 and gap <= closed_distance * diagonal
+
+    def cancel(self) -> None:
+        if self.speculation is not None:
+            self.speculation.cancel()
+            self.speculation = None
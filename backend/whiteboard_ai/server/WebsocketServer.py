@@ -1,61 +1,657 @@
 import asyncio
 import base64
+import hmac
 import json
-import traceback
+import logging
+import time
+from typing import Optional
+from urllib.parse import parse_qs
 
+import numpy as np
 import socketio
+from whiteboard_ai.core.GeometricPreClassifier import GeometricPreClassifier
 from whiteboard_ai.core.ImageGenerator import ImageGenerator
-from whiteboard_ai.core.primitives.Point import Point
 from whiteboard_ai.core.primitives.Stroke import Stroke
 from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.server.BatchScheduler import BatchScheduler
+from whiteboard_ai.server.CaptureWriter import CaptureWriter
+from whiteboard_ai.server.ClientScheduler import ClientScheduler, RequestRejectedError
+from whiteboard_ai.server.InferenceClient import InferenceClient
+from whiteboard_ai.server.PipelineExecutor import PipelineExecutor
+from whiteboard_ai.server.Profiler import Profiler, ProfilerBusyError
+from whiteboard_ai.server.ResultCache import ResultCache
+from whiteboard_ai.server.StrokeStream import StrokeStream
+from whiteboard_ai.server.protocol import (
+    PROTOCOL_VERSION,
+    answers_with_ack,
+    decode_stroke,
+    request_id,
+)
+from whiteboard_ai.util.consts import (
+    ADMIN_TOKEN,
+    BATCH_MAX_SIZE,
+    BATCH_WINDOW_MS,
+    CAPTURE_DIR,
+    CAPTURE_ENABLED,
+    CAPTURE_SAMPLE_RATE,
+    CLASSIFY_BATCH_MAX_STROKES,
+    DEBUG_EXPORT_IMAGES,
+    EXECUTOR_MAX_WORKERS,
+    EXECUTOR_MODE,
+    FAST_PATH_ENABLED,
+    MODEL_WAIT_MAX_QUEUE,
+    MODEL_WAIT_TIMEOUT_S,
+    PROFILE_MAX_REQUESTS,
+    PROFILE_MAX_S,
+    RESULT_CACHE_ENABLED,
+    SCHEDULER_MAX_CONCURRENT,
+    SCHEDULER_MAX_PENDING,
+    SCHEDULER_MAX_PER_CLIENT,
+    SCHEDULER_SUPERSEDE,
+    STREAM_SPECULATE,
+)
+from whiteboard_ai.util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReadyError(Exception):
+    """The model is still loading, or failed to"""
 
 
 class WebSocketServer:
-    def __init__(self, host: str, port: int, model_loader: ModelLoader):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        model_loader: ModelLoader,
+        debug_export: bool = DEBUG_EXPORT_IMAGES,
+        batch_window_ms: float = BATCH_WINDOW_MS,
+        batch_max_size: int = BATCH_MAX_SIZE,
+        executor_mode: str = EXECUTOR_MODE,
+        executor_max_workers: int = EXECUTOR_MAX_WORKERS,
+        cache_enabled: bool = RESULT_CACHE_ENABLED,
+        speculate: bool = STREAM_SPECULATE,
+        model_wait_timeout_s: float = MODEL_WAIT_TIMEOUT_S,
+        model_wait_max_queue: int = MODEL_WAIT_MAX_QUEUE,
+        inference_client: Optional[InferenceClient] = None,
+        fast_path: bool = FAST_PATH_ENABLED,
+        max_concurrent: int = SCHEDULER_MAX_CONCURRENT,
+        max_pending: int = SCHEDULER_MAX_PENDING,
+        max_per_client: int = SCHEDULER_MAX_PER_CLIENT,
+        supersede: str = SCHEDULER_SUPERSEDE,
+        capture: bool = CAPTURE_ENABLED,
+        capture_dir: str = CAPTURE_DIR,
+        capture_rate: float = CAPTURE_SAMPLE_RATE,
+        admin_token: Optional[str] = ADMIN_TOKEN,
+    ):
         self.host = host
         self.port = port
         self.model_loader = model_loader
+        # Write the generated images to temp/ on every request, only useful for debugging
+        self.debug_export = debug_export
+        self.image_generator = ImageGenerator(dimensions=(70, 70))
+        # Bounds the requests of every client, and serves the clients in turn
+        self.client_scheduler = ClientScheduler(
+            max_concurrent, max_pending, max_per_client, supersede
+        )
+        # Rendering and inference run outside of the event loop
+        self.executor = PipelineExecutor(
+            model_loader, executor_mode, executor_max_workers, inference_client
+        )
+        # Requests from every client are classified together in small batches
+        self.batch_scheduler = BatchScheduler(
+            self.executor, batch_window_ms, batch_max_size
+        )
+        # Images that were already classified skip the model
+        self.result_cache = ResultCache(enabled=cache_enabled)
+        # A sample of the classified strokes is archived for the next trainings
+        self.capture_writer = CaptureWriter(capture, capture_dir, capture_rate)
+        # Profiles the next requests when asked to on /admin/profile, with the token
+        self.profiler = Profiler()
+        self.admin_token = admin_token
+        # Obvious lines and scribbles are not even rendered
+        self.pre_classifier = GeometricPreClassifier(enabled=fast_path)
+        # Strokes being drawn, by sid, classified before they end once they look closed
+        self.streams: dict[str, StrokeStream] = {}
+        self.speculate = speculate
+
+        # The model is loaded in the background once the server starts, requests arriving
+        # meanwhile wait for it a bounded time, a bounded number of them
+        self.model_wait_timeout_s = model_wait_timeout_s
+        self.model_wait_max_queue = model_wait_max_queue
+        self.waiting_for_model = 0
+        self.model_ready: Optional[asyncio.Event] = None
+        self.model_error: Optional[str] = None
+        self._model_loading: Optional[asyncio.Task] = None
+
+        self.connected: set[str] = set()
+        # Strokes between the start of their rendering and their result
+        self.in_flight = 0
+        metrics.describe("requests_total", "Events received, by event")
+        metrics.describe("errors_total", "Events answered with an error, by event")
+        metrics.describe(
+            "fast_path_total", "Strokes answered without the model, by reason"
+        )
+        metrics.describe(
+            "rejected_total",
+            "Requests refused, dropped or cancelled before their answer, by status",
+        )
+        metrics.gauge(
+            "connected_clients", lambda: len(self.connected), "Connected sids"
+        )
+        metrics.gauge(
+            "inflight_classifications",
+            lambda: self.in_flight,
+            "Strokes being rendered or classified",
+        )
+        metrics.gauge(
+            "queued_requests",
+            lambda: self.client_scheduler.queued,
+            "Requests waiting for their turn",
+        )
+        metrics.gauge(
+            "active_streams", lambda: len(self.streams), "Strokes being drawn"
+        )
+
         self.sio = socketio.AsyncServer(
             async_mode="asgi", cors_allowed_origins="*"
         )  # Disable CORS
-        self.app = socketio.ASGIApp(self.sio)
+        # Readiness on /ready and Prometheus metrics on /metrics, next to socket.io
+        self._metrics_app = metrics.asgi_app()
+        self.app = socketio.ASGIApp(
+            self.sio,
+            other_asgi_app=self.http_app,
+            on_startup=self.start_loading_model,
+            on_shutdown=self.close,
+        )
+
+    def start_loading_model(self) -> None:
+        """
+        Starts loading the model in the background, once, on the event loop serving the requests
+        """
+        if self._model_loading is None:
+            self.model_ready = asyncio.Event()
+            self._model_loading = asyncio.create_task(self._load_model())
+
+    async def _load_model(self) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.executor.load_model
+            )
+            logger.info("Model ready in %.2fs", time.perf_counter() - start)
+        except Exception as e:
+            self.model_error = str(e)
+            logger.exception("Failed to load the model")
+        # Also wakes the requests up when loading failed
+        self.model_ready.set()
+
+    async def close(self) -> None:
+        """
+        Stops the background tasks and threads of the server, once it stops serving:
+        the batch worker, the model loading, the speculative classifications, the
+        executor, the capture writer and the profiler
+        """
+        await self.batch_scheduler.close()
+        if self._model_loading is not None and not self._model_loading.done():
+            self._model_loading.cancel()
+            await asyncio.gather(self._model_loading, return_exceptions=True)
+        for stream in self.streams.values():
+            stream.cancel()
+        self.executor.shutdown()
+        self.capture_writer.close()
+        await self.profiler.stop_async()
+
+    def is_model_ready(self) -> bool:
+        return (
+            self.model_ready is not None
+            and self.model_ready.is_set()
+            and self.model_error is None
+        )
+
+    async def wait_for_model(self) -> None:
+        self.start_loading_model()
+        if not self.model_ready.is_set():
+            if self.waiting_for_model >= self.model_wait_max_queue:
+                raise ModelNotReadyError(
+                    "The model is not ready yet, too many requests are waiting for it"
+                )
+            self.waiting_for_model += 1
+            try:
+                await asyncio.wait_for(
+                    self.model_ready.wait(), self.model_wait_timeout_s
+                )
+            except asyncio.TimeoutError:
+                raise ModelNotReadyError("The model is not ready yet") from None
+            finally:
+                self.waiting_for_model -= 1
+
+        if self.model_error is not None:
+            raise ModelNotReadyError(f"The model failed to load: {self.model_error}")
+
+    async def http_app(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/ready":
+            ready = self.is_model_ready()
+            await self._send_json(
+                send, 200 if ready else 503, {"ready": ready, "error": self.model_error}
+            )
+            return
+        if scope["type"] == "http" and scope["path"] == "/admin/profile":
+            await self._send_json(send, *await self.profile_route(scope))
+            return
+        await self._metrics_app(scope, receive, send)
+
+    @staticmethod
+    async def _send_json(send, status: int, body: dict) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+    async def profile_route(self, scope) -> tuple[int, dict]:
+        """
+        POST /admin/profile?requests=100&seconds=30&mode=sampler starts a profile of the
+        next requests, GET returns the one being recorded or the last one, DELETE stops
+        it early and returns once it is written.
+        Only with the admin token, in an "Authorization: Bearer <token>" header
+        """
+        if not self.admin_token:
+            return 404, {"error": "The admin routes are disabled"}
+        headers = dict(scope.get("headers", []))
+        expected = f"Bearer {self.admin_token}".encode()
+        if not hmac.compare_digest(headers.get(b"authorization", b""), expected):
+            return 403, {"error": "Invalid admin token"}
+
+        if scope["method"] == "GET":
+            return 200, {"profile": self.profiler.session}
+        if scope["method"] == "DELETE":
+            return 200, {"profile": await self.profiler.stop_async()}
+        if scope["method"] != "POST":
+            return 405, {"error": "Only GET, POST and DELETE are allowed"}
+
+        query = parse_qs(scope.get("query_string", b"").decode())
+        try:
+            session = self.profiler.start(
+                int(query.get("requests", [PROFILE_MAX_REQUESTS])[0]),
+                float(query.get("seconds", [PROFILE_MAX_S])[0]),
+                query.get("mode", ["sampler"])[0],
+            )
+        except ProfilerBusyError as e:
+            return 409, {"error": str(e), "profile": self.profiler.session}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        return 202, {"profile": session}
 
     async def connect(self, sid, environ, auth):
-        print("Client connected:", sid)
-        await self.sio.emit("message", {"data": "Connected"}, to=sid)
+        logger.info("Client connected: %s", sid)
+        self.connected.add(sid)
+        await self.sio.emit(
+            "message", {"data": "Connected", "protocol": PROTOCOL_VERSION}, to=sid
+        )
 
     async def disconnect(self, sid):
-        print("Client disconnected:", sid)
+        logger.info("Client disconnected: %s", sid)
+        self.connected.discard(sid)
+        # Nobody is left to answer
+        self.client_scheduler.drop(sid, cancel_running=True)
+        stream = self.streams.pop(sid, None)
+        if stream is not None:
+            stream.cancel()
+
+    async def respond(
+        self,
+        sid,
+        event: str,
+        reply: str,
+        request,
+        handle,
+        *args,
+        supersedes=False,
+        group=None,
+    ):
+        """
+        Runs the handler of an event once the client scheduler allows it, in the group
+        if given, and answers the client with its response, or its error.
+        Version 3 requests are answered through their acknowledgement, by returning the
+        response, the others with the reply event. The request's ID is echoed in both
+        """
+        metrics.increment("requests_total", event=event)
+        with metrics.time(event):
+            try:
+                response = await self.client_scheduler.run(
+                    sid, lambda: handle(*args), supersedes, group
+                )
+            except RequestRejectedError as e:
+                metrics.increment("rejected_total", event=event, status=e.status)
+                response = {"error": str(e), "status": e.status}
+                logger.warning("%s %s for %s", event, e.status, sid)
+            except Exception as e:
+                metrics.increment("errors_total", event=event)
+                response = {"error": str(e)}
+                if isinstance(e, ModelNotReadyError):
+                    response["status"] = "not_ready"
+                logger.exception("Failed to handle %s", event)
+        if self.profiler.active:
+            self.profiler.request_done()
+
+        if request_id(request) is not None:
+            response["id"] = request_id(request)
+        if answers_with_ack(request):
+            return response
+        with metrics.time("emit"):
+            await self.sio.emit(reply, response, to=sid)
 
     async def classify(self, sid, data):
-        try:
-            response = await self.handle_classify(data)
-        except Exception as e:
-            response = {"error": str(e)}
-            traceback.print_exc()
-        await self.sio.emit("classification", response, to=sid)
+        return await self.respond(
+            sid,
+            "classify",
+            "classification",
+            data,
+            self.handle_classify,
+            data,
+            supersedes=True,
+        )
 
     async def handle_classify(self, data):
-        point_list = [Point(point["x"], point["y"]) for point in data["points"]]
+        with metrics.time("decode"):
+            stroke = decode_stroke(data)
+        return self.classification_response(await self.classify_stroke(stroke))
+
+    def pre_classify(self, stroke: Stroke) -> Optional[tuple[str, float]]:
+        """
+        The result of a stroke that is obviously not a shape, None if it must be classified
+        """
+        with metrics.time("fast_path"):
+            reason = self.pre_classifier.check(stroke.array)
+        if reason is None:
+            return None
+        metrics.increment("fast_path_total", reason=reason)
+        return self.pre_classifier.RESULT
+
+    async def classify_stroke(self, stroke) -> tuple[str, float]:
+        result = self.pre_classify(stroke)
+        if result is not None:
+            return result
+
+        self.in_flight += 1
+        try:
+            # Render the stroke straight to the model's input tensor
+            with metrics.time("render"):
+                tensor = await self.executor.render(self.image_generator, stroke)
 
-        stroke = Stroke(point_list)
+            if self.debug_export:
+                self.image_generator.export_image(
+                    self.image_generator.generate_image(stroke)
+                )
+                exported_path = self.image_generator.export_array(tensor)
+                logger.debug("Exported image to %s", exported_path)
 
-        # Generate image from stroke
-        image_generator = ImageGenerator(dimensions=(70, 70))
-        image = image_generator.generate_image(stroke)
-        exported_path = image_generator.export_image(image)
-        print(f"Exported image to {exported_path}")
+            # Classify, unless the same image was classified recently
+            with metrics.time("cache"):
+                cache_key = self.result_cache.key(tensor)
+                result = self.result_cache.get(cache_key)
+            if result is None:
+                await self.wait_for_model()
+                result = await self.batch_scheduler.classify(tensor)
+                self.result_cache.put(cache_key, result)
+            self.capture_writer.capture(stroke.array, tensor, result)
+            return result
+        finally:
+            self.in_flight -= 1
 
-        # Load image and classify
-        prediction, likelihood = self.model_loader.classify(exported_path)
+    async def classify_batch(self, sid, data):
+        return await self.respond(
+            sid,
+            "classify_batch",
+            "classification_batch",
+            data,
+            self.handle_classify_batch,
+            data,
+        )
 
-        # Return response
+    async def handle_classify_batch(self, data):
+        """
+        Classifies a list of strokes with a single render and a single forward pass.
+        Results are in the order of the strokes, a stroke that fails only fails its own result
+        """
+        payloads = data["strokes"]
+        if len(payloads) > CLASSIFY_BATCH_MAX_STROKES:
+            raise ValueError(
+                f"Too many strokes, at most {CLASSIFY_BATCH_MAX_STROKES} are accepted"
+            )
+
+        results: list[Optional[dict]] = [None] * len(payloads)
+        strokes = {}
+        with metrics.time("decode"):
+            for index, payload in enumerate(payloads):
+                try:
+                    strokes[index] = decode_stroke(payload)
+                except Exception as e:
+                    results[index] = {"error": str(e)}
+
+        # Obvious lines and scribbles are answered without being rendered
+        for index in list(strokes):
+            result = self.pre_classify(strokes[index])
+            if result is not None:
+                results[index] = self.classification_response(result)
+                del strokes[index]
+
+        self.in_flight += len(strokes)
+        try:
+            return await self._classify_strokes(strokes, results)
+        finally:
+            self.in_flight -= len(strokes)
+
+    async def _classify_strokes(
+        self, strokes: dict[int, Stroke], results: list[Optional[dict]]
+    ) -> dict:
+        with metrics.time("render"):
+            tensors = await self._render_strokes(strokes, results)
+
+        # Only the images that were not classified recently go through the model
+        cache_keys = {
+            index: self.result_cache.key(tensor) for index, tensor in tensors.items()
+        }
+        misses = []
+        for index, cache_key in cache_keys.items():
+            cached = self.result_cache.get(cache_key)
+            if cached is None:
+                misses.append(index)
+            else:
+                self.capture_writer.capture(
+                    strokes[index].array, tensors[index], cached
+                )
+                results[index] = self.classification_response(cached)
+
+        if misses:
+            try:
+                await self.wait_for_model()
+                classified = await self.executor.classify_batch(
+                    np.concatenate([tensors[index] for index in misses])
+                )
+            except Exception as e:
+                logger.exception("Failed to classify a batch of strokes")
+                for index in misses:
+                    results[index] = {"error": str(e)}
+            else:
+                for index, result in zip(misses, classified):
+                    self.result_cache.put(cache_keys[index], result)
+                    self.capture_writer.capture(
+                        strokes[index].array, tensors[index], result
+                    )
+                    results[index] = self.classification_response(result)
+
+        return {"results": results}
+
+    async def _render_strokes(
+        self, strokes: dict[int, Stroke], results: list[Optional[dict]]
+    ) -> dict[int, np.ndarray]:
+        """
+        Renders the strokes by index, all at once. If that fails, they are rendered
+        one at a time to find out which ones failed, and their errors are stored in results
+        """
+        indices = list(strokes)
+        try:
+            images = await self.executor.render_batch(
+                self.image_generator, [strokes[index] for index in indices]
+            )
+            return {index: images[i : i + 1] for i, index in enumerate(indices)}
+        except Exception:
+            logger.exception(
+                "Failed to render a batch of strokes, rendering them one by one"
+            )
+
+        tensors = {}
+        for index in indices:
+            try:
+                tensors[index] = await self.executor.render(
+                    self.image_generator, strokes[index]
+                )
+            except Exception as e:
+                results[index] = {"error": str(e)}
+        return tensors
+
+    def classification_response(self, result: tuple[str, float]) -> dict:
+        prediction, likelihood = result
         return {"classification": {"prediction": prediction, "confidence": likelihood}}
 
-    def run(self):
+    async def stroke_begin(self, sid, data=None):
+        metrics.increment("requests_total", event="stroke_begin")
+        previous = self.streams.pop(sid, None)
+        if previous is not None:
+            previous.cancel()
+        self.streams[sid] = StrokeStream()
+        if data:
+            await self.stroke_points(sid, data)
+
+    async def stroke_points(self, sid, data, speculate: bool = True):
+        """
+        Every chunk of points is a classify payload of its own, in any version
+        """
+        metrics.increment("requests_total", event="stroke_points")
+        stream = self.streams.get(sid)
+        if stream is None:
+            # The beginning of the stroke was missed, start from here
+            stream = self.streams[sid] = StrokeStream()
+        try:
+            stream.extend(decode_stroke(data).array)
+        except Exception as e:
+            # Reported once the stroke ends
+            stream.error = str(e)
+            metrics.increment("errors_total", event="stroke_points")
+            logger.exception("Failed to decode a chunk of stroke")
+            return
+
+        if (
+            speculate
+            and self.speculate
+            and stream.speculation is None
+            and stream.looks_closed()
+        ):
+            stream.speculation_length = len(stream)
+            stream.speculation = asyncio.create_task(
+                self.speculate_classification(sid, stream, stream.stroke)
+            )
+
+    async def speculate_classification(
+        self, sid, stream: StrokeStream, stroke
+    ) -> Optional[tuple[str, float]]:
+        async def classify():
+            stream.speculation_started = True
+            return await self.classify_stroke(stroke)
+
+        # Waits for its turn like the other requests of the client, without replacing
+        # them, and the end of its stroke keeps it
+        try:
+            result = await self.client_scheduler.run(sid, classify, group=stream)
+        except RequestRejectedError as e:
+            logger.debug("Speculative classification %s for %s", e.status, sid)
+            return None
+        except Exception:
+            # The stroke is classified again once it ends
+            logger.exception("Failed to classify a stroke speculatively")
+            return None
+
+        response = self.classification_response(result)
+        response["points"] = len(stroke)
+        await self.sio.emit("speculative_classification", response, to=sid)
+        return result
+
+    async def stroke_end(self, sid, data=None):
+        # Version 3 clients may only send the request's ID
+        if data and "points" in data:
+            # The stroke ends right away, its own request classifies it
+            await self.stroke_points(sid, data, speculate=False)
+        stream = self.streams.pop(sid, None)
+        return await self.respond(
+            sid,
+            "stroke_end",
+            "classification",
+            data,
+            self.handle_stroke_end,
+            stream,
+            supersedes=True,
+            group=stream,
+        )
+
+    async def handle_stroke_end(self, stream: Optional[StrokeStream]):
+        if stream is None:
+            raise ValueError("No stroke in progress")
+        if stream.error is not None:
+            raise ValueError(stream.error)
+
+        result = None
+        if stream.speculation is not None:
+            if stream.speculation_length == len(stream) and stream.speculation_started:
+                # The stroke ended where it was speculatively classified
+                result = await stream.speculation
+            else:
+                # More points came, or it still waits for its turn behind this request,
+                # which classifies the stroke, its image may even be cached already
+                stream.cancel()
+        if result is None:
+            result = await self.classify_stroke(stream.stroke)
+        return self.classification_response(result)
+
+    async def stats(self, sid, data=None):
+        stats = {
+            "batching": self.batch_scheduler.stats(),
+            "executor": self.executor.stats(),
+            "cache": self.result_cache.stats(),
+            "fast_path": self.pre_classifier.stats(),
+            "scheduling": self.client_scheduler.stats(),
+            "capture": self.capture_writer.stats(),
+            "streams": len(self.streams),
+        }
+        await self.sio.emit("stats", stats, to=sid)
+
+    def register_events(self) -> None:
         self.sio.event(self.connect)
         self.sio.event(self.disconnect)
         self.sio.event(self.classify)
+        self.sio.event(self.classify_batch)
+        self.sio.event(self.stroke_begin)
+        self.sio.event(self.stroke_points)
+        self.sio.event(self.stroke_end)
+        self.sio.event(self.stats)
+
+    def run(self, sockets: Optional[list] = None, **uvicorn_options):
+        self.register_events()
         import uvicorn
 
-        uvicorn.run(self.app, host=self.host, port=self.port)
+        try:
+            if sockets is None:
+                uvicorn.run(self.app, host=self.host, port=self.port, **uvicorn_options)
+            else:
+                # Already bound, by the MultiProcessServer sharing them between processes
+                config = uvicorn.Config(self.app, **uvicorn_options)
+                uvicorn.Server(config).run(sockets=sockets)
+        finally:
+            self.executor.shutdown()
+            self.capture_writer.close()
+            self.profiler.stop()
@@ -0,0 +1,124 @@
+"""
+Payload formats of the classify event.
+
+Version 1 (legacy), a JSON list of points:
+    {"points": [{"x": 10, "y": 20}, ...]}
+
+Version 2, the coordinates packed in a binary attachment:
+    {"version": 2, "dtype": "int16" | "float32", "delta": bool, "points": <bytes>}
+
+The attachment holds interleaved little-endian x, y coordinates. When delta is set,
+every point but the first is stored as the difference with the previous one.
+
+Version 3, the payload of version 2 with an optional request ID of the client:
+    {"version": 3, "dtype": ..., "delta": ..., "points": <bytes>, "id": str | int}
+
+Version 3 requests are answered through the socket.io acknowledgement callback of the
+event that carried them, instead of a reply event, so a client can have many of them
+in flight at once and get their answers in any order. Requests of earlier versions
+are answered with the reply event. Either way, the answer carries the request's "id"
+when it has one, clients that can't use acknowledgements match the replies with it.
+
+Strokes can also be streamed while they are drawn, with the stroke_begin, stroke_points
+and stroke_end events. Each of them carries a chunk of the stroke in one of the payloads
+above (optional for stroke_begin and stroke_end), delta encoding restarts in every chunk.
+
+The classify_batch event classifies many strokes at once, each in one of the payloads above:
+    {"strokes": [<payload>, ...], "version"?: 3, "id"?: str | int}
+and is answered on classification_batch, with a result or an error for every stroke:
+    {"results": [{"classification": {...}} | {"error": str}, ...]}
+
+Errors are answered as {"error": str}, with a "status" when the request may be sent
+again later: "not_ready" while the model loads, "busy" when the server refuses new
+requests, "dropped" or "cancelled" when newer requests of the client replaced it.
+
+The server sends the latest version it supports on connection, in the "protocol" field
+of its first message
+"""
+
+import numpy as np
+from whiteboard_ai.core.primitives.Stroke import Stroke
+
+PROTOCOL_VERSION = 3
+# First version answered through acknowledgements
+ACK_VERSION = 3
+
+POINT_DTYPES = {"int16": np.dtype("<i2"), "float32": np.dtype("<f4")}
+
+
+def decode_stroke(data: dict) -> Stroke:
+    """
+    Builds a stroke from a classify payload, in any supported version
+    """
+    version = data.get("version", 1)
+    if version == 1:
+        return Stroke.from_array(
+            np.array([(point["x"], point["y"]) for point in data["points"]])
+        )
+    if version in (2, 3):
+        return _decode_packed_points(data)
+    raise ValueError(f"Unsupported classify payload version {version}")
+
+
+def answers_with_ack(data) -> bool:
+    """
+    Whether a request is answered through its acknowledgement, instead of a reply event
+    """
+    if not isinstance(data, dict):
+        return False
+    # Malformed versions are answered with the reply event, with the error of the handler
+    version = data.get("version", 1)
+    return isinstance(version, int) and version >= ACK_VERSION
+
+
+def request_id(data):
+    """The ID the client gave to a request, None if it did not"""
+    return data.get("id") if isinstance(data, dict) else None
+
+
+def encode_points(
+    points: np.ndarray,
+    dtype: str = "int16",
+    delta: bool = False,
+    version: int = 2,
+    request_id=None,
+) -> dict:
+    """
+    Builds a version 2 payload from an (N, 2) array of coordinates,
+    or a version 3 one, with the request ID if given
+    """
+    if dtype not in POINT_DTYPES:
+        raise ValueError(f"Unsupported point dtype {dtype}")
+
+    points = np.asarray(points)
+    if delta and len(points) > 0:
+        points = np.concatenate([points[:1], np.diff(points, axis=0)])
+
+    payload = {
+        "version": version,
+        "dtype": dtype,
+        "delta": delta,
+        "points": points.astype(POINT_DTYPES[dtype]).tobytes(),
+    }
+    if request_id is not None:
+        payload["id"] = request_id
+    return payload
+
+
+def _decode_packed_points(data: dict) -> Stroke:
+    dtype = POINT_DTYPES.get(data.get("dtype", "float32"))
+    if dtype is None:
+        raise ValueError(f"Unsupported point dtype {data['dtype']}")
+
+    buffer = data["points"]
+    if len(buffer) % (2 * dtype.itemsize) != 0:
+        raise ValueError("Truncated point buffer")
+
+    # No copy is made here, the array is a view of the received attachment
+    points = np.frombuffer(buffer, dtype=dtype).reshape(-1, 2)
+
+    if data.get("delta", False):
+        return Stroke.from_array(np.cumsum(points, axis=0, dtype=np.float32))
+    if dtype == np.float32:
+        return Stroke.from_array(points)
+    return Stroke.from_array(points.astype(np.float32))
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+
+import numpy as np
+from whiteboard_ai.server.BatchScheduler import BatchScheduler
+from whiteboard_ai.server.PipelineExecutor import PipelineExecutor
+
+
+class FakeModelLoader:
+    """Classifies an image by the value of its first pixel, and records the batch sizes"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def classify_batch(self, images):
+        self.batch_sizes.append(len(images))
+        return [("other", float(image[0, 0, 0])) for image in images]
+
+
+def make_tensor(value):
+    return np.full((1, 70, 70, 1), value, dtype=np.float32)
+
+
+class TestBatchScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_are_batched(self):
+        model_loader = FakeModelLoader()
+        scheduler = BatchScheduler(
+            PipelineExecutor(model_loader, "inline"), window_ms=20, max_batch_size=32
+        )
+        self.addAsyncCleanup(scheduler.close)
+
+        values = [i / 10 for i in range(10)]
+        results = await asyncio.gather(
+            *(scheduler.classify(make_tensor(value)) for value in values)
+        )
+
+        self.assertEqual(model_loader.batch_sizes, [10])
+        self.assertEqual(dict(scheduler.batch_size_histogram), {10: 1})
+        for value, (_, likelihood) in zip(values, results):
+            self.assertAlmostEqual(likelihood, value, places=6)
+
+    async def test_max_batch_size(self):
+        model_loader = FakeModelLoader()
+        scheduler = BatchScheduler(
+            PipelineExecutor(model_loader, "inline"), window_ms=20, max_batch_size=4
+        )
+        self.addAsyncCleanup(scheduler.close)
+
+        await asyncio.gather(*(scheduler.classify(make_tensor(0)) for _ in range(10)))
+
+        self.assertEqual(model_loader.batch_sizes, [4, 4, 2])
+
+    async def test_errors_are_propagated(self):
+        class FailingModelLoader:
+            def classify_batch(self, images):
+                raise ValueError("broken model")
+
+        scheduler = BatchScheduler(
+            PipelineExecutor(FailingModelLoader(), "inline"), window_ms=1
+        )
+        self.addAsyncCleanup(scheduler.close)
+
+        with self.assertRaises(ValueError):
+            await scheduler.classify(make_tensor(0))
+
+    async def test_close_cancels_the_waiting_images(self):
+        model_loader = FakeModelLoader()
+        scheduler = BatchScheduler(
+            PipelineExecutor(model_loader, "inline"), window_ms=100
+        )
+        waiting = [
+            asyncio.create_task(scheduler.classify(make_tensor(0))) for _ in range(2)
+        ]
+        await asyncio.sleep(0.01)
+
+        await scheduler.close()
+        for task in waiting:
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(model_loader.batch_sizes, [])
+        self.assertEqual(scheduler.stats()["pending"], 0)
+
+        # The worker starts again on the next image
+        self.assertEqual(await scheduler.classify(make_tensor(0.5)), ("other", 0.5))
+        await scheduler.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from whiteboard_ai.server.CaptureWriter import CaptureWriter
+
+
+def make_tensor(value):
+    return np.full((1, 70, 70, 1), value, dtype=np.float32)
+
+
+class BlockedCaptureWriter(CaptureWriter):
+    """Only writes its shards once allowed to"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.allowed = threading.Event()
+
+    def _write_shard(self, records, name):
+        self.allowed.wait(5)
+        super()._write_shard(records, name)
+
+
+class FailingCaptureWriter(CaptureWriter):
+    """Fails to write its first shard, leaving its directory behind"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.failed = False
+
+    def _write_shard(self, records, name):
+        if not self.failed:
+            self.failed = True
+            os.makedirs(os.path.join(self.directory, name, "images.npy"))
+            raise OSError("No space left on device")
+        super()._write_shard(records, name)
+
+
+class TestCaptureWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self):
+        with open(os.path.join(self.directory.name, "index.jsonl")) as file:
+            index = [json.loads(line) for line in file]
+        shards = []
+        for shard in index:
+            path = os.path.join(self.directory.name, shard["name"])
+            shards.append(
+                {
+                    name: np.load(os.path.join(path, f"{name}.npy"))
+                    for name in ["images", "labels", "confidences", "points", "offsets"]
+                }
+            )
+        return index, shards
+
+    def test_strokes_are_written_in_shards(self):
+        writer = CaptureWriter(True, self.directory.name, sample_rate=1.0, shard_size=2)
+        strokes = [np.arange(2 * (i + 2)).reshape(-1, 2) for i in range(3)]
+        results = [("ellipse", 0.9), ("other", 0.5), ("triangle", 0.75)]
+        for i, (points, result) in enumerate(zip(strokes, results)):
+            self.assertTrue(writer.capture(points, make_tensor(i / 4), result))
+        writer.close()
+
+        index, shards = self.load()
+        self.assertEqual([shard["count"] for shard in index], [2, 1])
+        self.assertEqual(writer.stats()["written"], 3)
+        self.assertEqual(shards[0]["images"].dtype, np.uint8)
+        self.assertEqual(shards[0]["images"].shape, (2, 70, 70))
+        self.assertEqual(shards[0]["images"][1, 0, 0], 64)
+        np.testing.assert_array_equal(shards[0]["labels"], [1, 0])
+        np.testing.assert_allclose(shards[1]["confidences"], [0.75])
+
+        # Every stroke is found back from the offsets
+        points, offsets = shards[0]["points"], shards[0]["offsets"]
+        for i in range(2):
+            np.testing.assert_array_equal(
+                points[offsets[i] : offsets[i + 1]], strokes[i]
+            )
+        # Nothing is left half written
+        self.assertFalse(
+            [name for name in os.listdir(self.directory.name) if "partial" in name]
+        )
+
+    def test_only_a_sample_is_captured(self):
+        writer = CaptureWriter(True, self.directory.name, sample_rate=0.25, seed=0)
+        captured = sum(
+            writer.capture(np.zeros((2, 2)), make_tensor(1), ("other", 1.0))
+            for _ in range(400)
+        )
+        writer.close()
+        self.assertGreater(captured, 60)
+        self.assertLess(captured, 140)
+
+        disabled = CaptureWriter(False, self.directory.name, sample_rate=1.0)
+        self.assertFalse(
+            disabled.capture(np.zeros((2, 2)), make_tensor(1), ("other", 1.0))
+        )
+
+    def test_full_queue_drops_strokes_without_waiting(self):
+        writer = BlockedCaptureWriter(
+            directory=self.directory.name,
+            enabled=True,
+            sample_rate=1.0,
+            max_queue=2,
+            shard_size=1,
+        )
+        queued = [
+            writer.capture(np.zeros((2, 2)), make_tensor(1), ("other", 1.0))
+            for _ in range(6)
+        ]
+        # One is being written, two wait, the others are dropped
+        self.assertEqual(sum(queued), writer.captured)
+        self.assertGreaterEqual(writer.dropped, 3)
+
+        writer.allowed.set()
+        writer.close()
+        self.assertEqual(writer.stats()["written"], writer.captured)
+        self.assertEqual(writer.stats()["queued"], 0)
+
+    def test_shard_is_written_after_the_flush_interval(self):
+        writer = CaptureWriter(
+            True, self.directory.name, sample_rate=1.0, flush_interval_s=0.05
+        )
+        writer.capture(np.zeros((2, 2)), make_tensor(1), ("rectangle", 0.8))
+        writer._thread.join(0.5)
+        self.assertEqual(writer.shards, 1)
+        writer.close()
+
+        index, shards = self.load()
+        self.assertEqual(len(index), 1)
+        np.testing.assert_array_equal(shards[0]["labels"], [2])
+
+    def test_failed_shard_names_are_not_reused(self):
+        writer = FailingCaptureWriter(
+            directory=self.directory.name, enabled=True, sample_rate=1.0, shard_size=1
+        )
+        for label in ["ellipse", "triangle"]:
+            writer.capture(np.zeros((2, 2)), make_tensor(1), (label, 0.9))
+        writer.close()
+
+        stats = writer.stats()
+        self.assertEqual(
+            (stats["errors"], stats["shards"], stats["written"]), (1, 1, 1)
+        )
+        # The second shard did not collide with the directory the first one left
+        self.assertEqual(len(os.listdir(self.directory.name)), 3)
+        index, shards = self.load()
+        self.assertTrue(index[0]["name"].endswith("-00001"))
+        np.testing.assert_array_equal(shards[0]["labels"], [3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import asyncio
+import unittest
+
+from whiteboard_ai.server.ClientScheduler import ClientScheduler, RequestRejectedError
+
+
+class Jobs:
+    """Jobs that only finish once released, recording the order they started in"""
+
+    def __init__(self):
+        self.started = []
+        self.release = asyncio.Event()
+
+    def job(self, name):
+        async def run():
+            self.started.append(name)
+            await self.release.wait()
+            return name
+
+        return run
+
+
+class TestClientScheduler(unittest.IsolatedAsyncioTestCase):
+    async def submit(self, scheduler, jobs, sid, name, supersedes=False):
+        task = asyncio.create_task(scheduler.run(sid, jobs.job(name), supersedes))
+        await asyncio.sleep(0)
+        return task
+
+    async def test_requests_run_up_to_the_limit(self):
+        scheduler = ClientScheduler(max_concurrent=2, max_pending=10)
+        jobs = Jobs()
+        tasks = [await self.submit(scheduler, jobs, "a", i) for i in range(4)]
+
+        self.assertEqual(jobs.started, [0, 1])
+        self.assertEqual((scheduler.active, scheduler.queued), (2, 2))
+        jobs.release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [0, 1, 2, 3])
+        self.assertEqual((scheduler.active, scheduler.queued), (0, 0))
+
+    async def test_clients_are_served_in_turn(self):
+        scheduler = ClientScheduler(max_concurrent=1, max_pending=10)
+        jobs = Jobs()
+        tasks = [await self.submit(scheduler, jobs, "a", "a0")]
+        # The first client sends many requests before the second one sends its own
+        tasks += [await self.submit(scheduler, jobs, "a", f"a{i}") for i in range(1, 4)]
+        tasks += [await self.submit(scheduler, jobs, "b", f"b{i}") for i in range(2)]
+
+        jobs.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(jobs.started, ["a0", "a1", "b0", "a2", "b1", "a3"])
+
+    async def test_busy_server_sheds_requests(self):
+        scheduler = ClientScheduler(max_concurrent=1, max_pending=2)
+        jobs = Jobs()
+        tasks = [await self.submit(scheduler, jobs, sid, sid) for sid in "ab"]
+
+        with self.assertRaises(RequestRejectedError) as context:
+            await scheduler.run("c", jobs.job("c"))
+        self.assertEqual(context.exception.status, "busy")
+        self.assertEqual(scheduler.shed, 1)
+
+        jobs.release.set()
+        await asyncio.gather(*tasks)
+        # Accepted again once the others are done
+        self.assertEqual(await scheduler.run("c", jobs.job("c")), "c")
+
+    async def test_full_queue_drops_the_oldest_request(self):
+        scheduler = ClientScheduler(max_concurrent=1, max_pending=10, max_per_client=2)
+        jobs = Jobs()
+        tasks = [await self.submit(scheduler, jobs, "a", i) for i in range(4)]
+
+        jobs.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertEqual(results[0], 0)
+        self.assertEqual(results[1].status, "dropped")
+        self.assertEqual(results[2:], [2, 3])
+        self.assertEqual(scheduler.dropped, 1)
+
+    async def test_superseded_requests_are_dropped(self):
+        scheduler = ClientScheduler(max_concurrent=1, max_pending=10, supersede="drop")
+        jobs = Jobs()
+        tasks = [await self.submit(scheduler, jobs, "a", i, True) for i in range(3)]
+        # Other clients, and requests that supersede nothing, are kept
+        tasks.append(await self.submit(scheduler, jobs, "b", "b", True))
+        tasks.append(await self.submit(scheduler, jobs, "a", 3))
+
+        jobs.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertEqual(results[0], 0)
+        self.assertEqual(results[1].status, "dropped")
+        self.assertEqual(results[2:], [2, "b", 3])
+        self.assertEqual((scheduler.dropped, scheduler.cancelled), (1, 0))
+
+    async def test_superseded_requests_are_cancelled(self):
+        scheduler = ClientScheduler(
+            max_concurrent=2, max_pending=10, supersede="cancel"
+        )
+        jobs = Jobs()
+        first = await self.submit(scheduler, jobs, "a", 0, True)
+        second = await self.submit(scheduler, jobs, "a", 1, True)
+
+        with self.assertRaises(RequestRejectedError) as context:
+            await first
+        self.assertEqual(context.exception.status, "cancelled")
+        jobs.release.set()
+        self.assertEqual(await second, 1)
+        self.assertEqual(scheduler.cancelled, 1)
+        self.assertEqual(scheduler.active, 0)
+
+    async def test_requests_of_a_group_are_kept(self):
+        scheduler = ClientScheduler(
+            max_concurrent=1, max_pending=10, supersede="cancel"
+        )
+        jobs = Jobs()
+        group = object()
+        running = asyncio.create_task(scheduler.run("a", jobs.job(0), group=group))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(scheduler.run("a", jobs.job(1), group=group))
+        other = await self.submit(scheduler, jobs, "a", 2)
+        last = asyncio.create_task(scheduler.run("a", jobs.job(3), True, group))
+        await asyncio.sleep(0)
+
+        jobs.release.set()
+        results = await asyncio.gather(
+            running, waiting, other, last, return_exceptions=True
+        )
+        self.assertEqual(results[:2], [0, 1])
+        self.assertEqual(results[2].status, "dropped")
+        self.assertEqual(results[3], 3)
+        self.assertEqual((scheduler.dropped, scheduler.cancelled), (1, 0))
+
+    async def test_disconnected_client_is_dropped(self):
+        scheduler = ClientScheduler(max_concurrent=1, max_pending=10)
+        jobs = Jobs()
+        running = await self.submit(scheduler, jobs, "a", 0)
+        waiting = await self.submit(scheduler, jobs, "a", 1)
+        other = await self.submit(scheduler, jobs, "b", "b")
+
+        scheduler.drop("a", cancel_running=True)
+        results = await asyncio.gather(running, waiting, return_exceptions=True)
+        self.assertEqual([error.status for error in results], ["cancelled", "dropped"])
+        jobs.release.set()
+        self.assertEqual(await other, "b")
+        self.assertEqual(scheduler.stats()["active"], 0)
+
+    async def test_cancelled_waiting_request_leaves_the_queue(self):
+        scheduler = ClientScheduler(max_concurrent=1, max_pending=10)
+        jobs = Jobs()
+        running = await self.submit(scheduler, jobs, "a", 0)
+        waiting = await self.submit(scheduler, jobs, "b", 1)
+
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(scheduler.queued, 0)
+        jobs.release.set()
+        await running
+        self.assertEqual(jobs.started, [0])
+        self.assertEqual(scheduler.active, 0)
+
+    def test_unknown_supersede_mode(self):
+        with self.assertRaises(ValueError):
+            ClientScheduler(supersede="always")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+
+import numpy as np
+from whiteboard_ai.core.GeometricPreClassifier import GeometricPreClassifier
+
+
+def rotate(points, angle):
+    rotation = np.array(
+        [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+    )
+    return points @ rotation.T
+
+
+def drawn(points, rng, noise):
+    """Places the points at a random rotation and position, with a jittered pen"""
+    points = rotate(points, rng.uniform(0, 2 * np.pi)) + rng.uniform(0, 800, 2)
+    return np.round(points + rng.normal(0, noise, points.shape))
+
+
+def shapes(count, seed=0):
+    """Closed ellipses, rectangles and triangles, the strokes the model must classify"""
+    rng = np.random.default_rng(seed)
+    strokes = []
+    for i in range(count):
+        num_points = rng.integers(10, 400)
+        size = rng.uniform(30, 300, 2)
+        if i % 3 == 0:
+            angles = rng.uniform(0, 2 * np.pi) + np.linspace(0, 2 * np.pi, num_points)
+            points = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        else:
+            corners = (
+                np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+                if i % 3 == 1
+                else np.array([[0, 1], [-0.87, -0.5], [0.87, -0.5]])
+            )
+            closed = np.concatenate([corners, corners[:1]])
+            along = np.linspace(0, len(corners), num_points)
+            index = np.minimum(along.astype(int), len(corners) - 1)
+            fraction = (along - index)[:, None]
+            points = closed[index] * (1 - fraction) + closed[index + 1] * fraction
+        strokes.append(drawn(points * size, rng, rng.uniform(0.5, 4)))
+    return strokes
+
+
+def line(num_points, length, rng, noise=1.0, bend=0.0):
+    t = np.linspace(0, 1, num_points)
+    points = np.stack([t * length, bend * length * np.sin(np.pi * t)], axis=1)
+    return drawn(points, rng, noise)
+
+
+class TestGeometricPreClassifier(unittest.TestCase):
+    def setUp(self):
+        self.pre_classifier = GeometricPreClassifier(enabled=True)
+
+    def test_features(self):
+        square = np.array([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+        features = self.pre_classifier.features(square)
+
+        self.assertEqual(features["closure"], 0)
+        self.assertAlmostEqual(features["winding"], 1, places=5)
+        self.assertEqual(features["corners"], 3)
+
+        angles = np.linspace(0, 2 * np.pi, 100)
+        circle = np.stack([np.cos(angles), np.sin(angles)], axis=1) * 50
+        self.assertLess(self.pre_classifier.features(circle)["eccentricity"], 0.2)
+
+        features = self.pre_classifier.features(np.array([[0, 0], [5, 0], [10, 0]]))
+        self.assertEqual(features["closure"], 1)
+        self.assertEqual(features["eccentricity"], 1)
+        self.assertAlmostEqual(features["winding"], 0.5)
+
+    def test_strokes_without_extent_are_left_to_the_model(self):
+        for points in (np.empty((0, 2)), np.array([[3, 4]]), np.array([[3, 4]] * 5)):
+            self.assertIsNone(self.pre_classifier.features(points))
+            self.assertIsNone(self.pre_classifier.classify(points))
+
+    def test_lines_are_other(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            points = line(rng.integers(2, 300), rng.uniform(40, 600), rng)
+            self.assertEqual(self.pre_classifier.check(points), "line")
+            self.assertEqual(self.pre_classifier.classify(points), ("other", 1.0))
+
+    def test_scribbles_are_other(self):
+        zigzag = np.array([[x * 10, (x % 2) * 100] for x in range(20)])
+        self.assertEqual(self.pre_classifier.check(zigzag), "scribble")
+
+    def test_shapes_always_reach_the_model(self):
+        # The fast path can't make the model less accurate on shapes it never answers
+        for points in shapes(600):
+            self.assertIsNone(self.pre_classifier.classify(points))
+        self.assertEqual(self.pre_classifier.stats()["hit_ratio"], 0)
+
+    def test_unfinished_shapes_reach_the_model(self):
+        angles = np.linspace(0, 2 * np.pi, 100)
+        points = np.stack([300 + 100 * np.cos(angles), 200 + 50 * np.sin(angles)], 1)
+        for end in range(20, 101, 10):
+            self.assertIsNone(self.pre_classifier.classify(points[:end]))
+
+    def test_check_agrees_with_the_features(self):
+        rng = np.random.default_rng(1)
+        strokes = shapes(30) + [
+            line(100, 200, rng, noise=3, bend=rng.uniform(0, 0.3)) for _ in range(30)
+        ]
+        strokes += [np.cumsum(rng.normal(0, 8, (200, 2)), axis=0) for _ in range(30)]
+        for points in strokes:
+            self.assertEqual(
+                self.pre_classifier.check(points),
+                self.pre_classifier.reason(self.pre_classifier.features(points)),
+            )
+
+    def test_stats(self):
+        rng = np.random.default_rng(2)
+        self.pre_classifier.classify(line(50, 300, rng))
+        self.pre_classifier.classify(shapes(1)[0])
+
+        stats = self.pre_classifier.stats()
+        self.assertEqual(stats["checked"], 2)
+        self.assertEqual(stats["hits"], {"line": 1, "scribble": 0})
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_disabled(self):
+        pre_classifier = GeometricPreClassifier(enabled=False)
+        rng = np.random.default_rng(3)
+        self.assertIsNone(pre_classifier.classify(line(50, 300, rng)))
+        self.assertEqual(pre_classifier.stats()["checked"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
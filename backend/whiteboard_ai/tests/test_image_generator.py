@@ -1,6 +1,8 @@
 import os
 import unittest
 
+import cv2
+import numpy as np
 from whiteboard_ai.core.ImageGenerator import ImageGenerator
 from whiteboard_ai.core.primitives.Point import Point
 from whiteboard_ai.core.primitives.Stroke import Stroke
@@ -45,6 +47,31 @@ class TestImageGenerator(unittest.TestCase):
         image = generator.generate_image(stroke)
         self.assertEqual(image.size, generator.dimensions)
 
+    def test_render_array(self):
+        points = [Point(0, 0), Point(50, 50), Point(100, 0)]
+        stroke = Stroke(points)
+        generator = ImageGenerator((70, 70))
+
+        tensor = generator.render_array(stroke)
+        self.assertEqual(tensor.shape, (1, 70, 70, 1))
+        self.assertEqual(tensor.dtype, np.float32)
+        self.assertEqual(tensor.max(), 1.0)
+        self.assertEqual(tensor.min(), 0.0)
+
+    def test_render_array_matches_exported_image(self):
+        points = [Point(389, 534), Point(420, 300), Point(600, 320), Point(700, 520)]
+        stroke = Stroke(points)
+        generator = ImageGenerator((70, 70))
+
+        path = generator.export_image(
+            generator.generate_image(stroke), "temp/test_render_array.png"
+        )
+        loaded = cv2.imread(path, cv2.IMREAD_GRAYSCALE) / 255.0
+        os.remove(path)
+
+        tensor = generator.render_array(stroke)
+        np.testing.assert_allclose(tensor[0, :, :, 0], loaded, atol=1e-6)
+
     def test_export_image(self):
         # Draw a stroke in the browser, copy the points and paste them for util/point_parser_from_browser.py
         # It will generate a string that you can copy and paste here
@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+
+from whiteboard_ai.util.metrics import Histogram, Metrics
+
+
+async def get(app, path):
+    """Runs a GET request through an ASGI app, returns the status and the body"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": "GET", "path": path}, receive, send)
+    return messages[0]["status"], messages[1]["body"].decode()
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram([0.1, 0.2, 0.5])
+        for value in (0.05, 0.1, 0.15, 0.3, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.cumulative_counts(), [2, 3, 4, 5])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 2.6)
+
+    def test_stage_timer(self):
+        metrics = Metrics(buckets=[1.0])
+        with metrics.time("render"):
+            pass
+        with metrics.time("render"):
+            pass
+
+        self.assertEqual(metrics.stage_latency["render"].count, 2)
+
+    def test_disabled(self):
+        metrics = Metrics(enabled=False)
+        with metrics.time("render"):
+            pass
+        metrics.increment("requests_total", event="classify")
+
+        self.assertEqual(metrics.stage_latency, {})
+        self.assertEqual(metrics.counters, {})
+
+    def test_render(self):
+        metrics = Metrics(buckets=[0.5, 1.0], prefix="test")
+        metrics.observe("render", 0.25)
+        metrics.increment("requests_total", event="classify")
+        metrics.increment("requests_total", event="classify")
+        metrics.describe("requests_total", "Events received")
+        metrics.gauge("connected_clients", lambda: 3)
+
+        text = metrics.render()
+        self.assertIn(
+            'test_stage_latency_seconds_bucket{stage="render",le="0.5"} 1', text
+        )
+        self.assertIn(
+            'test_stage_latency_seconds_bucket{stage="render",le="+Inf"} 1', text
+        )
+        self.assertIn('test_stage_latency_seconds_count{stage="render"} 1', text)
+        self.assertIn("# HELP test_requests_total Events received", text)
+        self.assertIn('test_requests_total{event="classify"} 2', text)
+        self.assertIn("# TYPE test_connected_clients gauge", text)
+        self.assertIn("test_connected_clients 3", text)
+
+    def test_asgi_app(self):
+        metrics = Metrics(prefix="test")
+        metrics.gauge("connected_clients", lambda: 1)
+        app = metrics.asgi_app()
+
+        status, body = asyncio.run(get(app, "/metrics"))
+        self.assertEqual(status, 200)
+        self.assertIn("test_connected_clients 1", body)
+
+        status, _ = asyncio.run(get(app, "/elsewhere"))
+        self.assertEqual(status, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
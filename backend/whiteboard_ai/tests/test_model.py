@@ -0,0 +1,137 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from whiteboard_ai.model.backends import InferenceBackend
+from whiteboard_ai.model.model import CLASSES, ModelLoader
+
+
+def save_tiny_model() -> str:
+    """A small untrained model with the same input and output as the real one"""
+    inputs = tf.keras.layers.Input(shape=(70, 70, 1))
+    x = tf.keras.layers.Conv2D(4, (3, 3), strides=4)(inputs)
+    x = tf.keras.layers.Flatten()(x)
+    outputs = tf.keras.layers.Dense(len(CLASSES), activation="softmax")(x)
+    model = tf.keras.models.Model(inputs=inputs, outputs=outputs)
+
+    path = os.path.join(tempfile.mkdtemp(), "tiny.keras")
+    model.save(path)
+    return path
+
+
+def export_tflite(model_path: str) -> str:
+    """Converts the model like ai/export.py does, without the int8 quantization"""
+    model = tf.keras.models.load_model(model_path)
+    saved_model_dir = tempfile.mkdtemp()
+    model.export(saved_model_dir, format="tf_saved_model")
+
+    path = os.path.join(tempfile.mkdtemp(), "tiny.tflite")
+    with open(path, "wb") as file:
+        file.write(tf.lite.TFLiteConverter.from_saved_model(saved_model_dir).convert())
+    return path
+
+
+def export_onnx(model_path: str) -> str:
+    import tf2onnx
+
+    model = tf.keras.models.load_model(model_path)
+    onnx_model, _ = tf2onnx.convert.from_function(
+        tf.function(lambda images: model(images, training=False)),
+        input_signature=[tf.TensorSpec((None, 70, 70, 1), tf.float32, name="image")],
+    )
+
+    path = os.path.join(tempfile.mkdtemp(), "tiny.onnx")
+    with open(path, "wb") as file:
+        file.write(onnx_model.SerializeToString())
+    return path
+
+
+class TestModelLoader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model_path = save_tiny_model()
+        cls.images = np.random.default_rng(0).random((5, 70, 70, 1), dtype=np.float32)
+
+    def test_compiled_matches_predict(self):
+        reference = ModelLoader(self.model_path, compiled=False).predict(self.images)
+        compiled = ModelLoader(self.model_path, compiled=True).predict(self.images)
+
+        self.assertEqual(compiled.shape, (5, len(CLASSES)))
+        np.testing.assert_allclose(compiled, reference, atol=1e-5)
+
+    def test_batches_larger_than_max_batch_size(self):
+        model_loader = ModelLoader(self.model_path, max_batch_size=2)
+        self.assertEqual(model_loader.batch_sizes, [1, 2])
+
+        results = model_loader.classify_batch(self.images)
+        self.assertEqual(len(results), 5)
+        for class_name, likelihood in results:
+            self.assertIn(class_name, CLASSES.values())
+            self.assertTrue(0 <= likelihood <= 1)
+
+    def test_classify_array(self):
+        model_loader = ModelLoader(self.model_path)
+
+        class_name, _ = model_loader.classify_array(self.images[:1])
+        expected_id = np.argmax(model_loader.predict(self.images[:1])[0])
+        self.assertEqual(class_name, CLASSES[expected_id])
+
+    def test_lazy_loading(self):
+        model_loader = ModelLoader(self.model_path, lazy=True)
+        self.assertFalse(model_loader.loaded)
+
+        class_name, _ = model_loader.classify_array(self.images[:1])
+        self.assertTrue(model_loader.loaded)
+        self.assertIn(class_name, CLASSES.values())
+
+
+class TestInferenceBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model_path = save_tiny_model()
+        cls.images = np.random.default_rng(0).random((5, 70, 70, 1), dtype=np.float32)
+        cls.reference = ModelLoader(cls.model_path).predict(cls.images)
+
+    def test_tflite_matches_keras(self):
+        model_loader = ModelLoader(export_tflite(self.model_path), backend="tflite")
+
+        np.testing.assert_allclose(
+            model_loader.predict(self.images), self.reference, atol=1e-5
+        )
+        # Larger than the largest batch size, split in several batches
+        self.assertEqual(
+            model_loader.predict(np.tile(self.images, (8, 1, 1, 1))).shape, (40, 4)
+        )
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("tf2onnx") and importlib.util.find_spec("onnxruntime"),
+        "tf2onnx and onnxruntime are not installed",
+    )
+    def test_onnx_matches_keras(self):
+        model_loader = ModelLoader(export_onnx(self.model_path), backend="onnx")
+
+        np.testing.assert_allclose(
+            model_loader.predict(self.images), self.reference, atol=1e-5
+        )
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            ModelLoader(self.model_path, backend="torch")
+
+    def test_incomplete_backend_can_not_be_built(self):
+        class NoPredict(InferenceBackend):
+            loaded = True
+            input_shape = (70, 70, 1)
+
+            def load(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            NoPredict(self.model_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+
+from whiteboard_ai.server.Profiler import Profiler, ProfilerBusyError
+
+
+def busy_work(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.profiler = Profiler(self.directory.name, sample_interval_ms=1)
+
+    async def test_sampler_stops_after_the_requests(self):
+        session = self.profiler.start(requests=2, seconds=10)
+        self.assertTrue(self.profiler.active)
+        for _ in range(2):
+            await asyncio.get_running_loop().run_in_executor(None, busy_work, 0.05)
+            self.profiler.request_done()
+
+        self.assertFalse(self.profiler.active)
+        self.assertEqual(session["state"], "writing")
+        await self.profiler.stop_async()
+        self.assertEqual(session["state"], "done")
+        self.assertEqual(session["requests"], 2)
+        self.assertGreater(session["samples"], 0)
+        with open(session["files"]["collapsed"]) as file:
+            stacks = file.read()
+        # Collapsed stacks, from the thread down to the innermost function
+        self.assertIn("busy_work (test_profiler.py", stacks)
+        self.assertRegex(stacks.splitlines()[0], r"^[^;]+;.* \d+$")
+
+    async def test_cprofile_mode(self):
+        self.profiler.start(requests=1, mode="cprofile")
+        busy_work(0.01)
+        self.profiler.request_done()
+        session = await self.profiler.stop_async()
+
+        stats = pstats.Stats(session["files"]["pstats"])
+        self.assertTrue(any(function == "busy_work" for _, _, function in stats.stats))
+
+    async def test_profile_stops_after_the_duration(self):
+        session = self.profiler.start(requests=100, seconds=0.05)
+        await asyncio.sleep(0.2)
+
+        self.assertFalse(self.profiler.active)
+        self.assertEqual(session["requests"], 0)
+        self.assertTrue(os.path.exists(session["files"]["collapsed"]))
+
+    async def test_profile_is_written_off_the_event_loop(self):
+        write = self.profiler._write
+        threads = []
+
+        def record_thread():
+            threads.append(threading.get_ident())
+            return write()
+
+        self.profiler._write = record_thread
+        self.profiler.start(requests=1)
+        self.profiler.request_done()
+        with self.assertRaises(ProfilerBusyError):
+            self.profiler.start()
+        session = await self.profiler.stop_async()
+
+        self.assertEqual(session["state"], "done")
+        self.assertNotEqual(threads, [threading.get_ident()])
+        self.assertEqual(len(threads), 1)
+
+    async def test_one_profile_at_a_time(self):
+        self.profiler.start()
+        with self.assertRaises(ProfilerBusyError):
+            self.profiler.start()
+        self.profiler.stop()
+
+        with self.assertRaises(ValueError):
+            self.profiler.start(mode="perf")
+        with self.assertRaises(ValueError):
+            self.profiler.start(requests=0)
+        self.assertFalse(self.profiler.active)
+
+    def test_inactive_profiler_ignores_requests(self):
+        self.profiler.request_done()
+        self.assertIsNone(self.profiler.stop())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+from whiteboard_ai.server.protocol import (
+    answers_with_ack,
+    decode_stroke,
+    encode_points,
+    request_id,
+)
+
+POINTS = np.array([[389, 534], [388, 522], [411, 449], [1042, 524]])
+
+
+class TestProtocol(unittest.TestCase):
+    def test_json_points(self):
+        data = {"points": [{"x": int(x), "y": int(y)} for x, y in POINTS]}
+        np.testing.assert_array_equal(decode_stroke(data).array, POINTS)
+
+    def test_packed_points(self):
+        for dtype in ["int16", "float32"]:
+            for delta in [False, True]:
+                stroke = decode_stroke(encode_points(POINTS, dtype, delta))
+                np.testing.assert_array_equal(stroke.array, POINTS)
+                self.assertEqual(stroke.array.dtype, np.float32)
+
+    def test_float32_points_are_not_copied(self):
+        data = encode_points(POINTS, "float32")
+        stroke = decode_stroke(data)
+        self.assertFalse(stroke.array.flags.owndata)
+
+    def test_request_ids(self):
+        data = encode_points(POINTS, version=3, request_id=12)
+        np.testing.assert_array_equal(decode_stroke(data).array, POINTS)
+        self.assertEqual(request_id(data), 12)
+        self.assertTrue(answers_with_ack(data))
+
+        data = encode_points(POINTS, request_id="a")
+        self.assertEqual(request_id(data), "a")
+        self.assertFalse(answers_with_ack(data))
+
+        self.assertIsNone(request_id(encode_points(POINTS)))
+        self.assertIsNone(request_id(None))
+        self.assertFalse(answers_with_ack(None))
+
+    def test_invalid_payloads(self):
+        with self.assertRaises(ValueError):
+            decode_stroke({"version": 4, "points": b""})
+
+        data = encode_points(POINTS, "int16")
+        data["points"] = data["points"][:-1]
+        with self.assertRaises(ValueError):
+            decode_stroke(data)
+
+        data["dtype"] = "int64"
+        with self.assertRaises(ValueError):
+            decode_stroke(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
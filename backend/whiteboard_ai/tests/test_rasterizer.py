@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from whiteboard_ai.core.Rasterizer import Rasterizer
+
+
+def random_polylines(count, size=70, seed=0):
+    """Ellipses, random walks and zigzags, with a few repeated points"""
+    rng = np.random.default_rng(seed)
+    polylines = []
+    for i in range(count):
+        num_points = rng.integers(2, 300)
+        if i % 3 == 0:
+            angles = np.linspace(0, 2 * np.pi, num_points)
+            radius = rng.uniform(5, size / 2 - 3, 2)
+            points = size / 2 + np.stack(
+                [radius[0] * np.cos(angles), radius[1] * np.sin(angles)], axis=1
+            )
+            points += rng.normal(0, 0.5, points.shape)
+        elif i % 3 == 1:
+            points = size / 2 + np.cumsum(rng.normal(0, 2, (num_points, 2)), axis=0)
+        else:
+            points = rng.uniform(0, size, (num_points, 2))
+        polylines.append(np.clip(points, 0, size - 0.01))
+    return polylines
+
+
+def draw_with_pil(polyline, size, width):
+    image = Image.new("L", (size, size), 255)
+    ImageDraw.Draw(image).line(
+        [tuple(point) for point in polyline], fill=0, width=width
+    )
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+class TestRasterizer(unittest.TestCase):
+    def test_matches_pil(self):
+        polylines = random_polylines(60)
+        for width in [2, 3, 4]:
+            rasterizer = Rasterizer((70, 70), width)
+            images = rasterizer.rasterize(polylines)
+            for polyline, image in zip(polylines, images):
+                np.testing.assert_array_equal(image, draw_with_pil(polyline, 70, width))
+
+    def test_batch_matches_single(self):
+        polylines = random_polylines(10, seed=1)
+        rasterizer = Rasterizer((70, 70), 2)
+
+        images = rasterizer.rasterize(polylines)
+        self.assertEqual(images.shape, (10, 70, 70))
+        for polyline, image in zip(polylines, images):
+            np.testing.assert_array_equal(rasterizer.rasterize([polyline])[0], image)
+
+    def test_preallocated_buffer(self):
+        polylines = random_polylines(3, seed=2)
+        rasterizer = Rasterizer((70, 70), 2)
+
+        out = np.zeros((3, 70, 70), dtype=np.uint8)
+        result = rasterizer.rasterize(polylines, out, background=255, ink=0)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out / 255.0, rasterizer.rasterize(polylines))
+
+    def test_nothing_to_draw(self):
+        rasterizer = Rasterizer((70, 70), 2)
+        images = rasterizer.rasterize([np.empty((0, 2)), np.array([[10.0, 10.0]])])
+        self.assertTrue(np.all(images == 1.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
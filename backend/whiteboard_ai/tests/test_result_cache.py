@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.core.primitives.Point import Point
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.server.ResultCache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache(unittest.TestCase):
+    def test_hit_and_miss(self):
+        cache = ResultCache(max_size=4, ttl_s=60)
+
+        self.assertIsNone(cache.get(b"a"))
+        cache.put(b"a", ("circle", 0.9))
+        self.assertEqual(cache.get(b"a"), ("circle", 0.9))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_size=2, ttl_s=60)
+        cache.put(b"a", ("circle", 0.9))
+        cache.put(b"b", ("square", 0.8))
+        cache.get(b"a")
+        cache.put(b"c", ("triangle", 0.7))
+
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get(b"b"))
+        self.assertIsNotNone(cache.get(b"a"))
+        self.assertIsNotNone(cache.get(b"c"))
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = ResultCache(max_size=2, ttl_s=10, clock=clock)
+        cache.put(b"a", ("circle", 0.9))
+
+        clock.now = 5
+        self.assertIsNotNone(cache.get(b"a"))
+        clock.now = 11
+        self.assertIsNone(cache.get(b"a"))
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = ResultCache(enabled=False)
+        cache.put(b"a", ("circle", 0.9))
+
+        self.assertIsNone(cache.get(b"a"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["hits"], 0)
+
+    def test_key_of_rendered_strokes(self):
+        generator = ImageGenerator((70, 70))
+        points = [Point(0, 0), Point(50, 50), Point(100, 0)]
+        moved = [Point(point.x * 2 + 300, point.y * 2 + 100) for point in points]
+        other = [Point(0, 0), Point(50, 50), Point(100, 100)]
+
+        key = ResultCache.key(generator.render_array(Stroke(points)))
+        # The stroke is scaled to the image, the same shape drawn elsewhere is the same image
+        self.assertEqual(key, ResultCache.key(generator.render_array(Stroke(moved))))
+        self.assertNotEqual(key, ResultCache.key(generator.render_array(Stroke(other))))
+        self.assertEqual(len(key), 16)
+
+    def test_key_ignores_the_tensor_type(self):
+        tensor = np.ones((1, 70, 70, 1), dtype=np.float32)
+        tensor[0, 10:20, 10:20] = 0
+
+        self.assertEqual(
+            ResultCache.key(tensor), ResultCache.key(tensor.astype(np.float64))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
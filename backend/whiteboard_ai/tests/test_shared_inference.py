@@ -0,0 +1,200 @@
+import asyncio
+import queue
+import threading
+import types
+import unittest
+
+import numpy as np
+from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.server.InferenceClient import InferenceClient, InferenceError
+from whiteboard_ai.server.protocol import encode_points
+from whiteboard_ai.server.SharedMemoryRing import SharedMemoryRing
+from whiteboard_ai.server.WebsocketServer import WebSocketServer
+
+
+def make_images(values):
+    return np.stack([np.full((70, 70, 1), value, np.float32) for value in values])
+
+
+class FakeInferenceWorker:
+    """
+    Answers the requests of an InferenceClient from a thread, like an inference process:
+    the probability of the "ellipse" class is the value of the first pixel
+    """
+
+    def __init__(self, ring: SharedMemoryRing, requests, responses):
+        # Attached like another process would, through the shared memory
+        self.ring = SharedMemoryRing(**ring.spec())
+        self.requests = requests
+        self.responses = responses
+        self.fail = False
+        self.allowed = threading.Event()
+        self.allowed.set()
+        self.received = 0
+        self.batch_sizes = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            message = self.requests.get()
+            if message is None:
+                return
+            self.received += 1
+            self.allowed.wait()
+            _, slot, count = message
+            self.batch_sizes.append(count)
+            predictions = np.zeros((count, 4), np.float32)
+            predictions[:, 1] = self.ring.images(slot)[:count, 0, 0, 0]
+            self.ring.predictions(slot)[:count] = predictions
+            self.responses.put((slot, "Model failed" if self.fail else None))
+
+    def stop(self):
+        self.allowed.set()
+        self.requests.put(None)
+        self._thread.join()
+        self.ring.close()
+
+
+class TestSharedMemoryRing(unittest.TestCase):
+    def test_attached_ring_shares_memory(self):
+        ring = SharedMemoryRing(2, 4, (70, 70, 1), 4)
+        attached = SharedMemoryRing(**ring.spec())
+        self.assertFalse(attached.owner)
+
+        ring.images(1)[:2] = make_images([0.25, 0.5])
+        np.testing.assert_array_equal(attached.images(1)[:2], make_images([0.25, 0.5]))
+        attached.predictions(1)[0] = [0, 1, 0, 0]
+        np.testing.assert_array_equal(ring.predictions(1)[0], [0, 1, 0, 0])
+        # Slots don't overlap
+        self.assertFalse(ring.images(0).any())
+
+        attached.close()
+        ring.close()
+
+
+class TestInferenceClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.ring = SharedMemoryRing(2, 4, (70, 70, 1), 4)
+        requests, responses = queue.Queue(), queue.Queue()
+        self.worker = FakeInferenceWorker(self.ring, requests, responses)
+        self.client = InferenceClient(
+            0, self.ring, requests, responses, threading.Event()
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.worker.stop()
+        self.ring.close()
+
+    async def test_results_are_in_order(self):
+        values = [0.1, 0.2, 0.3]
+        results = await self.client.classify_batch(make_images(values))
+
+        self.assertEqual(self.worker.batch_sizes, [3])
+        for value, (class_name, likelihood) in zip(values, results):
+            self.assertEqual(class_name, "ellipse")
+            self.assertAlmostEqual(likelihood, value, places=6)
+
+    async def test_batches_larger_than_a_slot_are_split(self):
+        values = [i / 10 for i in range(1, 10)]
+        results = await self.client.classify_batch(make_images(values))
+
+        self.assertEqual(sorted(self.worker.batch_sizes), [1, 4, 4])
+        self.assertEqual([round(likelihood, 4) for _, likelihood in results], values)
+
+    async def test_concurrent_batches_wait_for_a_free_slot(self):
+        self.worker.allowed.clear()
+        tasks = [
+            asyncio.create_task(self.client.classify_batch(make_images([value])))
+            for value in (0.1, 0.2, 0.3)
+        ]
+        await asyncio.sleep(0.05)
+        # Only 2 slots, the third batch waits
+        self.assertEqual(self.worker.received + self.worker.requests.qsize(), 2)
+
+        self.worker.allowed.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(
+            [round(result[0][1], 4) for result in results], [0.1, 0.2, 0.3]
+        )
+
+    async def test_errors_are_raised(self):
+        self.worker.fail = True
+        with self.assertRaises(InferenceError):
+            await self.client.classify_batch(make_images([0.1]))
+        # The slot was freed
+        self.assertEqual(len(self.client._free_slots), 2)
+
+    async def test_cancelled_slot_is_freed_once_answered(self):
+        self.worker.allowed.clear()
+        task = asyncio.create_task(self.client.classify_batch(make_images([0.1])))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        # The worker may still write into it
+        self.assertEqual(len(self.client._free_slots), 1)
+
+        self.worker.allowed.set()
+        results = await self.client.classify_batch(make_images([0.7]))
+        self.assertAlmostEqual(results[0][1], 0.7, places=6)
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.client._free_slots), 2)
+
+    async def test_unanswered_batches_time_out(self):
+        self.client.timeout_s = 0.05
+        self.worker.allowed.clear()
+        with self.assertRaisesRegex(InferenceError, "No answer"):
+            await self.client.classify_batch(make_images([0.1]))
+        # The worker may still write into it
+        self.assertEqual(len(self.client._free_slots), 1)
+
+        self.worker.allowed.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.client._free_slots), 2)
+
+    async def test_batches_fail_once_the_inference_processes_exit(self):
+        self.client.alive_workers = types.SimpleNamespace(value=1)
+        self.client.watch_interval_s = 0.01
+        self.worker.allowed.clear()
+        tasks = [
+            asyncio.create_task(self.client.classify_batch(make_images([value])))
+            for value in (0.1, 0.2)
+        ]
+        await asyncio.sleep(0.05)
+
+        self.client.alive_workers.value = 0
+        for task in tasks:
+            with self.assertRaisesRegex(InferenceError, "exited"):
+                await asyncio.wait_for(task, 1)
+        self.assertEqual(len(self.client._free_slots), 2)
+        # Without waiting for a slot
+        with self.assertRaisesRegex(InferenceError, "No inference process"):
+            await self.client.classify_batch(make_images([0.3]))
+
+    async def test_server_classifies_through_the_client(self):
+        self.client.ready.set()
+        # Never loaded, the model would not even be found
+        model_loader = ModelLoader("missing.keras", lazy=True)
+        server = WebSocketServer(
+            "localhost",
+            0,
+            model_loader,
+            executor_mode="shared",
+            inference_client=self.client,
+            cache_enabled=False,
+        )
+        self.addAsyncCleanup(server.close)
+
+        angles = np.linspace(0, 2 * np.pi, 30)
+        points = np.stack([300 + 100 * np.cos(angles), 200 + 50 * np.sin(angles)], 1)
+        response = await server.handle_classify(encode_points(points))
+
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertEqual(self.worker.batch_sizes, [1])
+        self.assertFalse(model_loader.loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
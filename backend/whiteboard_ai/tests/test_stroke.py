@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+from whiteboard_ai.core.primitives.Point import Point
+from whiteboard_ai.core.primitives.Stroke import Stroke
+
+
+class TestStroke(unittest.TestCase):
+    def test_from_points(self):
+        stroke = Stroke([Point(1, 2), Point(3, 4)])
+
+        self.assertEqual(stroke.array.dtype, np.float32)
+        self.assertEqual(stroke.array.shape, (2, 2))
+        self.assertEqual(len(stroke), 2)
+        self.assertEqual((stroke[1].x, stroke[1].y), (3, 4))
+        self.assertEqual([(point.x, point.y) for point in stroke], [(1, 2), (3, 4)])
+
+    def test_from_array(self):
+        array = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.float32)
+        stroke = Stroke.from_array(array)
+
+        self.assertTrue(np.shares_memory(stroke.array, array))
+        self.assertEqual(len(stroke[1:]), 2)
+
+    def test_from_buffer(self):
+        buffer = np.array([1, 2, 3, 4], dtype="<i2").tobytes()
+        stroke = Stroke.from_buffer(buffer, dtype="<i2")
+
+        np.testing.assert_array_equal(stroke.array, [[1, 2], [3, 4]])
+        self.assertEqual(stroke.array.dtype, np.float32)
+
+    def test_setitem(self):
+        stroke = Stroke([Point(1, 2), Point(3, 4)])
+        stroke[0] = Point(7, 8)
+
+        self.assertEqual((stroke[0].x, stroke[0].y), (7, 8))
+
+    def test_point_has_no_dict(self):
+        self.assertFalse(hasattr(Point(1, 2), "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
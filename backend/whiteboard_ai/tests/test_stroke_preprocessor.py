@@ -0,0 +1,133 @@
+import os
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from whiteboard_ai.core.ImageGenerator import ImageGenerator
+from whiteboard_ai.core.primitives.Stroke import Stroke
+from whiteboard_ai.core.StrokePreprocessor import StrokePreprocessor
+from whiteboard_ai.model.model import ModelLoader
+from whiteboard_ai.tests.test_model import save_tiny_model
+from whiteboard_ai.tests.test_rasterizer import random_polylines
+
+# Trained by ai/final.py, the tests fall back to an untrained model without it
+TRAINED_MODEL_PATH = "../ai/save/final.keras"
+
+
+def grow(mask):
+    """Adds the 8 neighbours of every pixel to a 2D mask"""
+    padded = np.pad(mask, 1)
+    height, width = mask.shape
+    return np.max(
+        [
+            padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+            for dy in (-1, 0, 1)
+            for dx in (-1, 0, 1)
+        ],
+        axis=0,
+    )
+
+
+def seeded_strokes():
+    """Random polylines, and a densely sampled ellipse like the browser sends"""
+    angles = np.linspace(0, 2 * np.pi, 1000)
+    ellipse = np.stack([300 + 100 * np.cos(angles), 200 + 50 * np.sin(angles)], 1)
+    return [Stroke.from_array(ellipse)] + [
+        Stroke.from_array(polyline * 10) for polyline in random_polylines(9)
+    ]
+
+
+class TestStrokePreprocessor(unittest.TestCase):
+    def test_deduplicate(self):
+        points = np.array([[0, 0], [0, 0], [1, 1], [1, 1], [0, 0]], dtype=np.float64)
+
+        deduplicated = StrokePreprocessor.deduplicate(points)
+        np.testing.assert_array_equal(deduplicated, [[0, 0], [1, 1], [0, 0]])
+
+    def test_resample(self):
+        points = np.array([[0, 0], [0.5, 0], [1, 0], [5, 0], [10, 0], [10, 2]])
+
+        resampled = StrokePreprocessor.resample(points, 3)
+        np.testing.assert_allclose(resampled, [[0, 0], [3, 0], [6, 0], [9, 0], [10, 2]])
+
+    def test_resample_never_adds_points(self):
+        points = np.array([[0, 0], [10, 0], [10, 10]], dtype=np.float64)
+
+        np.testing.assert_array_equal(StrokePreprocessor.resample(points, 1), points)
+
+    def test_simplify(self):
+        points = np.array([[0, 0], [1, 0.1], [2, -0.1], [3, 5], [4, 0], [5, 0]])
+
+        simplified = StrokePreprocessor.simplify(points, 0.5)
+        np.testing.assert_array_equal(
+            simplified, [[0, 0], [2, -0.1], [3, 5], [4, 0], [5, 0]]
+        )
+
+    def test_simplify_within_tolerance(self):
+        rng = np.random.default_rng(0)
+        points = np.cumsum(rng.normal(0, 1, (500, 2)), axis=0)
+
+        simplified = StrokePreprocessor.simplify(points, 1.0)
+        self.assertLess(len(simplified), len(points))
+        # Every point is within tolerance of a segment of the simplified stroke
+        start, end = simplified[:-1, None], simplified[1:, None]
+        chord = end - start
+        along = np.clip(
+            np.sum((points - start) * chord, axis=2) / np.sum(chord * chord, axis=2),
+            0,
+            1,
+        )
+        closest = start + along[..., None] * chord
+        distances = np.hypot(*(points - closest).transpose(2, 0, 1)).min(axis=0)
+        self.assertLessEqual(distances.max(), 1.0 + 1e-9)
+
+    def test_simplify_closed_stroke(self):
+        points = np.array(
+            [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]], dtype=np.float64
+        )
+
+        np.testing.assert_array_equal(StrokePreprocessor.simplify(points, 1), points)
+
+    def test_short_strokes_are_left_as_is(self):
+        preprocessor = StrokePreprocessor()
+        for points in (np.empty((0, 2)), np.array([[1.0, 2.0]])):
+            np.testing.assert_array_equal(preprocessor.process(points), points)
+
+    def test_rendering_is_nearly_unchanged(self):
+        strokes = seeded_strokes()
+        raw_generator = ImageGenerator((70, 70), preprocess=False)
+        preprocessing_generator = ImageGenerator((70, 70), preprocess=True)
+
+        for stroke in strokes:
+            raw = raw_generator.render_array(stroke)[0, :, :, 0] < 0.5
+            preprocessed = (
+                preprocessing_generator.render_array(stroke)[0, :, :, 0] < 0.5
+            )
+            # Points move by less than a pixel, so does the ink
+            self.assertTrue(np.all(raw <= grow(preprocessed)))
+            self.assertTrue(np.all(preprocessed <= grow(raw)))
+
+        scaled = preprocessing_generator._scaled_polylines([strokes[0]])[0]
+        self.assertLess(len(scaled), len(strokes[0].array))
+
+    def test_predicted_labels_are_unchanged(self):
+        if os.path.exists(TRAINED_MODEL_PATH):
+            model_path = TRAINED_MODEL_PATH
+        else:
+            tf.keras.utils.set_random_seed(0)
+            model_path = save_tiny_model()
+        model_loader = ModelLoader(model_path)
+        strokes = seeded_strokes()
+
+        labels = {}
+        for preprocess in (False, True):
+            generator = ImageGenerator((70, 70), preprocess=preprocess)
+            images = np.concatenate([generator.render_array(s) for s in strokes])
+            labels[preprocess] = [
+                label for label, _ in model_loader.classify_batch(images)
+            ]
+        self.assertEqual(labels[True], labels[False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+from whiteboard_ai.server.StrokeStream import StrokeStream
+
+
+class TestStrokeStream(unittest.TestCase):
+    def test_extend_grows_the_buffer(self):
+        stream = StrokeStream(capacity=4)
+        chunks = [np.full((3, 2), i, dtype=np.float32) for i in range(5)]
+        for chunk in chunks:
+            stream.extend(chunk)
+
+        self.assertEqual(len(stream), 15)
+        np.testing.assert_array_equal(stream.stroke.array, np.concatenate(chunks))
+
+    def test_stroke_is_not_changed_by_later_points(self):
+        stream = StrokeStream(capacity=4)
+        stream.extend([[0, 0], [1, 1]])
+        stroke = stream.stroke
+        stream.extend([[2, 2], [3, 3], [4, 4]])
+
+        np.testing.assert_array_equal(stroke.array, [[0, 0], [1, 1]])
+
+    def test_looks_closed(self):
+        angles = np.linspace(0, 2 * np.pi, 50)
+        circle = np.stack([np.cos(angles), np.sin(angles)], axis=1) * 100
+
+        stream = StrokeStream()
+        stream.extend(circle[:40])
+        self.assertFalse(stream.looks_closed())
+        stream.extend(circle[40:])
+        self.assertTrue(stream.looks_closed())
+
+    def test_short_strokes_never_look_closed(self):
+        stream = StrokeStream()
+        stream.extend([[0, 0], [10, 0], [0, 0]])
+
+        self.assertFalse(stream.looks_closed())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,703 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from whiteboard_ai.server.protocol import encode_points
+from whiteboard_ai.server.WebsocketServer import ModelNotReadyError, WebSocketServer
+from whiteboard_ai.util.metrics import metrics
+
+
+class FakeModelLoader:
+    """Classifies every image as an ellipse, and records the batch sizes it saw"""
+
+    model_path = None
+
+    def __init__(self):
+        self.images = 0
+        self.batch_sizes = []
+
+    def load(self):
+        pass
+
+    def classify_batch(self, images):
+        self.images += len(images)
+        self.batch_sizes.append(len(images))
+        return [("ellipse", 0.9) for _ in images]
+
+
+def ellipse(num_points):
+    angles = np.linspace(0, 2 * np.pi, num_points)
+    return np.stack([300 + 100 * np.cos(angles), 200 + 50 * np.sin(angles)], axis=1)
+
+
+class TestStrokeStreaming(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model_loader = FakeModelLoader()
+        self.server = WebSocketServer(
+            "localhost", 0, self.model_loader, executor_mode="inline"
+        )
+        self.emitted = []
+
+        async def emit(event, data=None, to=None):
+            self.emitted.append((event, data, to))
+
+        self.server.sio.emit = emit
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    def events(self, name):
+        return [data for event, data, _ in self.emitted if event == name]
+
+    async def test_stroke_is_classified_when_it_ends(self):
+        points = ellipse(100)[:60]  # Not closed
+        await self.server.stroke_begin("sid", encode_points(points[:20]))
+        await self.server.stroke_points("sid", encode_points(points[20:40]))
+        await self.server.stroke_end("sid", encode_points(points[40:]))
+
+        self.assertEqual(self.events("speculative_classification"), [])
+        self.assertEqual(
+            self.events("classification"),
+            [{"classification": {"prediction": "ellipse", "confidence": 0.9}}],
+        )
+        self.assertEqual(self.server.streams, {})
+
+    async def test_closed_stroke_is_classified_speculatively(self):
+        points = ellipse(100)
+        await self.server.stroke_begin("sid")
+        for chunk in np.array_split(points, 5):
+            await self.server.stroke_points("sid", encode_points(chunk))
+        # Let the speculative classification run before the stroke ends
+        await asyncio.sleep(0.05)
+
+        speculative = self.events("speculative_classification")
+        self.assertEqual(len(speculative), 1)
+        self.assertEqual(speculative[0]["points"], 100)
+
+        await self.server.stroke_end("sid")
+        self.assertEqual(len(self.events("classification")), 1)
+        # The final answer reused the speculative one
+        self.assertEqual(self.model_loader.images, 1)
+
+    async def test_stroke_end_without_stroke(self):
+        await self.server.stroke_end("sid")
+
+        self.assertIn("error", self.events("classification")[0])
+
+    async def test_invalid_chunk_is_reported_when_the_stroke_ends(self):
+        await self.server.stroke_begin("sid", encode_points(ellipse(10)))
+        await self.server.stroke_points(
+            "sid", {"version": 2, "dtype": "int16", "points": b"\x00" * 3}
+        )
+        await self.server.stroke_end("sid")
+
+        self.assertIn("error", self.events("classification")[0])
+
+    async def test_disconnect_cleans_up(self):
+        await self.server.stroke_begin("sid", encode_points(ellipse(100)))
+        self.assertIn("sid", self.server.streams)
+
+        await self.server.disconnect("sid")
+        self.assertEqual(self.server.streams, {})
+
+    async def test_streams_are_kept_by_sid(self):
+        points = ellipse(100)[:50].astype(np.int16)
+        await self.server.stroke_begin("first", encode_points(points[:25]))
+        await self.server.stroke_begin("second", encode_points(points[::-1]))
+        await self.server.stroke_points("first", encode_points(points[25:]))
+
+        self.assertEqual(len(self.server.streams["first"]), 50)
+        self.assertEqual(len(self.server.streams["second"]), 50)
+        np.testing.assert_array_equal(self.server.streams["first"].stroke.array, points)
+
+
+class SlowModelLoader(FakeModelLoader):
+    """Only finishes loading once allowed to, or fails to"""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error
+        self.allowed = threading.Event()
+
+    def load(self):
+        self.allowed.wait(5)
+        if self.error is not None:
+            raise RuntimeError(self.error)
+
+
+class TestModelReadiness(unittest.IsolatedAsyncioTestCase):
+    def make_server(self, model_loader, **options):
+        server = WebSocketServer(
+            "localhost", 0, model_loader, executor_mode="inline", **options
+        )
+        self.addAsyncCleanup(server.close)
+        return server
+
+    async def ready_status(self, server):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await server.http_app({"type": "http", "path": "/ready"}, None, send)
+        return messages[0]["status"]
+
+    async def test_requests_wait_for_the_model(self):
+        model_loader = SlowModelLoader()
+        server = self.make_server(model_loader)
+        server.start_loading_model()
+        self.assertEqual(await self.ready_status(server), 503)
+
+        request = asyncio.create_task(
+            server.handle_classify(encode_points(ellipse(30)))
+        )
+        await asyncio.sleep(0.05)
+        self.assertFalse(request.done())
+        self.assertEqual(server.waiting_for_model, 1)
+
+        model_loader.allowed.set()
+        response = await request
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertEqual(await self.ready_status(server), 200)
+
+    async def test_requests_time_out(self):
+        model_loader = SlowModelLoader()
+        server = self.make_server(model_loader, model_wait_timeout_s=0.05)
+        emitted = []
+
+        async def emit(event, data=None, to=None):
+            emitted.append(data)
+
+        server.sio.emit = emit
+        await server.classify("sid", encode_points(ellipse(30)))
+        model_loader.allowed.set()
+
+        self.assertEqual(emitted[0]["status"], "not_ready")
+
+    async def test_waiting_requests_are_bounded(self):
+        model_loader = SlowModelLoader()
+        server = self.make_server(model_loader, model_wait_max_queue=1)
+
+        first = asyncio.create_task(server.handle_classify(encode_points(ellipse(30))))
+        await asyncio.sleep(0.05)
+        with self.assertRaises(ModelNotReadyError):
+            await server.handle_classify(encode_points(ellipse(40)))
+
+        model_loader.allowed.set()
+        self.assertIn("classification", await first)
+
+    async def test_model_failing_to_load(self):
+        model_loader = SlowModelLoader(error="missing weights")
+        model_loader.allowed.set()
+        server = self.make_server(model_loader)
+
+        with self.assertRaisesRegex(ModelNotReadyError, "missing weights"):
+            await server.handle_classify(encode_points(ellipse(30)))
+        self.assertEqual(await self.ready_status(server), 503)
+
+
+class TestServerMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_classify_is_instrumented(self):
+        server = WebSocketServer(
+            "localhost", 0, FakeModelLoader(), executor_mode="inline"
+        )
+        self.addAsyncCleanup(server.close)
+
+        async def emit(event, data=None, to=None):
+            pass
+
+        server.sio.emit = emit
+        metrics.reset()
+        await server.connect("sid", {}, None)
+        await server.classify("sid", encode_points(ellipse(50)))
+        await server.classify("sid", {"version": 7})
+
+        for stage in ("classify", "decode", "render", "scale", "rasterize", "emit"):
+            self.assertIn(stage, metrics.stage_latency)
+        text = metrics.render()
+        self.assertIn('smartboard_requests_total{event="classify"} 2', text)
+        self.assertIn('smartboard_errors_total{event="classify"} 1', text)
+        self.assertIn("smartboard_connected_clients 1", text)
+        self.assertIn("smartboard_inflight_classifications 0", text)
+
+
+class TestClassifyBatch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model_loader = FakeModelLoader()
+        self.server = WebSocketServer(
+            "localhost", 0, self.model_loader, executor_mode="inline"
+        )
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_strokes_are_classified_in_a_single_pass(self):
+        payloads = [encode_points(ellipse(20 + i) * (1 + i)) for i in range(40)]
+
+        response = await self.server.handle_classify_batch({"strokes": payloads})
+
+        self.assertEqual(len(response["results"]), 40)
+        for result in response["results"]:
+            self.assertEqual(result["classification"]["prediction"], "ellipse")
+        self.assertEqual(len(self.model_loader.batch_sizes), 1)
+
+    async def test_errors_are_kept_per_stroke(self):
+        payloads = [
+            encode_points(ellipse(30)),
+            {"version": 2, "dtype": "int16", "points": b"\x00" * 3},
+            {"version": 7},
+            encode_points(ellipse(40) * 2),
+        ]
+
+        results = (await self.server.handle_classify_batch({"strokes": payloads}))[
+            "results"
+        ]
+
+        self.assertIn("classification", results[0])
+        self.assertIn("error", results[1])
+        self.assertIn("error", results[2])
+        self.assertIn("classification", results[3])
+
+    async def test_cached_strokes_skip_the_model(self):
+        await self.server.handle_classify(encode_points(ellipse(30)))
+        payloads = [encode_points(ellipse(30)), encode_points(ellipse(30)[:20])]
+
+        results = (await self.server.handle_classify_batch({"strokes": payloads}))[
+            "results"
+        ]
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.model_loader.batch_sizes, [1, 1])
+
+    async def test_empty_batch(self):
+        response = await self.server.handle_classify_batch({"strokes": []})
+
+        self.assertEqual(response, {"results": []})
+        self.assertEqual(self.model_loader.batch_sizes, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestFastPath(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model_loader = FakeModelLoader()
+        self.server = WebSocketServer(
+            "localhost", 0, self.model_loader, executor_mode="inline"
+        )
+        self.line = np.stack([np.linspace(100, 500, 50), np.full(50, 300)], axis=1)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_lines_skip_the_model(self):
+        metrics.reset()
+        response = await self.server.handle_classify(encode_points(self.line))
+
+        self.assertEqual(response["classification"]["prediction"], "other")
+        self.assertEqual(self.model_loader.images, 0)
+        self.assertIn('smartboard_fast_path_total{reason="line"} 1', metrics.render())
+
+    async def test_batch_only_sends_the_shapes_to_the_model(self):
+        payloads = [encode_points(self.line), encode_points(ellipse(40))]
+
+        results = (await self.server.handle_classify_batch({"strokes": payloads}))[
+            "results"
+        ]
+
+        self.assertEqual(results[0]["classification"]["prediction"], "other")
+        self.assertEqual(results[1]["classification"]["prediction"], "ellipse")
+        self.assertEqual(self.model_loader.batch_sizes, [1])
+        self.assertEqual(self.server.in_flight, 0)
+
+    async def test_disabled(self):
+        server = WebSocketServer(
+            "localhost", 0, self.model_loader, executor_mode="inline", fast_path=False
+        )
+        self.addAsyncCleanup(server.close)
+        response = await server.handle_classify(encode_points(self.line))
+
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertEqual(self.model_loader.images, 1)
+
+
+class TestRequestIds(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model_loader = SlowModelLoader()
+        self.server = WebSocketServer(
+            "localhost", 0, self.model_loader, executor_mode="inline"
+        )
+        self.emitted = []
+
+        async def emit(event, data=None, to=None):
+            self.emitted.append((event, data))
+
+        self.server.sio.emit = emit
+        self.line = np.stack([np.linspace(100, 500, 50), np.full(50, 300)], axis=1)
+
+    async def asyncTearDown(self):
+        self.model_loader.allowed.set()
+        await self.server.close()
+
+    async def test_version_3_requests_are_acknowledged_out_of_order(self):
+        finished = []
+
+        async def classify(points, request_id):
+            payload = encode_points(points, version=3, request_id=request_id)
+            response = await self.server.classify("sid", payload)
+            finished.append(request_id)
+            return response
+
+        # Waits for the model, while the line behind it is answered without it
+        shape = asyncio.create_task(classify(ellipse(40), "shape"))
+        line = asyncio.create_task(classify(self.line, 7))
+        await asyncio.sleep(0.05)
+        self.model_loader.allowed.set()
+        shape_response, line_response = await asyncio.gather(shape, line)
+
+        self.assertEqual(finished, [7, "shape"])
+        self.assertEqual(shape_response["id"], "shape")
+        self.assertEqual(shape_response["classification"]["prediction"], "ellipse")
+        self.assertEqual(line_response["id"], 7)
+        self.assertEqual(line_response["classification"]["prediction"], "other")
+        self.assertEqual(self.emitted, [])
+
+    async def test_earlier_versions_are_answered_with_an_event(self):
+        self.model_loader.allowed.set()
+        payload = encode_points(self.line, request_id="a")
+
+        self.assertIsNone(await self.server.classify("sid", payload))
+        self.assertEqual(self.emitted[0][0], "classification")
+        self.assertEqual(self.emitted[0][1]["id"], "a")
+
+    async def test_errors_are_acknowledged(self):
+        payload = {"version": 3, "dtype": "int16", "points": b"\x00" * 3, "id": 1}
+
+        response = await self.server.classify("sid", payload)
+        self.assertEqual(response["id"], 1)
+        self.assertIn("error", response)
+
+    async def test_malformed_versions_are_answered(self):
+        self.model_loader.allowed.set()
+        metrics.reset()
+        for version in ("x", None, [3]):
+            payload = {"version": version, "points": b"", "id": "bad"}
+            self.assertIsNone(await self.server.classify("sid", payload))
+
+        self.assertEqual(len(self.emitted), 3)
+        for event, response in self.emitted:
+            self.assertEqual(event, "classification")
+            self.assertEqual(response["id"], "bad")
+            self.assertIn("Unsupported classify payload version", response["error"])
+        self.assertIn('smartboard_errors_total{event="classify"} 3', metrics.render())
+
+    async def test_batches_and_streams_are_acknowledged(self):
+        self.model_loader.allowed.set()
+        batch = {"version": 3, "id": "b", "strokes": [encode_points(self.line)]}
+        response = await self.server.classify_batch("sid", batch)
+        self.assertEqual(response["id"], "b")
+        self.assertEqual(len(response["results"]), 1)
+
+        await self.server.stroke_begin("sid", encode_points(ellipse(40)[:20]))
+        end = encode_points(ellipse(40)[20:], version=3, request_id="s")
+        response = await self.server.stroke_end("sid", end)
+        self.assertEqual(response["id"], "s")
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+
+        # Without points, only the ID
+        await self.server.stroke_begin("sid", encode_points(ellipse(40)))
+        response = await self.server.stroke_end("sid", {"version": 3, "id": "t"})
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertNotIn("classification", [event for event, _ in self.emitted])
+
+    async def test_concurrent_requests_on_one_connection(self):
+        import socket
+
+        import socketio
+        import uvicorn
+
+        self.model_loader.allowed.set()
+        self.server.sio.emit = socketio.AsyncServer.emit.__get__(self.server.sio)
+        self.server.register_events()
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        config = uvicorn.Config(self.server.app, log_level="warning", lifespan="on")
+        uvicorn_server = uvicorn.Server(config)
+        serving = asyncio.create_task(uvicorn_server.serve(sockets=[sock]))
+        while not uvicorn_server.started:
+            await asyncio.sleep(0.01)
+
+        client = socketio.AsyncClient(reconnection=False)
+        try:
+            await client.connect(
+                f"http://127.0.0.1:{sock.getsockname()[1]}", transports=["websocket"]
+            )
+            strokes = [ellipse(30 + i) if i % 2 else self.line for i in range(16)]
+            responses = await asyncio.gather(
+                *(
+                    client.call(
+                        "classify",
+                        encode_points(points, version=3, request_id=i),
+                        timeout=10,
+                    )
+                    for i, points in enumerate(strokes)
+                )
+            )
+        finally:
+            await client.disconnect()
+            uvicorn_server.should_exit = True
+            await serving
+            sock.close()
+
+        for i, response in enumerate(responses):
+            self.assertEqual(response["id"], i)
+            expected = "ellipse" if i % 2 else "other"
+            self.assertEqual(response["classification"]["prediction"], expected)
+        # Only the shapes went through the model
+        self.assertEqual(self.model_loader.images, 8)
+
+
+class TestClientScheduling(unittest.IsolatedAsyncioTestCase):
+    def make_server(self, **options):
+        self.model_loader = SlowModelLoader()
+        server = WebSocketServer(
+            "localhost", 0, self.model_loader, executor_mode="inline", **options
+        )
+        self.emitted = []
+
+        async def emit(event, data=None, to=None):
+            self.emitted.append(event)
+
+        server.sio.emit = emit
+        self.addAsyncCleanup(server.close)
+        return server
+
+    def tearDown(self):
+        self.model_loader.allowed.set()
+
+    def classify(self, server, sid, points, request_id):
+        payload = encode_points(points, version=3, request_id=request_id)
+        return asyncio.create_task(server.classify(sid, payload))
+
+    async def test_busy_server_answers_right_away(self):
+        server = self.make_server(max_pending=2)
+        waiting = [self.classify(server, sid, ellipse(40), sid) for sid in "ab"]
+        await asyncio.sleep(0.05)
+
+        response = await server.classify("c", encode_points(ellipse(40), version=3))
+        self.assertEqual(response["status"], "busy")
+        self.assertIn("error", response)
+
+        self.model_loader.allowed.set()
+        for response in await asyncio.gather(*waiting):
+            self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertEqual(server.client_scheduler.stats()["shed"], 1)
+
+    async def test_newer_strokes_supersede_the_waiting_ones(self):
+        server = self.make_server(max_concurrent=1, supersede="drop")
+        tasks = []
+        for request_id in range(3):
+            tasks.append(
+                self.classify(server, "a", ellipse(40 + request_id), request_id)
+            )
+            await asyncio.sleep(0.01)
+
+        self.model_loader.allowed.set()
+        responses = await asyncio.gather(*tasks)
+        self.assertEqual(responses[0]["classification"]["prediction"], "ellipse")
+        self.assertEqual(responses[1]["status"], "dropped")
+        self.assertEqual(responses[1]["id"], 1)
+        self.assertEqual(responses[2]["classification"]["prediction"], "ellipse")
+        self.assertEqual(server.client_scheduler.dropped, 1)
+
+    async def stream_closed_stroke(self, server, sid):
+        await server.stroke_begin(sid)
+        for chunk in np.array_split(ellipse(100), 5):
+            await server.stroke_points(sid, encode_points(chunk))
+        return server.streams[sid].speculation
+
+    async def test_speculation_is_kept_by_the_end_of_its_stroke(self):
+        for supersede in ["off", "drop", "cancel"]:
+            with self.subTest(supersede=supersede):
+                server = self.make_server(supersede=supersede)
+                speculation = await self.stream_closed_stroke(server, "a")
+                # Running, it waits for the model
+                await asyncio.sleep(0.01)
+
+                end = asyncio.create_task(
+                    server.stroke_end("a", {"version": 3, "id": "end"})
+                )
+                await asyncio.sleep(0.01)
+                self.model_loader.allowed.set()
+                response = await end
+
+                self.assertEqual(await speculation, ("ellipse", 0.9))
+                self.assertEqual(response["classification"]["prediction"], "ellipse")
+                self.assertIn("speculative_classification", self.emitted)
+                # The final answer reused the speculative one
+                self.assertEqual(self.model_loader.images, 1)
+                self.assertEqual(server.client_scheduler.cancelled, 0)
+
+    async def test_speculation_waits_for_its_turn(self):
+        server = self.make_server(max_concurrent=1, supersede="cancel")
+        running = self.classify(server, "b", ellipse(40), 0)
+        await asyncio.sleep(0.01)
+
+        speculation = await self.stream_closed_stroke(server, "a")
+        await asyncio.sleep(0.01)
+        self.assertEqual(server.client_scheduler.queued, 1)
+
+        # Queued behind the speculation, which it does not replace
+        end = asyncio.create_task(server.stroke_end("a", {"version": 3, "id": "end"}))
+        await asyncio.sleep(0.01)
+        self.model_loader.allowed.set()
+        await running
+        response = await end
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertEqual(response["id"], "end")
+        self.assertEqual(await speculation, ("ellipse", 0.9))
+        self.assertEqual(self.model_loader.images, 2)
+        self.assertEqual(server.client_scheduler.dropped, 0)
+
+    async def test_speculation_does_not_replace_the_previous_stroke(self):
+        server = self.make_server(max_concurrent=1, supersede="cancel")
+        running = self.classify(server, "b", ellipse(40), 0)
+        await asyncio.sleep(0.01)
+
+        # The end of a first stroke waits, when the next stroke is speculated on
+        await server.stroke_begin("a", encode_points(ellipse(100)[:60]))
+        end = asyncio.create_task(server.stroke_end("a", {"version": 3, "id": 1}))
+        await asyncio.sleep(0.01)
+        speculation = await self.stream_closed_stroke(server, "a")
+        await asyncio.sleep(0.01)
+
+        self.model_loader.allowed.set()
+        await running
+        response = await end
+        self.assertEqual(response["classification"]["prediction"], "ellipse")
+        self.assertIsNotNone(await speculation)
+        self.assertEqual(server.client_scheduler.dropped, 0)
+        self.assertEqual(server.client_scheduler.cancelled, 0)
+
+    async def test_disconnect_cancels_the_requests_of_the_client(self):
+        server = self.make_server()
+        task = self.classify(server, "a", ellipse(40), 1)
+        await asyncio.sleep(0.05)
+
+        await server.disconnect("a")
+        response = await task
+        self.assertEqual(response["status"], "cancelled")
+        self.assertEqual(server.in_flight, 0)
+        self.assertEqual(server.client_scheduler.active, 0)
+
+
+class TestCapture(unittest.IsolatedAsyncioTestCase):
+    async def test_classified_strokes_are_captured(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        server = WebSocketServer(
+            "localhost",
+            0,
+            FakeModelLoader(),
+            executor_mode="inline",
+            capture=True,
+            capture_dir=directory.name,
+            capture_rate=1.0,
+        )
+        self.addAsyncCleanup(server.close)
+        line = np.stack([np.linspace(100, 500, 50), np.full(50, 300)], axis=1)
+
+        await server.handle_classify(encode_points(ellipse(40)))
+        await server.handle_classify_batch(
+            {"strokes": [encode_points(ellipse(30)), encode_points(line)]}
+        )
+        server.capture_writer.close()
+
+        # The line was not rendered, and is not captured
+        self.assertEqual(server.capture_writer.stats()["written"], 2)
+        with open(os.path.join(directory.name, "index.jsonl")) as file:
+            shard = json.loads(file.readline())["name"]
+        labels = np.load(os.path.join(directory.name, shard, "labels.npy"))
+        np.testing.assert_array_equal(labels, [1, 1])
+
+
+class TestProfileRoute(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.server = WebSocketServer(
+            "localhost",
+            0,
+            FakeModelLoader(),
+            executor_mode="inline",
+            admin_token="secret",
+        )
+        self.server.profiler.output_dir = directory.name
+
+        async def emit(event, data=None, to=None):
+            pass
+
+        self.server.sio.emit = emit
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def request(self, method, query=b"", token="secret"):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+        scope = {
+            "type": "http",
+            "path": "/admin/profile",
+            "method": method,
+            "query_string": query,
+            "headers": headers,
+        }
+        await self.server.http_app(scope, None, send)
+        return messages[0]["status"], json.loads(messages[1]["body"])
+
+    async def test_only_admins_can_profile(self):
+        self.assertEqual((await self.request("POST", token=None))[0], 403)
+        self.assertEqual((await self.request("POST", token="guess"))[0], 403)
+        self.assertFalse(self.server.profiler.active)
+
+        self.server.admin_token = None
+        self.assertEqual((await self.request("POST"))[0], 404)
+
+    async def test_profile_the_next_requests(self):
+        status, body = await self.request("POST", b"requests=2&seconds=10")
+        self.assertEqual(status, 202)
+        self.assertEqual(body["profile"]["state"], "recording")
+        self.assertEqual((await self.request("POST"))[0], 409)
+
+        for _ in range(2):
+            await self.server.classify("sid", encode_points(ellipse(40)))
+        await self.server.profiler.stop_async()
+        status, body = await self.request("GET")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["profile"]["state"], "done")
+        self.assertEqual(body["profile"]["requests"], 2)
+        self.assertTrue(os.path.exists(body["profile"]["files"]["collapsed"]))
+
+    async def test_stop_the_profile_early(self):
+        await self.request("POST", b"requests=100&seconds=10")
+        status, body = await self.request("DELETE")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["profile"]["state"], "done")
+        self.assertEqual(body["profile"]["requests"], 0)
+        self.assertTrue(os.path.exists(body["profile"]["files"]["collapsed"]))
+        self.assertFalse(self.server.profiler.active)
+
+    async def test_invalid_profile_requests(self):
+        self.assertEqual((await self.request("POST", b"mode=perf"))[0], 400)
+        self.assertEqual((await self.request("POST", b"seconds=soon"))[0], 400)
+        self.assertEqual((await self.request("PUT"))[0], 405)
@@ -1,3 +1,5 @@
+import os
+
 # Constants for the Image Generator
 GEN_IMG_HEIGHT = 256
 GEN_IMG_WIDTH = 256
@@ -5,3 +7,118 @@ GEN_IMG_BG_COLOR = "white"
 GEN_IMG_STROKE_COLOR = "black"
 GEN_IMG_STROKE_WIDTH = 2
 GEN_IMG_PADDING = 6  # 3 pixels on each side
+
+# Constants for the Websocket Server
+DEBUG_EXPORT_IMAGES = False  # Write every generated image to temp/, slow and racy
+CLASSIFY_BATCH_MAX_STROKES = 2000  # Largest list of strokes accepted by classify_batch
+MODEL_WAIT_TIMEOUT_S = 30  # How long requests wait for the model while it loads
+MODEL_WAIT_MAX_QUEUE = 256  # Requests waiting for the model beyond this are refused
+
+# Constants for the scheduling of the requests of every client, see ClientScheduler
+SCHEDULER_MAX_CONCURRENT = 64  # Requests rendered or classified at the same time
+SCHEDULER_MAX_PENDING = 512  # Requests running or waiting beyond this are "busy"
+SCHEDULER_MAX_PER_CLIENT = 16  # Waiting requests of a sid, its oldest is then dropped
+SCHEDULER_SUPERSEDE = (
+    "off"  # New strokes of a sid replace its older ones: "off", "drop" or "cancel"
+)
+
+# Constants for the inference batching
+BATCH_WINDOW_MS = 3  # How long to wait for other requests before running a batch
+BATCH_MAX_SIZE = 32  # Run the batch right away once it reaches this size
+
+# Constants for the executor running the rendering and inference off the event loop
+EXECUTOR_MODE = "thread"  # "inline", "thread" or "process"
+EXECUTOR_MAX_WORKERS = 2  # Also the maximum number of stages running at the same time
+
+# Constants for the multi-process serving, see MultiProcessServer
+SERVE_MULTIPROCESS = False  # Split the server in front end and inference processes
+SERVE_FRONTENDS = 2  # Processes handling the socket.io connections and rendering
+SERVE_INFERENCE_WORKERS = 1  # Processes running the model, fed through shared memory
+SERVE_RING_SLOTS = 4  # Batches every front end can have waiting for the model
+SERVE_INFERENCE_TIMEOUT_S = 30.0  # Longest wait for an inference process to answer
+SERVE_WATCH_INTERVAL_S = 0.5  # How often front ends check the inference processes run
+
+# Constants for the model inference
+INFERENCE_BACKEND = "keras"  # "keras", "tflite" or "onnx", exported by ai/export.py
+INFERENCE_NUM_THREADS = (
+    None  # Threads of the tflite and onnx runtimes, None for their default
+)
+INFERENCE_COMPILED = True  # Use a compiled tf.function instead of model.predict
+INFERENCE_JIT_COMPILE = False  # Compile the inference function with XLA
+
+# Constants for the Rasterizer
+RASTERIZER_STAMP_SIZE = (
+    3  # Segments up to this many pixels long are stamped, not scanned
+)
+
+# Constants for the stroke preprocessing, distances are in pixels of the generated image
+# Off by default, the rasterizer already merges the points landing on the same pixel
+# and is faster than the preprocessing, see benchmarks/bench_preprocess.py
+PREPROCESS_STROKES = False  # Simplify the strokes before rendering them
+PREPROCESS_SPACING = 0.5  # Distance between two points once resampled
+PREPROCESS_TOLERANCE = (
+    0.25  # Maximum distance of a removed point to the simplified stroke
+)
+
+# Constants for the classification result cache
+RESULT_CACHE_ENABLED = True  # Reuse the result of an image that was already classified
+RESULT_CACHE_MAX_SIZE = 1024  # Number of results kept, least recently used are evicted
+RESULT_CACHE_TTL_S = 600  # Results older than this are classified again
+
+# Constants for the geometric fast path, answering "other" without the model
+# Thresholds set on the synthetic strokes of benchmarks/bench_fast_path.py
+FAST_PATH_ENABLED = True  # Answer obvious lines and scribbles without rendering them
+FAST_PATH_OPEN_DISTANCE = (
+    0.5  # Ends further apart than this, relative to the diagonal: open
+)
+FAST_PATH_LINE_ECCENTRICITY = 0.99  # Open strokes at least this elongated: lines
+FAST_PATH_SCRIBBLE_WINDING = (
+    1.5  # Open strokes longer than this times their hull: scribbles
+)
+FAST_PATH_SCRIBBLE_CORNERS = 5  # Open strokes with this many corners: scribbles too
+FAST_PATH_TOLERANCE = 0.03  # Simplification tolerance, relative to the diagonal
+FAST_PATH_CORNER_ANGLE = 45  # Turns sharper than this many degrees are corners
+
+# Constants for the capture of classified strokes for the next trainings, see CaptureWriter
+CAPTURE_ENABLED = False  # Record a sample of the classified strokes and their images
+CAPTURE_DIR = "captures"  # Archive of the captured strokes, loaded by ai/dataset.py
+CAPTURE_SAMPLE_RATE = 0.05  # Fraction of the classified strokes that are captured
+CAPTURE_MAX_QUEUE = (
+    1024  # Strokes waiting to be written, the next ones are not captured
+)
+CAPTURE_SHARD_SIZE = 1024  # Strokes per shard of the archive
+CAPTURE_FLUSH_INTERVAL_S = 60  # A shard is written this long after its first stroke
+
+# Constants for the strokes streamed while they are drawn
+STREAM_SPECULATE = True  # Classify the stroke before it ends, once it looks closed
+STREAM_MIN_POINTS = 10  # Shorter strokes never look closed
+STREAM_CLOSED_DISTANCE = (
+    0.15  # Gap between both ends, relative to the stroke's diagonal
+)
+
+# Constants for the profiling of the running server, see Profiler
+ADMIN_TOKEN = os.environ.get(
+    "WHITEBOARD_ADMIN_TOKEN"
+)  # Bearer token of the /admin routes, disabled when not set
+PROFILE_DIR = "profiles"  # Where the profiles are written
+PROFILE_MAX_REQUESTS = 100  # A profile stops after this many requests by default
+PROFILE_MAX_S = 30  # Or after this many seconds
+PROFILE_SAMPLE_INTERVAL_MS = 5  # Time between two stack samples of the sampler mode
+
+# Constants for the metrics and logs
+LOG_LEVEL = "INFO"  # "DEBUG" also logs every prediction, "WARNING" only the problems
+LOG_FORMAT = "%(asctime)s %(processName)s %(levelname)s %(name)s: %(message)s"
+METRICS_ENABLED = True  # Time the stages of the pipeline, served on /metrics
+METRICS_LATENCY_BUCKETS_S = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
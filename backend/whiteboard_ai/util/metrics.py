@@ -0,0 +1,209 @@
+"""
+Stage timers, counters and gauges of the server, served as Prometheus text.
+
+Timers are meant to stay on the hot path: timing a stage costs two perf_counter calls
+and a bisect, and nothing at all once metrics are disabled. Stages running in the
+workers of a process pool are recorded in those processes, and not reported.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from whiteboard_ai.util.consts import METRICS_ENABLED, METRICS_LATENCY_BUCKETS_S
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, and one for the values above the last one
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        cumulative = []
+        for count in counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Metrics:
+    """
+    Latency histograms of the classification stages, counters, and gauges read when
+    the metrics are rendered
+    """
+
+    def __init__(
+        self,
+        enabled: bool = METRICS_ENABLED,
+        buckets: Iterable[float] = METRICS_LATENCY_BUCKETS_S,
+        prefix: str = "smartboard",
+    ):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+
+        self.stage_latency: Dict[str, Histogram] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def time(self, stage: str):
+        """
+        Context manager recording the duration of a stage
+        """
+        if not self.enabled:
+            return _NO_TIMER
+        return _StageTimer(self, stage)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        histogram = self.stage_latency.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stage_latency.setdefault(
+                    stage, Histogram(self.buckets)
+                )
+        histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + amount
+
+    def gauge(self, name: str, read: Callable[[], float], help: str = "") -> None:
+        """
+        Registers a gauge, read every time the metrics are rendered
+        """
+        self.gauges[name] = read
+        if help:
+            self.help[name] = help
+
+    def describe(self, name: str, help: str) -> None:
+        self.help[name] = help
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stage_latency.clear()
+            self.counters.clear()
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        lines: List[str] = []
+
+        name = f"{self.prefix}_stage_latency_seconds"
+        lines.append(f"# HELP {name} Duration of the stages of the classify pipeline")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, histogram in sorted(self.stage_latency.items()):
+            cumulative = histogram.cumulative_counts()
+            for bound, count in zip(histogram.buckets, cumulative):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        for counter, values in sorted(self.counters.items()):
+            name = f"{self.prefix}_{counter}"
+            if counter in self.help:
+                lines.append(f"# HELP {name} {self.help[counter]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for gauge, read in sorted(self.gauges.items()):
+            name = f"{self.prefix}_{gauge}"
+            if gauge in self.help:
+                lines.append(f"# HELP {name} {self.help[gauge]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+
+        return "\n".join(lines) + "\n"
+
+    def asgi_app(self, path: str = "/metrics"):
+        """
+        Returns an ASGI app serving the metrics on path, and 404 everywhere else
+        """
+
+        async def app(scope, receive, send):
+            if scope["type"] != "http":
+                return
+            if scope["path"] != path:
+                status, body = 404, b"Not Found"
+                content_type = b"text/plain"
+            else:
+                status, body = 200, self.render().encode()
+                content_type = b"text/plain; version=0.0.4; charset=utf-8"
+
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", content_type)],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+
+        return app
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    formatted = ",".join(f'{key}="{value}"' for key, value in labels)
+    return f"{{{formatted}}}"
+
+
+# Shared by every part of the server running in this process
+metrics = Metrics()
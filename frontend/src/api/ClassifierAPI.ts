@@ -5,6 +5,114 @@ import { Point } from '../primitives/Point';
 
 const socket = io('http://localhost:8765');
 
+const INT16_MIN = -32768;
+const INT16_MAX = 32767;
+
+// Packs the points as interleaved little-endian coordinates, see the
+// version 2 and 3 classify payloads in backend/whiteboard_ai/server/protocol.py
+function packPoints(points: Point[], version = 2) {
+    const fitsInt16 = points.every(
+        (point) =>
+            Number.isInteger(point.x) &&
+            Number.isInteger(point.y) &&
+            Math.min(point.x, point.y) >= INT16_MIN &&
+            Math.max(point.x, point.y) <= INT16_MAX
+    );
+    const itemSize = fitsInt16 ? 2 : 4;
+    const buffer = new ArrayBuffer(points.length * 2 * itemSize);
+    const view = new DataView(buffer);
+
+    points.forEach((point, index) => {
+        const offset = index * 2 * itemSize;
+        if (fitsInt16) {
+            view.setInt16(offset, point.x, true);
+            view.setInt16(offset + itemSize, point.y, true);
+        } else {
+            view.setFloat32(offset, point.x, true);
+            view.setFloat32(offset + itemSize, point.y, true);
+        }
+    });
+
+    return {
+        version,
+        dtype: fitsInt16 ? 'int16' : 'float32',
+        delta: false,
+        points: buffer,
+    };
+}
+
+// Points of the stroke being drawn that were not sent yet, null when no stroke is streamed
+let unsentPoints: Point[] | null = null;
+const STREAM_CHUNK_SIZE = 16;
+
+socket.on('speculative_classification', (result) => {
+    console.log(
+        `Speculative classification after ${result.points} points:`,
+        result.classification
+    );
+});
+
+// Streams the stroke to the server while it is drawn, so it is already
+// classified, or close to, once it ends and classifyStroke is called
+export function beginStroke(point: Point): void {
+    if (!socket.connected) {
+        unsentPoints = null;
+        return;
+    }
+
+    unsentPoints = [];
+    socket.emit('stroke_begin', packPoints([point]));
+}
+
+export function streamPoint(point: Point): void {
+    if (unsentPoints === null) {
+        return;
+    }
+
+    unsentPoints.push(point);
+    if (unsentPoints.length >= STREAM_CHUNK_SIZE) {
+        socket.emit('stroke_points', packPoints(unsentPoints));
+        unsentPoints = [];
+    }
+}
+
+const CONFIDENCE_THRESHOLD = 0.7;
+// Requests are answered through their acknowledgement, so many of them can be in
+// flight at once, each gets its own answer whatever the order they are answered in
+const REQUEST_TIMEOUT = 10000;
+let nextRequestId = 0;
+
+interface ClassificationResult {
+    id?: number;
+    classification?: { prediction: string; confidence: number };
+    error?: string;
+}
+
+// Maps a classification result, or error, sent by the server to a shape
+function toPossibleShape(result: ClassificationResult): PossibleShape {
+    if (result.error || !result.classification) {
+        console.error('Error classifying stroke:', result.error);
+        return 'stroke';
+    }
+
+    const prediction = result.classification;
+    if (prediction.confidence < CONFIDENCE_THRESHOLD) {
+        console.log('Confidence below threshold, classifying as stroke.');
+        return 'stroke';
+    }
+
+    switch (prediction.prediction) {
+        case 'ellipse':
+            return 'circle';
+        case 'triangle':
+            return 'triangle';
+        case 'rectangle':
+            return 'rectangle';
+        default:
+            return 'stroke';
+    }
+}
+
 export default function classifyStroke(stroke: Stroke): Promise<PossibleShape> {
     // Check if the socket is connected
     if (!socket.connected) {
@@ -12,55 +120,68 @@ export default function classifyStroke(stroke: Stroke): Promise<PossibleShape> {
         return Promise.resolve('stroke');
     }
 
-    const CONFIDENCE_THRESHOLD = 0.7;
     const pointList: Point[] = stroke.getPoints();
 
-    const data = {
-        points: pointList.map((point) => {
-            return { x: point.x, y: point.y };
-        }),
-    };
-
-    return new Promise((resolve, reject) => {
-        // Benchmark the time taken to classify the stroke
-        const start = performance.now();
-        socket.emit('classify', data);
+    // Benchmark the time taken to classify the stroke
+    const start = performance.now();
+    let request: Promise<ClassificationResult>;
+    if (unsentPoints !== null) {
+        // The server already has the rest of the stroke
+        const data =
+            unsentPoints.length > 0
+                ? packPoints(unsentPoints, 3)
+                : { version: 3 };
+        request = socket
+            .timeout(REQUEST_TIMEOUT)
+            .emitWithAck('stroke_end', { ...data, id: nextRequestId++ });
+        unsentPoints = null;
+    } else {
+        request = socket.timeout(REQUEST_TIMEOUT).emitWithAck('classify', {
+            ...packPoints(pointList, 3),
+            id: nextRequestId++,
+        });
+    }
 
-        socket.once('classification', (result) => {
+    return request.then(
+        (result) => {
             const end = performance.now();
             console.log(`Classification took ${end - start}ms.`);
+            return toPossibleShape(result);
+        },
+        (err) => Promise.reject(`No response to the classification: ${err}`)
+    );
+}
 
-            const prediction = result.classification;
-            if (prediction.error) {
-                console.error('Error classifying stroke:', result.error);
-                resolve('stroke');
-            } else if (prediction.confidence < CONFIDENCE_THRESHOLD) {
+// Classifies many strokes with a single request, e.g. when importing a board
+export function classifyStrokes(strokes: Stroke[]): Promise<PossibleShape[]> {
+    if (!socket.connected) {
+        return Promise.resolve(strokes.map((): PossibleShape => 'stroke'));
+    }
+
+    const data = {
+        version: 3,
+        id: nextRequestId++,
+        strokes: strokes.map((stroke) => packPoints(stroke.getPoints())),
+    };
+
+    const start = performance.now();
+    return socket
+        .timeout(REQUEST_TIMEOUT)
+        .emitWithAck('classify_batch', data)
+        .then(
+            (response) => {
+                const end = performance.now();
                 console.log(
-                    'Confidence below threshold, classifying as stroke.'
+                    `Classification of ${strokes.length} strokes took ${end - start}ms.`
                 );
-                resolve('stroke');
-            } else {
-                switch (prediction.prediction) {
-                    case 'ellipse':
-                        resolve('circle');
-                        break;
-                    case 'triangle':
-                        resolve('triangle');
-                        break;
-                    case 'rectangle':
-                        resolve('rectangle');
-                        break;
-                    default:
-                        resolve('stroke');
-                }
-            }
-        });
 
-        socket.once('disconnect', () =>
-            reject('Disconnected before receiving a response.')
-        );
-        socket.once('connect_error', (err) =>
-            reject(`Connection error: ${err.message}`)
+                if (response.error) {
+                    console.error('Error classifying strokes:', response.error);
+                    return strokes.map((): PossibleShape => 'stroke');
+                }
+                return response.results.map(toPossibleShape);
+            },
+            (err) =>
+                Promise.reject(`No response to the classification: ${err}`)
         );
-    });
 }
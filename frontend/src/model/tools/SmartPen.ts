@@ -1,3 +1,4 @@
+import { beginStroke, streamPoint } from '../../api/ClassifierAPI';
 import { Point } from '../../primitives/Point';
 import BoardTool from '../BoardTool';
 
@@ -6,9 +7,9 @@ export default class SmartPen extends BoardTool {
 
     onLeftMouseDown(event: MouseEvent): void {
         this.isDrawing = true;
-        this.whiteboardState.startStroke(
-            new Point(event.offsetX, event.offsetY)
-        );
+        const point = new Point(event.offsetX, event.offsetY);
+        this.whiteboardState.startStroke(point);
+        beginStroke(point);
     }
     onLeftMouseUp(event: MouseEvent): void {
         this.isDrawing = false;
@@ -24,8 +25,8 @@ export default class SmartPen extends BoardTool {
         if (!this.isDrawing) {
             return;
         }
-        this.whiteboardState.addPointToCurrentStroke(
-            new Point(event.offsetX, event.offsetY)
-        );
+        const point = new Point(event.offsetX, event.offsetY);
+        this.whiteboardState.addPointToCurrentStroke(point);
+        streamPoint(point);
     }
 }